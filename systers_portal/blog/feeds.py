@@ -0,0 +1,158 @@
+import datetime
+
+from django.contrib.syndication.views import Feed
+from django.core.cache import cache
+from django.core.urlresolvers import reverse
+from django.shortcuts import get_object_or_404
+from django.utils import timezone
+from django.utils.feedgenerator import Atom1Feed
+
+from blog.models import News, Resource, Tag
+from common.cache import bump_versions, get_version
+from community.models import Community
+
+
+FEED_VERSION_KEY = "blog:feeds:{0}:version"
+FEED_MODIFIED_KEY = "blog:feeds:{0}:modified"
+
+
+def get_feed_version(community_id):
+    """Get the current version of the feeds of a community
+
+    :param community_id: integer Community id
+    :return: integer version
+    """
+    return get_version(FEED_VERSION_KEY.format(community_id))
+
+
+def get_feed_modified(community_id):
+    """Get the time of the latest change of the feeds of a community. Unlike
+    the modification dates of posts, it accounts for deletions and is precise
+    to the second.
+
+    :param community_id: integer Community id
+    :return: datetime object
+    """
+    key = FEED_MODIFIED_KEY.format(community_id)
+    modified = cache.get(key)
+    if modified is None:
+        # unknown, so assume the feeds just changed
+        cache.add(key, timezone.now().replace(microsecond=0), None)
+        modified = cache.get(key)
+    return modified
+
+
+def invalidate_feeds(community_ids):
+    """Invalidate the cached feeds of communities by bumping their versions,
+    stale feeds are left to expire
+
+    :param community_ids: iterable of integer Community ids
+    """
+    now = timezone.now().replace(microsecond=0)
+    community_ids = set(community_ids) - set([None])
+    for community_id in community_ids:
+        cache.set(FEED_MODIFIED_KEY.format(community_id), now, None)
+    bump_versions(FEED_VERSION_KEY.format(community_id)
+                  for community_id in community_ids)
+
+
+class CommunityPostFeed(Feed):
+    """Base RSS feed of the latest public posts of a community, optionally
+    restricted to a tag"""
+    model = None
+    list_url_name = None
+    items_count = 20
+
+    def get_object(self, request, slug, tag=None):
+        community = get_object_or_404(Community, slug=slug)
+        if tag is not None:
+            community.feed_tag = get_object_or_404(Tag, pk=tag)
+        return community
+
+    def title(self, community):
+        title = u"{0} of {1}".format(
+            self.model._meta.verbose_name_plural.title(), community)
+        tag = getattr(community, 'feed_tag', None)
+        if tag is not None:
+            title = u"{0} tagged {1}".format(title, tag)
+        return title
+
+    def link(self, community):
+        return reverse(self.list_url_name, kwargs={'slug': community.slug})
+
+    def description(self, community):
+        return u"Latest {0} of {1}".format(
+            self.model._meta.verbose_name_plural, community)
+
+    def subtitle(self, community):
+        return self.description(community)
+
+    def items(self, community):
+        posts = self.model.objects.filter(community=community, is_public=True)
+        tag = getattr(community, 'feed_tag', None)
+        if tag is not None:
+            posts = posts.filter(tags=tag)
+        return posts.select_related('author__user', 'community').order_by(
+            '-date_created', '-id')[:self.items_count]
+
+    def item_title(self, post):
+        return post.title
+
+    def item_description(self, post):
+        return post.content
+
+    def item_link(self, post):
+        return "{0}#post-{1}".format(self.link(post.community), post.pk)
+
+    def item_author_name(self, post):
+        return unicode(post.author)
+
+    def item_pubdate(self, post):
+        return datetime.datetime.combine(post.date_created, datetime.time())
+
+
+class NewsFeed(CommunityPostFeed):
+    model = News
+    list_url_name = 'view_community_news_list'
+
+
+class NewsAtomFeed(NewsFeed):
+    feed_type = Atom1Feed
+
+
+class ResourceFeed(CommunityPostFeed):
+    model = Resource
+    list_url_name = 'view_community_resource_list'
+
+
+class ResourceAtomFeed(ResourceFeed):
+    feed_type = Atom1Feed
+
+
+def invalidate_post_feeds(sender, instance, **kwargs):
+    """Invalidate the feeds of the communities of a saved or deleted post"""
+    invalidate_feeds([instance.community_id,
+                      instance.get_original_value('community_id')])
+
+
+def invalidate_tagged_post_feeds(sender, instance, action, reverse, model,
+                                 pk_set, **kwargs):
+    """Invalidate the feeds of the communities of posts whose tags changed,
+    from either side of the relation"""
+    if not reverse:
+        if action in ("post_add", "post_remove", "post_clear"):
+            invalidate_feeds([instance.community_id])
+    elif action == "pre_clear":
+        # the cleared posts can't be looked up once the rows are gone
+        instance._feed_community_ids = list(model.objects.filter(
+            tags=instance).values_list('community_id', flat=True))
+    elif action == "post_clear":
+        invalidate_feeds(getattr(instance, '_feed_community_ids', []))
+    elif action in ("post_add", "post_remove") and pk_set:
+        invalidate_feeds(model.objects.filter(pk__in=pk_set).values_list(
+            'community_id', flat=True))
+
+
+def invalidate_community_feeds(sender, instance, **kwargs):
+    """Invalidate the feeds of a saved community, whose name is in them"""
+    invalidate_feeds([instance.pk])
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from blog.models import TagUsage
+from blog.tags import recount_tag_usage
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the usage counts of tags in communities from the posts'
+
+    def handle(self, *args, **options):
+        recount_tag_usage()
+        communities = TagUsage.objects.values('community').distinct()
+        self.stdout.write("Counted the usage of tags in {0} "
+                          "communities".format(communities.count()))
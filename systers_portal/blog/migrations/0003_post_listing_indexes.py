@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0002_auto_20140928_2034'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='news',
+            index_together=set([('community', 'is_public', 'date_created', 'id')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='resource',
+            index_together=set([('community', 'is_public', 'date_created', 'id')]),
+        ),
+    ]
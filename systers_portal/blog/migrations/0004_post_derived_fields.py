@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0003_post_listing_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='news',
+            name='excerpt',
+            field=models.TextField(default=b'', verbose_name=b'Excerpt', editable=False, blank=True),
+            preserve_default=True,
+        ),
+        migrations.AddField(
+            model_name='news',
+            name='first_image',
+            field=models.CharField(default=b'', verbose_name=b'First image', max_length=500, editable=False, blank=True),
+            preserve_default=True,
+        ),
+        migrations.AddField(
+            model_name='news',
+            name='reading_time',
+            field=models.PositiveIntegerField(default=0, verbose_name=b'Reading time in minutes', editable=False),
+            preserve_default=True,
+        ),
+        migrations.AddField(
+            model_name='resource',
+            name='excerpt',
+            field=models.TextField(default=b'', verbose_name=b'Excerpt', editable=False, blank=True),
+            preserve_default=True,
+        ),
+        migrations.AddField(
+            model_name='resource',
+            name='first_image',
+            field=models.CharField(default=b'', verbose_name=b'First image', max_length=500, editable=False, blank=True),
+            preserve_default=True,
+        ),
+        migrations.AddField(
+            model_name='resource',
+            name='reading_time',
+            field=models.PositiveIntegerField(default=0, verbose_name=b'Reading time in minutes', editable=False),
+            preserve_default=True,
+        ),
+    ]
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+def merge_duplicate_names(apps, schema_editor):
+    """Normalize tag and resource type names, merging the objects whose names
+    are normalized alike into the oldest one"""
+    Tag = apps.get_model('blog', 'Tag')
+    ResourceType = apps.get_model('blog', 'ResourceType')
+    News = apps.get_model('blog', 'News')
+    Resource = apps.get_model('blog', 'Resource')
+    for model in (Tag, ResourceType):
+        kept = {}
+        duplicates = {}
+        for obj in model.objects.order_by('pk'):
+            obj.name = " ".join(obj.name.split())
+            obj.normalized_name = obj.name.lower()
+            keep = kept.setdefault(obj.normalized_name, obj)
+            if keep is obj:
+                obj.save()
+            else:
+                duplicates[obj.pk] = keep.pk
+        if not duplicates:
+            continue
+        if model is Tag:
+            for post_model in (News, Resource):
+                posts = post_model.objects.filter(
+                    tags__in=duplicates.keys()).distinct()
+                for post in posts:
+                    tag_ids = set(post.tags.values_list('pk', flat=True))
+                    removed = tag_ids.intersection(duplicates)
+                    post.tags.remove(*removed)
+                    post.tags.add(*(set(duplicates[pk] for pk in removed) -
+                                    tag_ids))
+        else:
+            for pk, keep_pk in duplicates.items():
+                Resource.objects.filter(resource_type=pk).update(
+                    resource_type=keep_pk)
+        model.objects.filter(pk__in=duplicates.keys()).delete()
+
+
+def keep_merged_names(apps, schema_editor):
+    """Leave the names as they are, merged objects can't be told apart again
+    and normalized names are dropped along with their fields"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0004_post_derived_fields'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='resourcetype',
+            name='normalized_name',
+            field=models.CharField(max_length=255, null=True, editable=False),
+            preserve_default=True,
+        ),
+        migrations.AddField(
+            model_name='tag',
+            name='normalized_name',
+            field=models.CharField(max_length=255, null=True, editable=False),
+            preserve_default=True,
+        ),
+        migrations.RunPython(merge_duplicate_names, keep_merged_names),
+    ]
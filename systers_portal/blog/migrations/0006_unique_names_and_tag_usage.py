@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('community', '0011_communitypage_derived_fields'),
+        ('blog', '0005_normalize_names'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='resourcetype',
+            name='normalized_name',
+            field=models.CharField(unique=True, max_length=255, editable=False),
+        ),
+        migrations.AlterField(
+            model_name='tag',
+            name='normalized_name',
+            field=models.CharField(unique=True, max_length=255, editable=False),
+        ),
+        migrations.RunSQL(
+            "CREATE INDEX blog_tag_normalized_name_like ON blog_tag "
+            "(normalized_name varchar_pattern_ops)",
+            "DROP INDEX blog_tag_normalized_name_like"),
+        migrations.RunSQL(
+            "CREATE INDEX blog_resourcetype_normalized_name_like ON "
+            "blog_resourcetype (normalized_name varchar_pattern_ops)",
+            "DROP INDEX blog_resourcetype_normalized_name_like"),
+        migrations.CreateModel(
+            name='TagUsage',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('count', models.PositiveIntegerField(default=0, verbose_name=b'Count')),
+                ('community', models.ForeignKey(verbose_name=b'Community', to='community.Community')),
+                ('tag', models.ForeignKey(verbose_name=b'Tag', to='blog.Tag')),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+        migrations.AlterUniqueTogether(
+            name='tagusage',
+            unique_together=set([('community', 'tag')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='tagusage',
+            index_together=set([('community', 'count')]),
+        ),
+        migrations.RunSQL(
+            "INSERT INTO blog_tagusage (community_id, tag_id, count) "
+            "SELECT community_id, tag_id, COUNT(*) FROM ("
+            "SELECT p.community_id, t.tag_id FROM blog_news_tags t "
+            "JOIN blog_news p ON p.id = t.news_id UNION ALL "
+            "SELECT p.community_id, t.tag_id FROM blog_resource_tags t "
+            "JOIN blog_resource p ON p.id = t.resource_id) tags "
+            "GROUP BY community_id, tag_id",
+            "DELETE FROM blog_tagusage"),
+    ]
@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+COUNT_TAG_USAGE = (
+    "DELETE FROM blog_tagusage; "
+    "INSERT INTO blog_tagusage (community_id, tag_id, count) "
+    "SELECT community_id, tag_id, COUNT(*) FROM ("
+    "SELECT p.community_id, t.tag_id FROM blog_news_tags t "
+    "JOIN blog_news p ON p.id = t.news_id{0} UNION ALL "
+    "SELECT p.community_id, t.tag_id FROM blog_resource_tags t "
+    "JOIN blog_resource p ON p.id = t.resource_id{0}) tags "
+    "GROUP BY community_id, tag_id")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0006_unique_names_and_tag_usage'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            COUNT_TAG_USAGE.format(" WHERE p.is_public"),
+            COUNT_TAG_USAGE.format("")),
+    ]
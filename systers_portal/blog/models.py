@@ -1,26 +1,123 @@
+from django.core.exceptions import ValidationError
 from django.db import models
 
-from common.models import Post
+from common.models import DirtyFieldsMixin, Post
+from common.pagination import keyset_paginate
 from community.models import Community
 
 
-class Tag(models.Model):
-    """Model to represent the tags a resource can have"""
+def normalize_name(name):
+    """Normalize a tag or resource type name, so that names differing only by
+    case or whitespace are the same
+
+    :param name: string name
+    :return: unicode normalized name
+    """
+    return u" ".join(name.split()).lower()
+
+
+class NameQuerySet(models.QuerySet):
+    """QuerySet of objects with unique normalized names"""
+    def autocomplete(self, prefix, limit=10):
+        """Get the objects whose names start with a prefix, served by the
+        pattern index of the normalized names
+
+        :param prefix: string name prefix, matched case insensitively
+        :param limit: integer maximum number of objects
+        :return: QuerySet of objects ordered by name
+        """
+        return self.filter(
+            normalized_name__startswith=normalize_name(prefix)).order_by(
+            'normalized_name')[:limit]
+
+
+class UniqueNameModel(models.Model):
+    """Abstract base class for objects identified by their normalized name"""
     name = models.CharField(max_length=255)
+    normalized_name = models.CharField(max_length=255, unique=True,
+                                       editable=False)
+
+    objects = NameQuerySet.as_manager()
+
+    class Meta:
+        abstract = True
 
     def __unicode__(self):
         return self.name
 
+    def clean(self):
+        """Forbid names normalized like the name of another object"""
+        duplicates = type(self).objects.filter(
+            normalized_name=normalize_name(self.name)).exclude(pk=self.pk)
+        if duplicates.exists():
+            raise ValidationError("{0} with this name already exists.".format(
+                self._meta.verbose_name.capitalize()))
+
+    def save(self, *args, **kwargs):
+        self.name = u" ".join(self.name.split())
+        self.normalized_name = normalize_name(self.name)
+        super(UniqueNameModel, self).save(*args, **kwargs)
+
+
+class Tag(UniqueNameModel):
+    """Model to represent the tags a resource can have"""
+
 
-class ResourceType(models.Model):
+class ResourceType(UniqueNameModel):
     """Model to represent the types a resource can have"""
-    name = models.CharField(max_length=255)
+
+
+class TagUsageQuerySet(models.QuerySet):
+    def get_cloud(self, community, limit=50):
+        """Get the most used tags of a community, served by the
+        (community, count) index
+
+        :param community: Community object or id
+        :param limit: integer maximum number of tags
+        :return: QuerySet of TagUsage objects with their tag, most used first
+        """
+        return self.filter(community=community).select_related(
+            'tag').order_by('-count', 'tag__normalized_name')[:limit]
+
+
+class TagUsage(models.Model):
+    """Number of public posts of a community having a tag, maintained by
+    signal handlers"""
+    community = models.ForeignKey(Community, verbose_name="Community")
+    tag = models.ForeignKey(Tag, verbose_name="Tag")
+    count = models.PositiveIntegerField(default=0, verbose_name="Count")
+
+    objects = TagUsageQuerySet.as_manager()
+
+    class Meta:
+        unique_together = ('community', 'tag')
+        index_together = [['community', 'count']]
 
     def __unicode__(self):
-        return self.name
+        return "{0} in {1}: {2}".format(self.tag, self.community, self.count)
+
+
+class PostQuerySet(models.QuerySet):
+    def get_listing(self, community, cursor=None, per_page=20):
+        """Get a page of the public posts of a community, newest first, with
+        their authors and community but without their content. Served by the
+        (community, is_public, date_created, id) index, whatever the page.
+
+        :param community: Community object or id
+        :param cursor: string cursor of the previous page, None for the first
+                       page
+        :param per_page: integer maximum number of posts on the page
+        :return: KeysetPage object
+        :raises ValueError: if the cursor is malformed
+        """
+        queryset = self.filter(community=community, is_public=True)
+        queryset = queryset.select_related('author__user',
+                                           'community').defer('content')
+        return keyset_paginate(queryset, ('-date_created', '-id'), cursor,
+                               per_page)
 
 
-class News(Post):
+class News(DirtyFieldsMixin, Post):
     """Model to represent community news in resource area"""
     community = models.ForeignKey(Community, verbose_name="Community")
     is_public = models.BooleanField(default=True, verbose_name="Is public")
@@ -28,15 +125,19 @@ class News(Post):
                                        verbose_name="Is monitored")
     tags = models.ManyToManyField(Tag, blank=True, null=True,
                                   verbose_name="Tags")
+    tracked_fields = ('community_id', 'is_public')
+
+    objects = PostQuerySet.as_manager()
 
     class Meta:
         verbose_name_plural = "News"
+        index_together = [['community', 'is_public', 'date_created', 'id']]
 
     def __unicode__(self):
         return "{0} of {1} Community".format(self.title, self.community.name)
 
 
-class Resource(Post):
+class Resource(DirtyFieldsMixin, Post):
     """Model to represent community resource in resource area"""
     community = models.ForeignKey(Community, verbose_name="Community")
     is_public = models.BooleanField(default=True, verbose_name="Is public")
@@ -46,6 +147,12 @@ class Resource(Post):
                                   verbose_name="Tags")
     resource_type = models.ForeignKey(ResourceType, blank=True, null=True,
                                       verbose_name="Resource type")
+    tracked_fields = ('community_id', 'is_public')
+
+    objects = PostQuerySet.as_manager()
+
+    class Meta:
+        index_together = [['community', 'is_public', 'date_created', 'id']]
 
     def __unicode__(self):
         return "{0} of {1} Community".format(self.title, self.community.name)
@@ -0,0 +1,48 @@
+from django.db.models.signals import (post_save, pre_delete, post_delete,
+                                      m2m_changed)
+
+from blog.feeds import (invalidate_post_feeds, invalidate_tagged_post_feeds,
+                        invalidate_community_feeds)
+from blog.models import News, Resource
+from blog.tags import (count_tags_on_change, count_tags_on_save,
+                       count_tags_on_delete)
+from common.search import update_search_document, remove_search_document
+from community.models import Community
+from community.signals import count_content_on_save, count_content_on_delete
+
+
+for model in (News, Resource):
+    post_save.connect(count_content_on_save, sender=model,
+                      dispatch_uid="count_{0}_save".format(
+                          model._meta.model_name))
+    post_delete.connect(count_content_on_delete, sender=model,
+                        dispatch_uid="count_{0}_delete".format(
+                            model._meta.model_name))
+    post_save.connect(update_search_document, sender=model,
+                      dispatch_uid="index_{0}_save".format(
+                          model._meta.model_name))
+    post_delete.connect(remove_search_document, sender=model,
+                        dispatch_uid="index_{0}_delete".format(
+                            model._meta.model_name))
+    post_save.connect(invalidate_post_feeds, sender=model,
+                      dispatch_uid="feeds_{0}_save".format(
+                          model._meta.model_name))
+    post_delete.connect(invalidate_post_feeds, sender=model,
+                        dispatch_uid="feeds_{0}_delete".format(
+                            model._meta.model_name))
+    m2m_changed.connect(invalidate_tagged_post_feeds,
+                        sender=model.tags.through,
+                        dispatch_uid="feeds_{0}_tags".format(
+                            model._meta.model_name))
+    m2m_changed.connect(count_tags_on_change, sender=model.tags.through,
+                        dispatch_uid="count_{0}_tags".format(
+                            model._meta.model_name))
+    post_save.connect(count_tags_on_save, sender=model,
+                      dispatch_uid="count_{0}_tags_save".format(
+                          model._meta.model_name))
+    pre_delete.connect(count_tags_on_delete, sender=model,
+                       dispatch_uid="count_{0}_tags_delete".format(
+                           model._meta.model_name))
+
+post_save.connect(invalidate_community_feeds, sender=Community,
+                  dispatch_uid="feeds_community_save")
@@ -0,0 +1,138 @@
+from collections import Counter
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F
+
+from blog.models import News, Resource, Tag, TagUsage
+
+
+# Models whose tags are counted in TagUsage
+tagged_models = (News, Resource)
+
+
+def _get_post_field(through):
+    """Get the name of the field of a tags through model pointing to posts"""
+    return [field.name for field in through._meta.fields
+            if field.rel is not None and field.rel.to is not Tag and
+            not field.primary_key][0]
+
+
+def get_tag_usage(through, **filters):
+    """Count the tag assignments of public posts of a tags through model by
+    community and tag. Private posts are left out, as the counts are shown
+    to anyone in tag clouds.
+
+    :param through: tags through model
+    :param filters: lookups filtering the through model rows
+    :return: Counter mapping (community id, tag id) to numbers of posts
+    """
+    post_field = _get_post_field(through)
+    filters["{0}__is_public".format(post_field)] = True
+    rows = through.objects.filter(**filters).values_list(
+        "{0}__community".format(post_field), 'tag_id').annotate(
+        count=Count('pk')).order_by()
+    return Counter(dict(((community_id, tag_id), count)
+                        for community_id, tag_id, count in rows))
+
+
+def update_tag_usage(deltas):
+    """Add to the usage counts of tags in communities
+
+    :param deltas: dict mapping (community id, tag id) to the integer
+                   numbers of posts to add, negative to subtract
+    """
+    for (community_id, tag_id), delta in deltas.items():
+        if not delta:
+            continue
+        usages = TagUsage.objects.filter(community_id=community_id,
+                                         tag_id=tag_id)
+        if delta < 0:
+            # counts reaching zero, or below after a drift, are deleted
+            # instead of breaking the positive count constraint
+            if not usages.filter(count__gt=-delta).update(
+                    count=F('count') + delta):
+                usages.delete()
+            continue
+        if usages.update(count=F('count') + delta):
+            continue
+        try:
+            with transaction.atomic():
+                TagUsage.objects.create(community_id=community_id,
+                                        tag_id=tag_id, count=delta)
+        except IntegrityError:
+            # created concurrently
+            usages.update(count=F('count') + delta)
+
+
+@transaction.atomic
+def recount_tag_usage(community_ids=None, tag_ids=None):
+    """Recount the usage of tags in communities from the posts
+
+    :param community_ids: list of integer Community ids, None for all
+    :param tag_ids: list of integer Tag ids, None for all
+    """
+    usages = TagUsage.objects.all()
+    counts = Counter()
+    for model in tagged_models:
+        through = model.tags.through
+        filters = {}
+        if community_ids is not None:
+            filters["{0}__community_id__in".format(
+                _get_post_field(through))] = community_ids
+        if tag_ids is not None:
+            filters['tag_id__in'] = tag_ids
+        counts.update(get_tag_usage(through, **filters))
+    if community_ids is not None:
+        usages = usages.filter(community_id__in=community_ids)
+    if tag_ids is not None:
+        usages = usages.filter(tag_id__in=tag_ids)
+    usages.delete()
+    TagUsage.objects.bulk_create([
+        TagUsage(community_id=community_id, tag_id=tag_id, count=count)
+        for (community_id, tag_id), count in counts.items() if count > 0])
+
+
+def count_tags_on_change(sender, instance, action, reverse, pk_set,
+                         **kwargs):
+    """Update tag usage when tags are added to or removed from posts, from
+    either side of the relation. Removed assignments are counted before they
+    are deleted, as pk_set also holds the ids of unassigned objects."""
+    post_field = _get_post_field(sender)
+    if reverse:
+        filters = {'tag': instance.pk}
+        other_field = post_field
+    else:
+        filters = {post_field: instance.pk}
+        other_field = 'tag'
+    if action in ("pre_remove", "post_add"):
+        if not pk_set:
+            return
+        filters["{0}__in".format(other_field)] = pk_set
+    if action in ("pre_remove", "pre_clear"):
+        instance._removed_tag_usage = get_tag_usage(sender, **filters)
+    elif action in ("post_remove", "post_clear"):
+        removed = instance.__dict__.pop('_removed_tag_usage', {})
+        update_tag_usage(dict((key, -count)
+                              for key, count in removed.items()))
+    elif action == "post_add":
+        update_tag_usage(get_tag_usage(sender, **filters))
+
+
+def count_tags_on_save(sender, instance, created, **kwargs):
+    """Recount tag usage of posts moved to another community, published or
+    made private"""
+    if not created and (instance.has_changed('community_id') or
+                        instance.has_changed('is_public')):
+        recount_tag_usage(
+            [instance.get_original_value('community_id'),
+             instance.community_id],
+            list(instance.tags.values_list('pk', flat=True)))
+
+
+def count_tags_on_delete(sender, instance, **kwargs):
+    """Update tag usage of deleted posts, whose tag assignments are deleted
+    without m2m_changed signals"""
+    through = sender.tags.through
+    removed = get_tag_usage(through,
+                            **{_get_post_field(through): instance.pk})
+    update_tag_usage(dict((key, -count) for key, count in removed.items()))
@@ -0,0 +1,324 @@
+import json
+from StringIO import StringIO
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.core.urlresolvers import reverse
+from django.db import IntegrityError, connection, transaction
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from blog.models import News, Resource, ResourceType, Tag, TagUsage
+from blog.tags import recount_tag_usage
+from common.pagination import encode_cursor
+from community.models import Community
+from users.models import SystersUser
+
+
+class PostListingTestCase(TestCase):
+    def setUp(self):
+        User.objects.create_user(username='foo', password='foobar')
+        self.systers_user = SystersUser.objects.get()
+        self.community = Community.objects.create(
+            name="Foo", slug="foo", order=1, community_admin=self.systers_user)
+        self.other = Community.objects.create(
+            name="Bar", slug="bar", order=2, community_admin=self.systers_user)
+
+    def create_news(self, count, community=None, is_public=True):
+        return [News.objects.create(
+            slug="news{0}".format(News.objects.count()),
+            title="News {0}".format(i), content="Hi", is_public=is_public,
+            author=self.systers_user, community=community or self.community)
+            for i in range(count)]
+
+    def test_get_listing(self):
+        """Test keyset pagination of the public posts of a community"""
+        news = self.create_news(5)
+        self.create_news(2, is_public=False)
+        self.create_news(2, community=self.other)
+        with self.assertNumQueries(1):
+            page = News.objects.get_listing(self.community, per_page=3)
+            self.assertEqual([unicode(post) for post in page],
+                             [unicode(post) for post in news[:1:-1]])
+            self.assertEqual([post.author.user.username for post in page],
+                             ["foo"] * 3)
+        self.assertNotIn('content', page.object_list[0].__dict__)
+        page = News.objects.get_listing(self.community, page.next_cursor, 3)
+        self.assertEqual([post.pk for post in page],
+                         [post.pk for post in news[1::-1]])
+        self.assertFalse(page.has_next())
+        self.assertRaises(ValueError, Resource.objects.get_listing,
+                          self.community, "x")
+
+    def test_news_list_view(self):
+        """Test listing the news of a community"""
+        url = reverse('view_community_news_list', kwargs={'slug': 'foo'})
+        response = self.client.get(url)
+        self.assertContains(response, "Looks like there is no news yet.")
+        self.create_news(25)
+        response = self.client.get(url)
+        self.assertContains(response, "News 24<p class=\"text-muted\">Hi</p>")
+        self.assertNotContains(response, "News 4<")
+        response = self.client.get(url, {
+            'cursor': response.context['page'].next_cursor})
+        self.assertContains(response, "News 4<")
+        self.assertFalse(response.context['page'].has_next())
+        self.assertEqual(self.client.get(url, {'cursor': 'x'}).status_code,
+                         404)
+        for values in (["x", 1], ["2014-01-01T00:00:00", "x"], [[], 1]):
+            response = self.client.get(url, {'cursor': encode_cursor(values)})
+            self.assertEqual(response.status_code, 404)
+        url = reverse('view_community_resource_list',
+                      kwargs={'slug': 'baz'})
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+
+class FeedTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        User.objects.create_user(username='foo', password='foobar')
+        self.systers_user = SystersUser.objects.get()
+        self.community = Community.objects.create(
+            name="Foo", slug="foo", order=1, community_admin=self.systers_user)
+        self.news = News.objects.create(
+            slug="news", title="Hello news", content="Hi",
+            author=self.systers_user, community=self.community)
+        self.url = reverse('community_news_rss', kwargs={'slug': 'foo'})
+
+    def get_queries(self, url, **headers):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url, **headers)
+        return response, [query['sql'] for query in context.captured_queries
+                          if 'SAVEPOINT' not in query['sql']]
+
+    def test_feeds(self):
+        """Test the RSS and Atom feeds of news and resources"""
+        News.objects.create(slug="private", title="Hidden news",
+                            content="Hi", is_public=False,
+                            author=self.systers_user, community=self.community)
+        response = self.client.get(self.url)
+        self.assertEqual(response['Content-Type'],
+                         "application/rss+xml; charset=utf-8")
+        self.assertContains(response, "Hello news")
+        self.assertContains(response, "/community/foo/news/#post-{0}".format(
+            self.news.pk))
+        self.assertNotContains(response, "Hidden news")
+        response = self.client.get(reverse('community_news_atom',
+                                           kwargs={'slug': 'foo'}))
+        self.assertEqual(response['Content-Type'],
+                         "application/atom+xml; charset=utf-8")
+        self.assertContains(response, "Hello news")
+        Resource.objects.create(slug="resource", title="Hello resource",
+                                content="Hi", author=self.systers_user,
+                                community=self.community)
+        response = self.client.get(reverse('community_resource_rss',
+                                           kwargs={'slug': 'foo'}))
+        self.assertContains(response, "Hello resource")
+        self.assertNotContains(response, "Hello news")
+        self.assertEqual(self.client.get(reverse(
+            'community_news_rss', kwargs={'slug': 'bar'})).status_code, 404)
+
+    def test_tag_feeds(self):
+        """Test the feeds of the news of a community with a tag"""
+        tag = Tag.objects.create(name="Tag")
+        url = reverse('community_news_tag_rss',
+                      kwargs={'slug': 'foo', 'tag': tag.pk})
+        self.assertNotContains(self.client.get(url), "Hello news")
+        self.news.tags.add(tag)
+        self.assertContains(self.client.get(url), "Hello news")
+        tag.news_set.clear()
+        self.assertNotContains(self.client.get(url), "Hello news")
+        tag.news_set.add(self.news)
+        self.assertContains(self.client.get(url), "Hello news")
+        self.assertEqual(self.client.get(reverse(
+            'community_news_tag_atom',
+            kwargs={'slug': 'foo', 'tag': tag.pk + 1})).status_code, 404)
+
+    def test_conditional_get(self):
+        """Test answering unchanged feeds without rendering them"""
+        response, queries = self.get_queries(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('ETag', response)
+        self.assertIn('Last-Modified', response)
+
+        response, queries = self.get_queries(
+            self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b"")
+        self.assertEqual(len(queries), 1)
+
+        response, queries = self.get_queries(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "Hello news")
+        self.assertEqual(len(queries), 1)
+
+        etag = response['ETag']
+        response = self.client.get(
+            self.url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+
+        self.news.title = "Changed news"
+        self.news.save()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "Changed news")
+        self.assertNotEqual(response['ETag'], etag)
+
+        etag = response['ETag']
+        self.news.delete()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertNotContains(response, "Changed news")
+
+
+class TagTestCase(TestCase):
+    def setUp(self):
+        User.objects.create_user(username='foo', password='foobar')
+        self.systers_user = SystersUser.objects.get()
+        self.community = Community.objects.create(
+            name="Foo", slug="foo", order=1, community_admin=self.systers_user)
+        self.other = Community.objects.create(
+            name="Bar", slug="bar", order=2, community_admin=self.systers_user)
+
+    def create_post(self, model, community, slug):
+        return model.objects.create(
+            slug=slug, title="Post", content="Hi", author=self.systers_user,
+            community=community)
+
+    def get_usage(self):
+        return dict(((usage.community_id, usage.tag_id), usage.count)
+                    for usage in TagUsage.objects.all())
+
+    def test_unique_names(self):
+        """Test tag and resource type names are normalized and unique"""
+        tag = Tag.objects.create(name="  Web   Dev ")
+        self.assertEqual(tag.name, "Web Dev")
+        self.assertEqual(tag.normalized_name, "web dev")
+        with transaction.atomic():
+            self.assertRaises(IntegrityError, Tag.objects.create,
+                              name="web dev")
+        self.assertRaises(ValidationError, Tag(name="WEB DEV").clean)
+        tag.clean()
+        ResourceType.objects.create(name="Book")
+        self.assertRaises(ValidationError, ResourceType(name="book ").clean)
+
+    def test_autocomplete(self):
+        """Test tag prefix autocompletion"""
+        for name in ("Python", "Pyramid", "Django", "py"):
+            Tag.objects.create(name=name)
+        with self.assertNumQueries(1):
+            self.assertEqual([tag.name for tag in
+                              Tag.objects.autocomplete(" PY")],
+                             ["py", "Pyramid", "Python"])
+        self.assertEqual(len(Tag.objects.autocomplete("py", limit=2)), 2)
+        url = reverse('tag_autocomplete')
+        response = self.client.get(url, {'q': "pyt"})
+        self.assertEqual(json.loads(response.content.decode('utf-8')),
+                         {'tags': [{'id': Tag.objects.get(name="Python").pk,
+                                    'name': "Python"}]})
+        response = self.client.get(url)
+        self.assertEqual(json.loads(response.content.decode('utf-8')),
+                         {'tags': []})
+
+    def test_tag_usage(self):
+        """Test tag usage counts follow tags, posts and communities changes"""
+        python, django = (Tag.objects.create(name="Python"),
+                          Tag.objects.create(name="Django"))
+        news = self.create_post(News, self.community, "news")
+        resource = self.create_post(Resource, self.community, "resource")
+        other = self.create_post(News, self.other, "other")
+        foo, bar = self.community.pk, self.other.pk
+
+        news.tags.add(python, django)
+        resource.tags.add(python)
+        python.news_set.add(other)
+        self.assertEqual(self.get_usage(), {(foo, python.pk): 2,
+                                            (foo, django.pk): 1,
+                                            (bar, python.pk): 1})
+        news.tags.add(python)
+        news.tags.remove(python)
+        resource.tags.remove(django)
+        self.assertEqual(self.get_usage(), {(foo, python.pk): 1,
+                                            (foo, django.pk): 1,
+                                            (bar, python.pk): 1})
+        python.news_set.clear()
+        django.news_set.remove(news)
+        self.assertEqual(self.get_usage(), {(foo, python.pk): 1})
+        self.assertEqual([usage.tag for usage in
+                          TagUsage.objects.get_cloud(foo)], [python])
+
+        news.tags.add(python, django)
+        news.community = self.other
+        news.save()
+        self.assertEqual(self.get_usage(), {(foo, python.pk): 1,
+                                            (bar, python.pk): 1,
+                                            (bar, django.pk): 1})
+        news.community = self.community
+        news.save()
+        news.community = self.other
+        news.save()
+        self.assertEqual(self.get_usage(), {(foo, python.pk): 1,
+                                            (bar, python.pk): 1,
+                                            (bar, django.pk): 1})
+        news.tags.clear()
+        resource.delete()
+        self.assertEqual(self.get_usage(), {})
+
+        news.tags.add(python)
+        other.tags.add(python, django)
+        usage = self.get_usage()
+        TagUsage.objects.all().delete()
+        recount_tag_usage()
+        self.assertEqual(self.get_usage(), usage)
+        self.assertEqual(usage, {(bar, python.pk): 2, (bar, django.pk): 1})
+
+    def test_tag_usage_private_posts(self):
+        """Test tag usage counts only public posts"""
+        python, django = (Tag.objects.create(name="Python"),
+                          Tag.objects.create(name="Django"))
+        news = self.create_post(News, self.community, "news")
+        resource = self.create_post(Resource, self.community, "resource")
+        foo = self.community.pk
+        news.is_public = False
+        news.save()
+        news.tags.add(python, django)
+        resource.tags.add(python)
+        self.assertEqual(self.get_usage(), {(foo, python.pk): 1})
+
+        news.is_public = True
+        news.save()
+        self.assertEqual(self.get_usage(), {(foo, python.pk): 2,
+                                            (foo, django.pk): 1})
+        resource.is_public = False
+        resource.save()
+        self.assertEqual(self.get_usage(), {(foo, python.pk): 1,
+                                            (foo, django.pk): 1})
+        resource.tags.remove(python)
+        news.is_public = False
+        news.save()
+        self.assertEqual(self.get_usage(), {})
+        news.delete()
+        recount_tag_usage()
+        self.assertEqual(self.get_usage(), {})
+
+    def test_tag_usage_drift(self):
+        """Test drifted tag usage counts never go negative"""
+        python = Tag.objects.create(name="Python")
+        for slug in ("foo", "bar", "baz"):
+            self.create_post(News, self.community, slug).tags.add(python)
+        TagUsage.objects.update(count=2)
+        News.objects.get(slug="foo").tags.remove(python)
+        self.assertEqual(self.get_usage(), {(self.community.pk, python.pk): 1})
+        python.news_set.clear()
+        self.assertEqual(self.get_usage(), {})
+
+    def test_recount_tag_usage_command(self):
+        """Test recount_tag_usage management command"""
+        tag = Tag.objects.create(name="Python")
+        self.create_post(News, self.community, "news").tags.add(tag)
+        TagUsage.objects.update(count=5)
+        stdout = StringIO()
+        call_command('recount_tag_usage', stdout=stdout)
+        self.assertIn("in 1 communities", stdout.getvalue())
+        self.assertEqual(TagUsage.objects.get().count, 1)
@@ -0,0 +1,33 @@
+from django.conf.urls import url
+
+from blog.feeds import NewsFeed, NewsAtomFeed, ResourceFeed, ResourceAtomFeed
+from blog.views import (CommunityNewsListView, CommunityResourceListView,
+                        TagAutocompleteView, community_feed_view)
+
+
+urlpatterns = [
+    url(r'^tags/autocomplete/$', TagAutocompleteView.as_view(),
+        name='tag_autocomplete'),
+    url(r'^(?P<slug>[\w-]+)/news/$', CommunityNewsListView.as_view(),
+        name='view_community_news_list'),
+    url(r'^(?P<slug>[\w-]+)/news/rss/$', community_feed_view(NewsFeed),
+        name='community_news_rss'),
+    url(r'^(?P<slug>[\w-]+)/news/atom/$', community_feed_view(NewsAtomFeed),
+        name='community_news_atom'),
+    url(r'^(?P<slug>[\w-]+)/news/tag/(?P<tag>\d+)/rss/$',
+        community_feed_view(NewsFeed), name='community_news_tag_rss'),
+    url(r'^(?P<slug>[\w-]+)/news/tag/(?P<tag>\d+)/atom/$',
+        community_feed_view(NewsAtomFeed), name='community_news_tag_atom'),
+    url(r'^(?P<slug>[\w-]+)/resources/$',
+        CommunityResourceListView.as_view(),
+        name='view_community_resource_list'),
+    url(r'^(?P<slug>[\w-]+)/resources/rss/$',
+        community_feed_view(ResourceFeed), name='community_resource_rss'),
+    url(r'^(?P<slug>[\w-]+)/resources/atom/$',
+        community_feed_view(ResourceAtomFeed), name='community_resource_atom'),
+    url(r'^(?P<slug>[\w-]+)/resources/tag/(?P<tag>\d+)/rss/$',
+        community_feed_view(ResourceFeed), name='community_resource_tag_rss'),
+    url(r'^(?P<slug>[\w-]+)/resources/tag/(?P<tag>\d+)/atom/$',
+        community_feed_view(ResourceAtomFeed),
+        name='community_resource_tag_atom'),
+]
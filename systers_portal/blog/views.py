@@ -0,0 +1,97 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.http import Http404, JsonResponse
+from django.shortcuts import get_object_or_404
+from django.views.decorators.http import condition
+from django.views.generic import TemplateView, View
+
+from blog.feeds import get_feed_version, get_feed_modified
+from blog.models import News, Resource, Tag
+from community.models import Community
+
+
+FEED_KEY = "blog:feeds:{0}:{1}:{2}:{3}"
+
+
+class CommunityPostListView(TemplateView):
+    """Base view listing the public posts of a community page by page"""
+    model = None
+    paginate_by = 20
+
+    def get_context_data(self, **kwargs):
+        context = super(CommunityPostListView, self).get_context_data(
+            **kwargs)
+        community = get_object_or_404(Community, slug=context['slug'])
+        try:
+            page = self.model.objects.get_listing(
+                community, self.request.GET.get('cursor'), self.paginate_by)
+        except ValueError:
+            raise Http404
+        context['community'] = community
+        context['page'] = page
+        return context
+
+
+class CommunityNewsListView(CommunityPostListView):
+    """Community news list view"""
+    model = News
+    template_name = "blog/news_list.html"
+
+
+class CommunityResourceListView(CommunityPostListView):
+    """Community resources list view"""
+    model = Resource
+    template_name = "blog/resource_list.html"
+
+
+def community_feed_view(feed_class):
+    """Build a view serving a community feed with conditional GET support.
+    The ETag and Last-Modified change with every change of the community
+    content and are read from the cache without querying the posts.
+    Unchanged feeds get a 304 Not Modified
+    response without rendering, rendered feeds are cached until the next
+    content change.
+
+    :param feed_class: CommunityPostFeed subclass
+    :return: view function
+    """
+    feed = feed_class()
+
+    def get_feed_state(request, slug, tag=None):
+        if not hasattr(request, '_feed_state'):
+            community_id = get_object_or_404(
+                Community.objects.values_list('pk', flat=True), slug=slug)
+            key = FEED_KEY.format(feed_class.__name__, community_id,
+                                  tag or "", get_feed_version(community_id))
+            # set on every change of the posts, unlike their modification
+            # dates which are days and miss deletions
+            request._feed_state = (key, get_feed_modified(community_id))
+        return request._feed_state
+
+    def get_etag(request, slug, tag=None):
+        return get_feed_state(request, slug, tag)[0]
+
+    def get_last_modified(request, slug, tag=None):
+        return get_feed_state(request, slug, tag)[1]
+
+    @condition(etag_func=get_etag, last_modified_func=get_last_modified)
+    def view(request, slug, tag=None):
+        key = get_feed_state(request, slug, tag)[0]
+        response = cache.get(key)
+        if response is None:
+            response = feed(request, slug=slug, tag=tag)
+            # set from the publication dates, which miss later changes
+            del response['Last-Modified']
+            cache.set(key, response, settings.FEED_CACHE_TIMEOUT)
+        return response
+
+    return view
+
+
+class TagAutocompleteView(View):
+    """JSON list of the tags whose names start with the q parameter"""
+    def get(self, request, *args, **kwargs):
+        prefix = request.GET.get('q', "")
+        tags = Tag.objects.autocomplete(prefix) if prefix.strip() else []
+        return JsonResponse({'tags': [{'id': tag.pk, 'name': tag.name}
+                                      for tag in tags]})
@@ -0,0 +1,10 @@
+from django.apps import AppConfig
+
+from common.metadata import build_field_tables
+
+
+class CommonConfig(AppConfig):
+    name = 'common'
+
+    def ready(self):
+        build_field_tables()
@@ -0,0 +1,49 @@
+import time
+
+from django.core.cache import cache
+
+
+def get_version(key):
+    """Get the current version of cached entries, stored under a key
+
+    :param key: string cache key of the version
+    :return: integer version
+    """
+    version = cache.get(key)
+    if version is None:
+        # start from a timestamp, so an evicted version never brings back
+        # entries cached under a previous one
+        cache.add(key, int(time.time() * 1000), None)
+        version = cache.get(key)
+    return version
+
+
+def get_versions(keys):
+    """Get the current versions of several kinds of cached entries, reading
+    the known versions with a single cache lookup
+
+    :param keys: iterable of string cache keys of the versions
+    :return: dict mapping keys to integer versions
+    """
+    keys = set(keys)
+    versions = cache.get_many(keys) if keys else {}
+    for key in keys.difference(versions):
+        versions[key] = get_version(key)
+    return versions
+
+
+def bump_versions(keys):
+    """Invalidate cached entries by bumping their versions, stale entries are
+    left to expire. Versions are set again without timeout, as incrementing
+    them resets the timeout on some backends, e.g. the database cache.
+
+    :param keys: iterable of string cache keys of the versions
+    """
+    keys = set(keys)
+    if not keys:
+        return
+    # keys without a version have nothing cached
+    versions = cache.get_many(keys)
+    if versions:
+        cache.set_many(dict((key, version + 1)
+                            for key, version in versions.items()), None)
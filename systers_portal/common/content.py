@@ -0,0 +1,92 @@
+import math
+import re
+from HTMLParser import HTMLParser
+
+from django.db import connection, transaction
+from django.utils.html import strip_tags
+from django.utils.text import Truncator
+
+
+# Number of words of post excerpts
+EXCERPT_WORDS = 50
+
+# Reading speed used to estimate the reading time of posts
+WORDS_PER_MINUTE = 200
+
+# Maximum length of the stored first image URL, longer URLs (e.g. data URIs)
+# are left out
+FIRST_IMAGE_MAX_LENGTH = 500
+
+# Fields derived from the content of posts
+derived_fields = ('excerpt', 'reading_time', 'first_image')
+
+image_re = re.compile(r'<img\b[^>]*?\bsrc\s*=\s*(["\'])(.*?)\1',
+                      re.IGNORECASE | re.DOTALL)
+
+
+def get_plain_text(html):
+    """Get the plain text of rich text content
+
+    :param html: string HTML content
+    :return: unicode content without HTML tags and entities
+    """
+    return HTMLParser().unescape(strip_tags(html))
+
+
+def get_first_image(html):
+    """Get the URL of the first image of rich text content
+
+    :param html: string HTML content
+    :return: unicode image URL, empty if there is no image with a short
+             enough URL
+    """
+    for match in image_re.finditer(html):
+        url = HTMLParser().unescape(match.group(2)).strip()
+        if url and len(url) <= FIRST_IMAGE_MAX_LENGTH and \
+                not url.startswith('data:'):
+            return url
+    return u""
+
+
+def get_derived_fields(html):
+    """Compute the fields derived from the content of a post, parsing it once
+
+    :param html: string HTML content
+    :return: dict mapping derived field names to their values
+    """
+    text = u" ".join(get_plain_text(html or u"").split())
+    words = len(text.split())
+    return {
+        'excerpt': Truncator(text).words(EXCERPT_WORDS),
+        'reading_time': int(math.ceil(float(words) / WORDS_PER_MINUTE)),
+        'first_image': get_first_image(html or u""),
+    }
+
+
+@transaction.atomic
+def update_derived_fields(model, posts):
+    """Recompute and store the derived fields of posts of a model with a
+    single UPDATE, without touching their modification dates
+
+    :param model: Post subclass
+    :param posts: list of saved Post objects with their content
+    """
+    if not posts:
+        return
+    qn = connection.ops.quote_name
+    table = qn(model._meta.db_table)
+    pk = qn(model._meta.pk.column)
+    params = []
+    for post in posts:
+        fields = get_derived_fields(post.content)
+        params.append(post.pk)
+        params.extend(fields[field] for field in derived_fields)
+    connection.cursor().execute(
+        "UPDATE {table} SET {assignments} FROM (VALUES {values}) AS "
+        "derived ({pk}, {columns}) WHERE {table}.{pk} = derived.{pk}".format(
+            table=table, pk=pk,
+            assignments=", ".join("{0} = derived.{0}".format(qn(field))
+                                  for field in derived_fields),
+            columns=", ".join(qn(field) for field in derived_fields),
+            values=", ".join(["(%s, %s, %s, %s)"] * len(posts))),
+        params)
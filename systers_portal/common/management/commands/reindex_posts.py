@@ -0,0 +1,33 @@
+from optparse import make_option
+
+from django.apps import apps
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.base import BaseCommand
+from django.utils.encoding import force_text
+
+from common.models import SearchDocument
+from common.pagination import iter_chunks
+from common.search import index_posts, searchable_models
+
+
+class Command(BaseCommand):
+    help = ('Rebuild the full text search documents of all posts, streaming '
+            'them in chunks, and delete the documents of missing posts')
+    option_list = BaseCommand.option_list + (
+        make_option('--chunk-size', type='int', default=500,
+                    help='Number of posts indexed per transaction'),
+    )
+
+    def handle(self, *args, **options):
+        for label in searchable_models:
+            model = apps.get_model(label)
+            count = 0
+            for chunk in iter_chunks(model.objects.all(),
+                                     options['chunk_size']):
+                index_posts(chunk)
+                count += len(chunk)
+            SearchDocument.objects.filter(
+                content_type=ContentType.objects.get_for_model(model)
+            ).exclude(object_id__in=model.objects.values('pk')).delete()
+            self.stdout.write("Indexed {0} {1}".format(
+                count, force_text(model._meta.verbose_name_plural)))
@@ -0,0 +1,30 @@
+from optparse import make_option
+
+from django.apps import apps
+from django.core.management.base import BaseCommand
+from django.utils.encoding import force_text
+
+from common.content import update_derived_fields
+from common.pagination import iter_chunks
+from common.search import searchable_models
+
+
+class Command(BaseCommand):
+    help = ('Recompute the excerpt, reading time and first image of all '
+            'posts from their content, streaming them in chunks')
+    option_list = BaseCommand.option_list + (
+        make_option('--chunk-size', type='int', default=500,
+                    help='Number of posts updated per query'),
+    )
+
+    def handle(self, *args, **options):
+        # posts with derived fields are the searchable ones
+        for label in searchable_models:
+            model = apps.get_model(label)
+            count = 0
+            for chunk in iter_chunks(model.objects.only('content'),
+                                     options['chunk_size']):
+                update_derived_fields(model, chunk)
+                count += len(chunk)
+            self.stdout.write("Updated {0} {1}".format(
+                count, force_text(model._meta.verbose_name_plural)))
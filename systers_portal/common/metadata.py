@@ -0,0 +1,75 @@
+from collections import namedtuple
+
+from django.apps import apps
+from django.db.models.fields import FieldDoesNotExist
+
+
+# Metadata of a model field needed to render it
+FieldDescriptor = namedtuple('FieldDescriptor',
+                             ['name', 'attname', 'verbose_name'])
+
+# Per-model tables of field descriptors, keyed by model class
+_field_tables = {}
+
+
+def _build_field_table(model):
+    """Build the field descriptors of a model
+
+    :param model: model class
+    :return: tuple (tuple of FieldDescriptor of the concrete fields in
+             declaration order, dict mapping names of all the fields,
+             including many to many ones, to FieldDescriptor)
+    """
+    opts = model._meta
+    descriptors = tuple(
+        FieldDescriptor(field.name, field.attname, field.verbose_name)
+        for field in opts.fields)
+    by_name = dict((descriptor.name, descriptor) for descriptor in
+                   descriptors)
+    by_name.update(
+        (field.name, FieldDescriptor(field.name, field.attname,
+                                     field.verbose_name))
+        for field in opts.many_to_many)
+    return descriptors, by_name
+
+
+def build_field_tables():
+    """Build the field descriptor tables of all installed models, called once
+    when the apps are ready"""
+    _field_tables.clear()
+    for model in apps.get_models():
+        _field_tables[model] = _build_field_table(model)
+
+
+def _get_field_table(model):
+    model = model._meta.concrete_model
+    try:
+        return _field_tables[model]
+    except KeyError:
+        # models created after the apps got ready
+        table = _field_tables[model] = _build_field_table(model)
+        return table
+
+
+def get_field_descriptors(model):
+    """Get the descriptors of the concrete fields of a model
+
+    :param model: model class or instance
+    :return: tuple of FieldDescriptor in field declaration order
+    """
+    return _get_field_table(model)[0]
+
+
+def get_field_descriptor(model, field_name):
+    """Get the descriptor of a model field by name
+
+    :param model: model class or instance
+    :param field_name: string model field name
+    :return: FieldDescriptor
+    :raises FieldDoesNotExist: if model has no field_name field
+    """
+    try:
+        return _get_field_table(model)[1][field_name]
+    except KeyError:
+        raise FieldDoesNotExist("{0} has no field named {1!r}".format(
+            model._meta.object_name, field_name))
@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+import common.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('community', '0010_joinrequest_indexes'),
+        ('contenttypes', '0001_initial'),
+        ('common', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchDocument',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('object_id', models.PositiveIntegerField()),
+                ('is_public', models.BooleanField(default=True)),
+                ('document', common.models.SearchVectorField(null=True, editable=False)),
+                ('community', models.ForeignKey(to='community.Community')),
+                ('content_type', models.ForeignKey(to='contenttypes.ContentType')),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+        migrations.AlterUniqueTogether(
+            name='searchdocument',
+            unique_together=set([('content_type', 'object_id')]),
+        ),
+        migrations.RunSQL(
+            "CREATE INDEX common_searchdocument_document ON "
+            "common_searchdocument USING gin (document)",
+            "DROP INDEX common_searchdocument_document"),
+    ]
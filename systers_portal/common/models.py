@@ -1,11 +1,91 @@
+from collections import defaultdict
+
 from django.db import models
 from django.contrib.contenttypes.fields import GenericForeignKey
 from django.contrib.contenttypes.models import ContentType
 from ckeditor.fields import RichTextField
 
+from common.content import (FIRST_IMAGE_MAX_LENGTH, derived_fields,
+                            get_derived_fields)
+from common.pagination import keyset_paginate
 from users.models import SystersUser
 
 
+class DirtyFieldsMixin(object):
+    """Mixin to track changes of model fields made since the instance was
+    created, loaded from the database or last saved. Fields are listed by
+    attname in tracked_fields and their raw values are snapshotted, so
+    tracking foreign keys does not fetch the related objects. Deferred fields
+    are not tracked.
+
+    Original values are the values written by the previous save, so post_save
+    receivers see the changes made by the current one, which are still
+    reported once the save returned.
+    """
+    tracked_fields = ()
+
+    def __init__(self, *args, **kwargs):
+        super(DirtyFieldsMixin, self).__init__(*args, **kwargs)
+        self._saved_values = {}
+        self.snapshot_tracked_fields()
+        self._original_values = dict(self._saved_values)
+
+    def save(self, force_insert=False, force_update=False, using=None,
+             update_fields=None):
+        self._original_values = dict(self._saved_values)
+        super(DirtyFieldsMixin, self).save(force_insert, force_update, using,
+                                           update_fields)
+        if update_fields is None:
+            self.snapshot_tracked_fields()
+        else:
+            names = set(update_fields)
+            self.snapshot_tracked_fields([
+                field.attname for field in self._meta.concrete_fields
+                if field.name in names or field.attname in names])
+
+    def snapshot_tracked_fields(self, fields=None):
+        """Record the current values of tracked fields as saved values, the
+        original values of the next save
+
+        :param fields: list of field attnames to record, None for all
+        """
+        for field in self.tracked_fields:
+            # read from __dict__ to not load deferred fields
+            if (fields is None or field in fields) and \
+                    field in self.__dict__:
+                self._saved_values[field] = self.__dict__[field]
+
+    def get_original_value(self, field):
+        """Get the value a tracked field had when the instance was loaded or
+        previously saved
+
+        :param field: string tracked field attname
+        :return: original field value
+        """
+        if field not in self._original_values:
+            return getattr(self, field)
+        return self._original_values[field]
+
+    def has_changed(self, field):
+        """Check if a tracked field has a new value
+
+        :param field: string tracked field attname
+        :return: True if field value changed, False otherwise
+        """
+        if field not in self._original_values:
+            return False
+        return getattr(self, field) != self._original_values[field]
+
+    def get_dirty_fields(self):
+        """Get the tracked fields with new values
+
+        :return: dict mapping field attnames to their original values
+        """
+        return dict((field, value) for field, value in
+                    self._original_values.items()
+                    if getattr(self, field) != value)
+
+
 class Post(models.Model):
     """Abstract base class for postings like news and resources.
     This class can't be used in isolation.
@@ -18,10 +98,105 @@ class Post(models.Model):
                                      verbose_name="Date last modified")
     author = models.ForeignKey(SystersUser, verbose_name="Author")
     content = RichTextField(verbose_name="Content")
+    excerpt = models.TextField(blank=True, default="", editable=False,
+                               verbose_name="Excerpt")
+    reading_time = models.PositiveIntegerField(
+        default=0, editable=False, verbose_name="Reading time in minutes")
+    first_image = models.CharField(max_length=FIRST_IMAGE_MAX_LENGTH,
+                                   blank=True, default="", editable=False,
+                                   verbose_name="First image")
 
     class Meta:
         abstract = True
 
+    def save(self, force_insert=False, force_update=False, using=None,
+             update_fields=None):
+        """Save post along with the fields derived from its content, so that
+        reading them never requires parsing the content"""
+        if update_fields is None or 'content' in update_fields:
+            for field, value in get_derived_fields(self.content).items():
+                setattr(self, field, value)
+            if update_fields is not None:
+                update_fields = set(update_fields).union(
+                    derived_fields)
+        super(Post, self).save(force_insert, force_update, using,
+                               update_fields)
+
+
+class SearchVectorField(models.Field):
+    """PostgreSQL tsvector column, computed by the database when written"""
+    def db_type(self, connection):
+        return 'tsvector'
+
+
+class SearchDocument(models.Model):
+    """Model to store the full text search document of a post, along with the
+    fields search results are filtered by"""
+    content_type = models.ForeignKey(ContentType)
+    object_id = models.PositiveIntegerField()
+    content_object = GenericForeignKey()
+    community = models.ForeignKey('community.Community')
+    is_public = models.BooleanField(default=True)
+    document = SearchVectorField(null=True, editable=False)
+
+    class Meta:
+        unique_together = ('content_type', 'object_id')
+
+    def __unicode__(self):
+        return "Search document of {0}".format(self.content_object)
+
+
+def prefetch_comment_targets(comments, related=('community',)):
+    """Fetch the objects commented on, with one query per model whatever the
+    number of comments, and cache them on the comments
+
+    :param comments: list of Comment objects
+    :param related: tuple of relations to select along with the objects, if
+                    their model has them
+    :return: list of Comment objects
+    """
+    object_ids = defaultdict(set)
+    for comment in comments:
+        object_ids[comment.content_type_id].add(comment.object_id)
+    targets = {}
+    for content_type_id, ids in object_ids.items():
+        model = ContentType.objects.get_for_id(content_type_id).model_class()
+        if model is None:
+            continue
+        field_names = [field.name for field in model._meta.fields]
+        objects = model._default_manager.filter(pk__in=ids).select_related(
+            *[name for name in related if name in field_names])
+        if 'content' in field_names:
+            objects = objects.defer('content')
+        for obj in objects:
+            targets[(content_type_id, obj.pk)] = obj
+    for comment in comments:
+        setattr(comment, Comment.content_object.cache_attr,
+                targets.get((comment.content_type_id, comment.object_id)))
+    return comments
+
+
+class CommentQuerySet(models.QuerySet):
+    """QuerySet of Comment objects"""
+    def pending(self):
+        """Filter comments waiting for approval"""
+        return self.filter(is_approved=False)
+
+    def get_queue(self, cursor=None, per_page=100):
+        """Get a page of comments, oldest first, with their authors and the
+        objects they comment on. The page is fetched with one query, plus one
+        query per model of the commented objects.
+
+        :param cursor: string cursor of the previous page, None for the first
+        :param per_page: integer maximum number of comments on the page
+        :return: KeysetPage object
+        """
+        page = keyset_paginate(
+            self.select_related('author__user'),
+            ('date_created', 'id'), cursor, per_page)
+        prefetch_comment_targets(page.object_list)
+        return page
+
 
 class Comment(models.Model):
     """Model to represent a comment to a generic model.
@@ -35,5 +210,11 @@ class Comment(models.Model):
     object_id = models.PositiveIntegerField()
     content_object = GenericForeignKey()
 
+    objects = CommentQuerySet.as_manager()
+
+    class Meta:
+        index_together = [['is_approved', 'date_created', 'id'],
+                          ['content_type', 'object_id']]
+
     def __unicode__(self):
         return "Comment by {0} to {1}".format(self.author, self.content_object)
@@ -0,0 +1,126 @@
+import base64
+import datetime
+import json
+import operator
+from functools import reduce
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+
+class KeysetPage(object):
+    """A page of objects fetched with keyset pagination"""
+    def __init__(self, object_list, next_cursor):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+
+def _encode_value(value):
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    raise TypeError("{0!r} is not JSON serializable".format(value))
+
+
+def encode_cursor(values):
+    """Encode the ordering values of the last object of a page
+
+    :param values: list of ordering values
+    :return: string URL safe cursor
+    """
+    return base64.urlsafe_b64encode(json.dumps(values,
+                                               default=_encode_value))
+
+
+def decode_cursor(cursor):
+    """Decode a cursor created by encode_cursor
+
+    :param cursor: string cursor
+    :return: list of ordering values
+    :raises ValueError: if the cursor is malformed
+    """
+    try:
+        values = json.loads(base64.urlsafe_b64decode(str(cursor)))
+    except (TypeError, ValueError, UnicodeError):
+        raise ValueError("Invalid cursor {0!r}".format(cursor))
+    if not isinstance(values, list):
+        raise ValueError("Invalid cursor {0!r}".format(cursor))
+    return values
+
+
+def _get_value(obj, field_name):
+    for name in field_name.split("__"):
+        obj = getattr(obj, name)
+    return obj
+
+
+def _get_field(model, field_name):
+    for name in field_name.split("__"):
+        field = model._meta.get_field(name)
+        if field.rel is not None:
+            model = field.rel.to
+    return field
+
+
+def keyset_paginate(queryset, ordering, cursor=None, per_page=20):
+    """Fetch a page of objects following the one a cursor points to. Unlike
+    offset pagination, the cost of fetching a page does not depend on how far
+    it is from the first one, provided an index matches the ordering.
+
+    :param queryset: QuerySet to paginate
+    :param ordering: tuple of field attnames, prefixed by '-' for descending
+                     order, ending with a unique field such as 'id'
+    :param cursor: string cursor of the previous page, None for the first page
+    :param per_page: integer maximum number of objects on the page
+    :return: KeysetPage object
+    :raises ValueError: if the cursor is malformed
+    """
+    fields = [field.lstrip('-') for field in ordering]
+    queryset = queryset.order_by(*ordering)
+    if cursor is not None:
+        values = decode_cursor(cursor)
+        if len(values) != len(fields):
+            raise ValueError("Invalid cursor {0!r}".format(cursor))
+        try:
+            values = [_get_field(queryset.model, field).to_python(value)
+                      for field, value in zip(fields, values)]
+        except (ValidationError, TypeError, ValueError):
+            raise ValueError("Invalid cursor {0!r}".format(cursor))
+        conditions = []
+        for i, field in enumerate(ordering):
+            lookup = "lt" if field.startswith('-') else "gt"
+            filters = dict(zip(fields[:i], values[:i]))
+            filters["{0}__{1}".format(fields[i], lookup)] = values[i]
+            conditions.append(Q(**filters))
+        queryset = queryset.filter(reduce(operator.or_, conditions))
+    object_list = list(queryset[:per_page + 1])
+    next_cursor = None
+    if len(object_list) > per_page:
+        object_list = object_list[:per_page]
+        next_cursor = encode_cursor([_get_value(object_list[-1], field)
+                                     for field in fields])
+    return KeysetPage(object_list, next_cursor)
+
+
+def iter_chunks(queryset, chunk_size=500):
+    """Iterate over all objects of a queryset in chunks ordered by primary
+    key, each fetched with a keyset query, so large tables are streamed
+    without loading them at once
+
+    :param queryset: QuerySet to iterate over
+    :param chunk_size: integer maximum number of objects per chunk
+    :return: generator of non-empty lists of objects
+    """
+    queryset = queryset.order_by('pk')
+    chunk = list(queryset[:chunk_size])
+    while chunk:
+        yield chunk
+        chunk = list(queryset.filter(pk__gt=chunk[-1].pk)[:chunk_size])
@@ -0,0 +1,116 @@
+from django.apps import apps
+from django.contrib.contenttypes.models import ContentType
+from django.db import connection, transaction
+from django.db.models import Q
+
+from common.content import get_plain_text
+from common.models import SearchDocument
+
+
+# Models whose instances are full text searchable
+searchable_models = ("blog.News", "blog.Resource", "community.CommunityPage")
+
+# PostgreSQL text search configuration of documents and queries
+SEARCH_CONFIG = 'english'
+
+
+def get_search_text(post):
+    """Get the plain text of a post content
+
+    :param post: Post object
+    :return: unicode content without HTML tags and entities
+    """
+    return get_plain_text(post.content)
+
+
+@transaction.atomic
+def index_posts(posts):
+    """Replace the search documents of posts. Titles are weighted above
+    contents, the documents of all the posts are written with one DELETE and
+    one INSERT per model.
+
+    :param posts: iterable of saved Post objects of searchable models
+    """
+    posts_by_model = {}
+    for post in posts:
+        posts_by_model.setdefault(type(post)._meta.concrete_model,
+                                  []).append(post)
+    qn = connection.ops.quote_name
+    table = qn(SearchDocument._meta.db_table)
+    cursor = connection.cursor()
+    for model, model_posts in posts_by_model.items():
+        content_type = ContentType.objects.get_for_model(model)
+        unindex_posts(model, [post.pk for post in model_posts])
+        params = []
+        for post in model_posts:
+            params.extend([content_type.pk, post.pk, post.community_id,
+                           getattr(post, 'is_public', True), SEARCH_CONFIG,
+                           post.title, SEARCH_CONFIG, get_search_text(post)])
+        cursor.execute(
+            "INSERT INTO {table} ({content_type}, {object_id}, {community}, "
+            "{is_public}, {document}) VALUES {values}".format(
+                table=table, content_type=qn('content_type_id'),
+                object_id=qn('object_id'), community=qn('community_id'),
+                is_public=qn('is_public'), document=qn('document'),
+                values=", ".join(
+                    ["(%s, %s, %s, %s, "
+                     "setweight(to_tsvector(%s::regconfig, %s), 'A') || "
+                     "setweight(to_tsvector(%s::regconfig, %s), 'B'))"] *
+                    len(model_posts))),
+            params)
+
+
+def unindex_posts(model, post_ids):
+    """Delete the search documents of posts
+
+    :param model: searchable model class
+    :param post_ids: list of integer post ids
+    """
+    SearchDocument.objects.filter(
+        content_type=ContentType.objects.get_for_model(model),
+        object_id__in=post_ids).delete()
+
+
+def search_posts(query, community=None, tag=None, is_public=None):
+    """Search posts matching all the words of a query, best matches first.
+    Matched posts are fetched along with the search documents, with one
+    query per model.
+
+    :param query: string search query
+    :param community: Community object or id to search in, None for all
+    :param tag: Tag object or id the posts must have, None for any
+    :param is_public: True or False to only search public or private posts,
+                      None for both
+    :return: QuerySet of SearchDocument objects annotated with rank, whose
+             content_object is the matched post
+    """
+    documents = SearchDocument.objects.extra(
+        select={'rank': "ts_rank(document, plainto_tsquery(%s, %s))"},
+        select_params=[SEARCH_CONFIG, query],
+        where=["document @@ plainto_tsquery(%s, %s)"],
+        params=[SEARCH_CONFIG, query])
+    if community is not None:
+        documents = documents.filter(community=community)
+    if is_public is not None:
+        documents = documents.filter(is_public=is_public)
+    if tag is not None:
+        tagged = Q()
+        for label in searchable_models:
+            model = apps.get_model(label)
+            if 'tags' in [field.name for field in model._meta.many_to_many]:
+                tagged |= Q(content_type=ContentType.objects.get_for_model(
+                    model), object_id__in=model.objects.filter(
+                    tags=tag).values('pk'))
+        documents = documents.filter(tagged)
+    documents = documents.defer('document').order_by('-rank', 'id')
+    return documents.prefetch_related('content_object')
+
+
+def update_search_document(sender, instance, **kwargs):
+    """Reindex a saved post"""
+    index_posts([instance])
+
+
+def remove_search_document(sender, instance, **kwargs):
+    """Delete the search document of a deleted post"""
+    unindex_posts(sender, [instance.pk])
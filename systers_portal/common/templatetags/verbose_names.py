@@ -1,5 +1,7 @@
 from django import template
 
+from common.metadata import get_field_descriptor
+
 
 register = template.Library()
 
@@ -12,4 +14,4 @@ def verbose_name(instance, field_name):
     :param field_name: string model field name
     :returns: string verbose name of the field name
     """
-    return instance._meta.get_field(field_name).verbose_name
+    return get_field_descriptor(instance, field_name).verbose_name
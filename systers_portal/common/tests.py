@@ -1,6 +1,24 @@
+from StringIO import StringIO
+
+from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.core.management import call_command
 from django.core.urlresolvers import reverse
+from django.db.models.fields import FieldDoesNotExist
 from django.test import TestCase, Client
 
+from blog.models import News, Resource, Tag
+from common.cache import bump_versions, get_version
+from common.content import get_derived_fields
+from common.metadata import get_field_descriptor, get_field_descriptors
+from common.models import Comment, SearchDocument
+from common.pagination import iter_chunks
+from common.search import search_posts
+from common.templatetags.verbose_names import verbose_name
+from community.models import Community, CommunityPage
+from users.models import SystersUser
+
 
 class CommonViewsTestCase(TestCase):
     def setUp(self):
@@ -11,3 +29,222 @@ class CommonViewsTestCase(TestCase):
         response = self.client.get(index_url)
         self.assertEqual(response.status_code, 200)
         self.assertTemplateUsed(response, 'common/index.html')
+
+
+class VersionedCacheTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_versions(self):
+        """Test getting and bumping versions of cached entries"""
+        bump_versions(["foo"])
+        self.assertIsNone(cache.get("foo"))
+        version = get_version("foo")
+        self.assertEqual(get_version("foo"), version)
+        bump_versions(["foo", "foo", "bar"])
+        self.assertEqual(get_version("foo"), version + 1)
+        self.assertIsNone(cache.get("bar"))
+        # bumped versions never expire
+        self.assertIsNone(cache._expire_info[cache.make_key("foo")])
+
+
+class ChunksTestCase(TestCase):
+    def test_iter_chunks(self):
+        """Test iterating over a queryset in chunks ordered by pk"""
+        users = [User.objects.create(username='foo{0}'.format(i))
+                 for i in range(5)]
+        with self.assertNumQueries(4):
+            chunks = list(iter_chunks(User.objects.all(), 2))
+        self.assertEqual(chunks, [users[:2], users[2:4], users[4:]])
+        with self.assertNumQueries(1):
+            self.assertEqual(list(iter_chunks(
+                User.objects.filter(username='bar'), 2)), [])
+
+
+class FieldMetadataTestCase(TestCase):
+    def test_field_descriptors(self):
+        """Test field descriptor tables built when apps are ready"""
+        with self.assertNumQueries(0):
+            descriptors = get_field_descriptors(SystersUser)
+        self.assertEqual([descriptor.name for descriptor in descriptors],
+                         [field.name for field in SystersUser._meta.fields])
+        descriptor = get_field_descriptor(SystersUser(), "blog_url")
+        self.assertEqual(descriptor.verbose_name, "Blog")
+        self.assertEqual(verbose_name(SystersUser(), "homepage_url"),
+                         "Homepage")
+        self.assertEqual(get_field_descriptor(Community, "members").attname,
+                         "members")
+        self.assertRaises(FieldDoesNotExist, get_field_descriptor,
+                          SystersUser, "foo")
+
+
+class SearchTestCase(TestCase):
+    def setUp(self):
+        User.objects.create_user(username='foo', password='foobar')
+        self.author = SystersUser.objects.get()
+        self.community = Community.objects.create(
+            name="Foo", slug="foo", order=1, community_admin=self.author)
+        self.other = Community.objects.create(
+            name="Bar", slug="bar", order=2, community_admin=self.author)
+        self.news = News.objects.create(
+            slug="news", title="Mentoring program", author=self.author,
+            community=self.community,
+            content="<p>Apply to the <b>summer</b> program &amp; more</p>")
+        self.resource = Resource.objects.create(
+            slug="resource", title="Python books", author=self.author,
+            community=self.other, is_public=False,
+            content="<ul><li>Books about mentoring</li></ul>")
+        self.page = CommunityPage.objects.create(
+            slug="page", title="About", order=1, author=self.author,
+            community=self.community, content="Our programs")
+
+    def search(self, query, **kwargs):
+        return [document.content_object for document in
+                search_posts(query, **kwargs)]
+
+    def test_search_posts(self):
+        """Test ranked search of posts and its filters"""
+        with self.assertNumQueries(3):
+            self.assertEqual(self.search("mentoring"),
+                             [self.news, self.resource])
+        self.assertEqual(self.search("programs"), [self.news, self.page])
+        self.assertEqual(self.search("summer"), [self.news])
+        self.assertEqual(self.search("summer more"), [self.news])
+        self.assertEqual(self.search("summer books"), [])
+        self.assertEqual(self.search("b"), [])
+        self.assertEqual(self.search("program", community=self.community),
+                         [self.news, self.page])
+        self.assertEqual(self.search("mentoring", is_public=False),
+                         [self.resource])
+        tag = Tag.objects.create(name="Mentoring")
+        self.assertEqual(self.search("mentoring", tag=tag), [])
+        self.resource.tags.add(tag)
+        self.assertEqual(self.search("mentoring", tag=tag), [self.resource])
+
+    def test_incremental_indexing(self):
+        """Test search documents follow post changes"""
+        self.news.title = "Scholarships"
+        self.news.community = self.other
+        self.news.save()
+        self.assertEqual(self.search("mentoring"), [self.resource])
+        self.assertEqual(self.search("scholarship", community=self.other),
+                         [self.news])
+        self.resource.delete()
+        self.assertEqual(self.search("mentoring"), [])
+        self.assertEqual(SearchDocument.objects.count(), 2)
+
+    def test_reindex_posts(self):
+        """Test reindex_posts management command"""
+        SearchDocument.objects.all().delete()
+        SearchDocument.objects.create(
+            content_type=ContentType.objects.get_for_model(News), object_id=0,
+            community=self.other)
+        stdout = StringIO()
+        call_command('reindex_posts', chunk_size=1, stdout=stdout)
+        self.assertIn("Indexed 1 News", stdout.getvalue())
+        self.assertIn("Indexed 1 community pages", stdout.getvalue())
+        self.assertEqual(SearchDocument.objects.count(), 3)
+        self.assertEqual(self.search("mentoring"), [self.news, self.resource])
+
+
+class DerivedFieldsTestCase(TestCase):
+    def setUp(self):
+        User.objects.create_user(username='foo', password='foobar')
+        self.author = SystersUser.objects.get()
+        self.community = Community.objects.create(
+            name="Foo", slug="foo", order=1, community_admin=self.author)
+
+    def test_get_derived_fields(self):
+        """Test computing the fields derived from post content"""
+        fields = get_derived_fields(
+            '<p>Tom &amp; Jerry</p><img src="data:image/png;base64,AA">'
+            '<IMG alt="x" SRC="/media/a.png?w=1&amp;h=2"><img src="b.png">')
+        self.assertEqual(fields, {'excerpt': u"Tom & Jerry",
+                                  'reading_time': 1,
+                                  'first_image': u"/media/a.png?w=1&h=2"})
+        fields = get_derived_fields(" ".join(["<b>word</b>"] * 450))
+        self.assertEqual(fields['reading_time'], 3)
+        self.assertEqual(fields['excerpt'], " ".join(["word"] * 50) + u"...")
+        self.assertEqual(fields['first_image'], u"")
+        self.assertEqual(get_derived_fields("")['reading_time'], 0)
+
+    def test_save(self):
+        """Test derived fields are updated when posts are saved"""
+        news = News.objects.create(
+            slug="news", title="News", author=self.author,
+            community=self.community, content="<p>Hello <i>world</i></p>")
+        page = CommunityPage.objects.create(
+            slug="page", title="About", order=1, author=self.author,
+            community=self.community, content='<img src="a.png">')
+        self.assertEqual(News.objects.get().excerpt, u"Hello world")
+        self.assertEqual(CommunityPage.objects.get().first_image, u"a.png")
+        news.content = "Bye"
+        news.save(update_fields=['content'])
+        self.assertEqual(News.objects.get().excerpt, u"Bye")
+        page.title = "Title"
+        page.save(update_fields=['title'])
+        self.assertEqual(CommunityPage.objects.get().first_image, u"a.png")
+
+    def test_update_post_fields(self):
+        """Test update_post_fields management command"""
+        for i in range(3):
+            Resource.objects.create(
+                slug="resource{0}".format(i), title="Resource",
+                author=self.author, community=self.community,
+                content="<p>Resource {0}</p>".format(i))
+        Resource.objects.update(excerpt="", reading_time=0)
+        date_modified = Resource.objects.values_list('date_modified')[0]
+        stdout = StringIO()
+        call_command('update_post_fields', chunk_size=2, stdout=stdout)
+        self.assertIn("Updated 3 resources", stdout.getvalue())
+        self.assertIn("Updated 0 News", stdout.getvalue())
+        self.assertEqual(
+            list(Resource.objects.order_by('pk').values_list(
+                'excerpt', 'reading_time')),
+            [(u"Resource 0", 1), (u"Resource 1", 1), (u"Resource 2", 1)])
+        self.assertEqual(Resource.objects.values_list('date_modified')[0],
+                         date_modified)
+
+
+class CommentQueueTestCase(TestCase):
+    def setUp(self):
+        for username in ("foo", "bar", "baz"):
+            User.objects.create_user(username=username, password='foobar')
+        authors = list(SystersUser.objects.order_by('pk'))
+        community = Community.objects.create(
+            name="Foo", slug="foo", order=1, community_admin=authors[0])
+        posts = []
+        for i in range(5):
+            posts.append(News.objects.create(
+                slug="news{0}".format(i), title="News {0}".format(i),
+                content="Hi", author=authors[0], community=community))
+            posts.append(Resource.objects.create(
+                slug="resource{0}".format(i), title="Resource {0}".format(i),
+                content="Hi", author=authors[0], community=community))
+        self.comments = [Comment.objects.create(
+            author=authors[i % 3], body="Comment", is_approved=i % 4 != 0,
+            content_object=posts[i % 10]) for i in range(100)]
+
+    def test_get_queue(self):
+        """Test listing comments with a constant number of queries"""
+        for model in (News, Resource):
+            ContentType.objects.get_for_model(model)
+        with self.assertNumQueries(3):
+            page = Comment.objects.get_queue()
+            rendered = [unicode(comment) for comment in page]
+        self.assertEqual(rendered, [unicode(comment) for comment in
+                                    Comment.objects.order_by('pk')])
+        self.assertEqual(rendered[1], "Comment by bar to Resource 0 of Foo "
+                                      "Community")
+        self.assertFalse(page.has_next())
+
+        # pending comments are all on news
+        with self.assertNumQueries(2):
+            page = Comment.objects.pending().get_queue(per_page=10)
+            self.assertEqual([comment.content_object.title
+                              for comment in page],
+                             ["News 0", "News 2", "News 4", "News 1",
+                              "News 3"] * 2)
+        self.assertTrue(page.has_next())
+        page = Comment.objects.pending().get_queue(page.next_cursor, 10)
+        self.assertEqual(page.object_list[0], self.comments[40])
@@ -1,7 +1,8 @@
 from django.contrib import admin
 from guardian.admin import GuardedModelAdmin
 
-from community.models import Community, CommunityPage, JoinRequest
+from community.models import (Community, CommunityGroup, CommunityPage,
+                              JoinRequest)
 
 
 class CommunityAdmin(GuardedModelAdmin):
@@ -15,5 +16,6 @@ class CommunityAdmin(GuardedModelAdmin):
 
 
 admin.site.register(Community, CommunityAdmin)
+admin.site.register(CommunityGroup)
 admin.site.register(CommunityPage)
 admin.site.register(JoinRequest)
@@ -0,0 +1,67 @@
+from community.models import Community, CommunityGroup
+from community.permissions import group_permissions, is_global_permission
+
+
+# Row-level codenames granted on a community by each role template
+role_object_permissions = dict(
+    (role, frozenset(perm for perm in perms if not is_global_permission(perm)))
+    for role, perms in group_permissions.items())
+
+
+def get_community_roles(user):
+    """Get the roles a user holds in every community through the community
+    groups. The roles are fetched with a single query and memoised on the
+    user object.
+
+    :param user: User object
+    :return: dict mapping community ids to sets of groups_templates keys
+    """
+    roles = getattr(user, '_community_roles', None)
+    if roles is None:
+        roles = {}
+        for community_id, role in CommunityGroup.objects.filter(
+                group__user=user).values_list('community_id', 'role'):
+            roles.setdefault(community_id, set()).add(role)
+        user._community_roles = roles
+    return roles
+
+
+class RoleTemplateBackend(object):
+    """Authentication backend resolving row-level Community permissions from
+    the community roles of a user and the role templates, without reading
+    the guardian permission tables. It doesn't authenticate users.
+
+    Combined with COMMUNITY_OBJECT_PERMISSIONS = False, new communities are
+    provisioned without writing their GroupObjectPermission rows.
+    """
+    def authenticate(self, **credentials):
+        return None
+
+    def get_all_permissions(self, user_obj, obj=None):
+        """Get the row-level permissions a user has on a Community
+
+        :param user_obj: User object
+        :param obj: Community object
+        :return: set of 'community.<codename>' strings
+        """
+        if not isinstance(obj, Community) or obj.pk is None:
+            return set()
+        if not user_obj.is_active or user_obj.is_anonymous():
+            return set()
+        perms = set()
+        for role in get_community_roles(user_obj).get(obj.pk, ()):
+            perms.update(role_object_permissions[role])
+        return set("{0}.{1}".format(Community._meta.app_label, perm)
+                   for perm in perms)
+
+    def has_perm(self, user_obj, perm, obj=None):
+        """Check if a user has a row-level permission on a Community
+
+        :param user_obj: User object
+        :param perm: string codename, optionally prefixed by the app label
+        :param obj: Community object
+        :return: True if user has the permission, False otherwise
+        """
+        if '.' not in perm:
+            perm = "{0}.{1}".format(Community._meta.app_label, perm)
+        return perm in self.get_all_permissions(user_obj, obj)
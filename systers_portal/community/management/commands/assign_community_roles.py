@@ -0,0 +1,66 @@
+import csv
+import sys
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from community.models import Community
+from community.utils import assign_roles
+
+
+class Command(BaseCommand):
+    args = '<csv_file>'
+    help = ('Set the roles of users in communities from a CSV file of '
+            'username,community_slug,role rows, read from stdin if the file '
+            'is - or missing. An empty role removes all the roles of the user '
+            'in the community.')
+
+    def handle(self, *args, **options):
+        if len(args) > 1:
+            raise CommandError("Expected a single CSV file")
+        if not args or args[0] == '-':
+            rows = self.read_rows(sys.stdin)
+        else:
+            with open(args[0], 'rb') as csv_file:
+                rows = self.read_rows(csv_file)
+
+        user_ids = dict(User.objects.filter(
+            username__in=set(row[0] for row in rows)).values_list('username',
+                                                                  'pk'))
+        community_ids = dict(Community.objects.filter(
+            slug__in=set(row[1] for row in rows)).values_list('slug', 'pk'))
+        unknown_users = set(row[0] for row in rows).difference(user_ids)
+        if unknown_users:
+            raise CommandError("Unknown users: {0}".format(
+                ", ".join(sorted(unknown_users))))
+        unknown_communities = set(row[1] for row in rows).difference(
+            community_ids)
+        if unknown_communities:
+            raise CommandError("Unknown communities: {0}".format(
+                ", ".join(sorted(unknown_communities))))
+
+        try:
+            added, removed = assign_roles(
+                (user_ids[username], community_ids[slug], role or None)
+                for username, slug, role in rows)
+        except ValueError as e:
+            raise CommandError(e)
+        self.stdout.write("Added {0} and removed {1} group memberships".format(
+            added, removed))
+
+    def read_rows(self, csv_file):
+        """Read the (username, community slug, role) rows of a CSV file
+
+        :param csv_file: file object
+        :return: list of tuples of unicode strings
+        """
+        rows = []
+        for line, row in enumerate(csv.reader(csv_file), 1):
+            if not row:
+                continue
+            if len(row) == 2:
+                row.append("")
+            if len(row) != 3:
+                raise CommandError("Line {0}: expected 3 columns".format(line))
+            rows.append(tuple(value.decode('utf-8').strip() for value in row))
+        return rows
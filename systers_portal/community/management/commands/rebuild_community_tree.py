@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from community.utils import rebuild_tree
+
+
+class Command(BaseCommand):
+    help = 'Recompute the tree paths of all communities from their parents'
+
+    def handle(self, *args, **options):
+        count = rebuild_tree()
+        self.stdout.write("Updated tree paths of {0} communities".format(
+            count))
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from community.models import Community
+from community.utils import update_counters
+
+
+class Command(BaseCommand):
+    args = '[community_slug ...]'
+    help = ('Recompute member, news, resource and page counters of the given '
+            'communities, or of all communities if none is given')
+
+    def handle(self, *args, **options):
+        community_ids = None
+        if args:
+            community_ids = Community.objects.filter(
+                slug__in=args).values_list('pk', flat=True)
+        count = update_counters(community_ids)
+        self.stdout.write("Updated counters of {0} communities".format(count))
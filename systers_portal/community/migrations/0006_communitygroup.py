@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+GROUPS_TEMPLATES = {"content_contributor": "{0}: Content Contributor",
+                    "content_manager": "{0}: Content Manager",
+                    "user_content_manager": "{0}: User and Content Manager",
+                    "community_admin": "{0}: Community Admin"}
+
+
+def link_community_groups(apps, schema_editor):
+    """Link existing communities to their groups matched by name"""
+    Community = apps.get_model('community', 'Community')
+    CommunityGroup = apps.get_model('community', 'CommunityGroup')
+    Group = apps.get_model('auth', 'Group')
+    communities = dict(Community.objects.values_list('name', 'id'))
+    names = dict((template.format(name), (community_id, role))
+                 for name, community_id in communities.items()
+                 for role, template in GROUPS_TEMPLATES.items())
+    links = []
+    for group_id, name in Group.objects.filter(
+            name__in=names.keys()).values_list('id', 'name'):
+        community_id, role = names[name]
+        links.append(CommunityGroup(community_id=community_id,
+                                    group_id=group_id, role=role))
+    CommunityGroup.objects.bulk_create(links)
+
+
+def unlink_community_groups(apps, schema_editor):
+    """Nothing to undo, the links are dropped along with their table"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0001_initial'),
+        ('community', '0005_auto_20141006_2117'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CommunityGroup',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('role', models.CharField(max_length=50, verbose_name=b'Role', choices=[(b'content_manager', b'content_manager'), (b'community_admin', b'community_admin'), (b'content_contributor', b'content_contributor'), (b'user_content_manager', b'user_content_manager')])),
+                ('community', models.ForeignKey(related_name=b'community_groups', verbose_name=b'Community', to='community.Community')),
+                ('group', models.OneToOneField(related_name=b'community_group', verbose_name=b'Group', to='auth.Group')),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+        migrations.AlterUniqueTogether(
+            name='communitygroup',
+            unique_together=set([('community', 'role')]),
+        ),
+        migrations.RunPython(link_community_groups,
+                             unlink_community_groups),
+    ]
@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+def remove_orphaned_permissions(apps, schema_editor):
+    """Remove row-level permissions of already deleted communities"""
+    ContentType = apps.get_model('contenttypes', 'ContentType')
+    try:
+        content_type = ContentType.objects.get(app_label='community',
+                                               model='community')
+    except ContentType.DoesNotExist:
+        return
+    cursor = schema_editor.connection.cursor()
+    for table in ('guardian_groupobjectpermission',
+                  'guardian_userobjectpermission'):
+        cursor.execute(
+            "DELETE FROM {0} WHERE content_type_id = %s AND object_pk NOT IN "
+            "(SELECT CAST(id AS varchar) FROM community_community)".format(
+                table), [content_type.pk])
+
+
+def keep_removed_permissions(apps, schema_editor):
+    """Leave the permission tables as they are, the removed permissions of
+    deleted communities can't be restored"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0001_initial'),
+        ('community', '0006_communitygroup'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_orphaned_permissions,
+                             keep_removed_permissions),
+    ]
@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0002_auto_20140928_2034'),
+        ('community', '0007_remove_orphaned_permissions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='community',
+            name='member_count',
+            field=models.PositiveIntegerField(default=0, verbose_name=b'Members count', editable=False),
+            preserve_default=True,
+        ),
+        migrations.AddField(
+            model_name='community',
+            name='news_count',
+            field=models.PositiveIntegerField(default=0, verbose_name=b'News count', editable=False),
+            preserve_default=True,
+        ),
+        migrations.AddField(
+            model_name='community',
+            name='page_count',
+            field=models.PositiveIntegerField(default=0, verbose_name=b'Pages count', editable=False),
+            preserve_default=True,
+        ),
+        migrations.AddField(
+            model_name='community',
+            name='resource_count',
+            field=models.PositiveIntegerField(default=0, verbose_name=b'Resources count', editable=False),
+            preserve_default=True,
+        ),
+        migrations.RunSQL(
+            "UPDATE community_community SET "
+            "member_count = (SELECT COUNT(*) FROM community_community_members t "
+            "WHERE t.community_id = community_community.id), "
+            "news_count = (SELECT COUNT(*) FROM blog_news t "
+            "WHERE t.community_id = community_community.id), "
+            "resource_count = (SELECT COUNT(*) FROM blog_resource t "
+            "WHERE t.community_id = community_community.id), "
+            "page_count = (SELECT COUNT(*) FROM community_communitypage t "
+            "WHERE t.community_id = community_community.id)",
+            "UPDATE community_community SET member_count = 0, "
+            "news_count = 0, resource_count = 0, page_count = 0"),
+    ]
@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+def build_community_tree(apps, schema_editor):
+    """Compute tree paths of existing communities"""
+    Community = apps.get_model('community', 'Community')
+    parents = dict(Community.objects.values_list('id', 'parent_community_id'))
+    for community_id in parents:
+        ancestors = [community_id]
+        while parents.get(ancestors[-1]) is not None and \
+                parents[ancestors[-1]] not in ancestors:
+            ancestors.append(parents[ancestors[-1]])
+        path = "".join("{0}/".format(pk) for pk in reversed(ancestors))
+        Community.objects.filter(pk=community_id).update(
+            path=path, depth=len(ancestors) - 1)
+
+
+def clear_community_tree(apps, schema_editor):
+    """Nothing to undo, the tree fields are dropped"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('community', '0008_community_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='community',
+            name='depth',
+            field=models.PositiveIntegerField(default=0, verbose_name=b'Tree depth', editable=False),
+            preserve_default=True,
+        ),
+        migrations.AddField(
+            model_name='community',
+            name='path',
+            field=models.CharField(default=b'', editable=False, max_length=255, blank=True, verbose_name=b'Tree path', db_index=True),
+            preserve_default=True,
+        ),
+        migrations.RunPython(build_community_tree, clear_community_tree),
+    ]
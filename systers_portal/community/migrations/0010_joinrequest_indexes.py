@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('community', '0009_community_tree'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='joinrequest',
+            index_together=set([('community', 'is_approved', 'date_created'), ('user', 'is_approved')]),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('community', '0011_communitypage_derived_fields'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            "CREATE INDEX community_community_path_like ON "
+            "community_community (path varchar_pattern_ops)",
+            "DROP INDEX community_community_path_like"),
+    ]
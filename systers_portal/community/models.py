@@ -1,10 +1,15 @@
-from django.db import models
+from django.contrib.auth.models import Group
+from django.core.exceptions import ValidationError
+from django.db import models, router, transaction
+from django.db.models import Q
 
-from common.models import Post
+from common.models import DirtyFieldsMixin, Post
+from common.pagination import keyset_paginate
+from community.permissions import groups_templates
 from users.models import SystersUser
 
 
-class Community(models.Model):
+class Community(DirtyFieldsMixin, models.Model):
     """Model to represent Systers community or subcommunity"""
     name = models.CharField(max_length=255, verbose_name="Name")
     slug = models.SlugField(max_length=150, unique=True, verbose_name="Slug")
@@ -27,8 +32,23 @@ class Community(models.Model):
                                  verbose_name="Google+")
     twitter = models.URLField(max_length=255, blank=True,
                               verbose_name="Twitter")
-    __original_name = None
-    __original_community_admin = None
+    member_count = models.PositiveIntegerField(default=0, editable=False,
+                                               verbose_name="Members count")
+    news_count = models.PositiveIntegerField(default=0, editable=False,
+                                             verbose_name="News count")
+    resource_count = models.PositiveIntegerField(
+        default=0, editable=False, verbose_name="Resources count")
+    page_count = models.PositiveIntegerField(default=0, editable=False,
+                                             verbose_name="Pages count")
+    path = models.CharField(max_length=255, blank=True, default="",
+                            db_index=True, editable=False,
+                            verbose_name="Tree path")
+    depth = models.PositiveIntegerField(default=0, editable=False,
+                                        verbose_name="Tree depth")
+    tracked_fields = ('name', 'community_admin_id', 'parent_community_id')
+    counter_fields = ('member_count', 'news_count', 'resource_count',
+                      'page_count')
+    tree_fields = ('path', 'depth')
 
     class Meta:
         verbose_name_plural = "Communities"
@@ -54,33 +74,122 @@ class Community(models.Model):
     def __unicode__(self):
         return self.name
 
-    def __init__(self, *args, **kwargs):
-        super(Community, self).__init__(*args, **kwargs)
-        self.__original_name = self.name
-        if self.community_admin_id is not None:
-            self.__original_community_admin = self.community_admin
+    def save(self, force_insert=False, force_update=False, using=None,
+             update_fields=None):
+        """Save community without overwriting the counters and the tree path
+        of an existing community, those are maintained by signal handlers.
+        Only the loaded fields of deferred instances are saved. The handlers
+        run in the same transaction, so the save is rolled back if they fail,
+        e.g. on a cyclic parent."""
+        if update_fields is None and not force_insert and \
+                self.pk is not None and self._exists(using, force_update):
+            excluded = self.counter_fields + self.tree_fields
+            # deferred fields are missing from __dict__
+            update_fields = [field.name for field in self._meta.concrete_fields
+                             if not field.primary_key and
+                             field.name not in excluded and
+                             field.attname in self.__dict__]
+        # the original admin becomes the admin at the previous save
+        self.__dict__.pop('_original_community_admin', None)
+        with transaction.atomic(using=using):
+            super(Community, self).save(force_insert, force_update, using,
+                                        update_fields)
+
+    def _exists(self, using, force_update):
+        # instances built with the pk of a saved community are still adding
+        if not self._state.adding or force_update:
+            return True
+        using = using or router.db_for_write(self.__class__, instance=self)
+        return Community.objects.using(using).filter(pk=self.pk).exists()
+
+    def clean(self):
+        """Forbid making a community a subcommunity of itself or of one of its
+        subcommunities"""
+        if self.pk is not None and self.parent_community_id is not None:
+            parent_path = Community.objects.filter(
+                pk=self.parent_community_id).values_list('path', flat=True)
+            parent_path = parent_path[0] if parent_path else ""
+            if "/{0}/".format(self.pk) in "/{0}".format(parent_path):
+                raise ValidationError("A community can't be a subcommunity "
+                                      "of itself or of its subcommunities.")
+
+    def get_ancestors(self):
+        """Get the parent communities up to the tree root
+
+        :return: QuerySet of Community objects ordered from the root
+        """
+        ancestor_ids = self.path.split("/")[:-2]
+        return Community.objects.filter(pk__in=ancestor_ids).order_by('depth')
+
+    def get_descendants(self, include_self=False):
+        """Get all the subcommunities, at any depth
+
+        :param include_self: True to include the community itself
+        :return: QuerySet of Community objects
+        """
+        descendants = Community.objects.filter(path__startswith=self.path)
+        if not include_self:
+            descendants = descendants.exclude(pk=self.pk)
+        return descendants
+
+    def get_subtree_filter(self, field_name='community'):
+        """Get a filter matching objects of the community or of any of its
+        subcommunities, to be used like
+        News.objects.filter(community.get_subtree_filter())
+
+        :param field_name: string name of the field relating to Community
+        :return: Q object
+        """
+        return Q(**{"{0}__path__startswith".format(field_name): self.path})
 
     @property
     def original_name(self):
-        return self.__original_name
+        return self.get_original_value('name')
 
     @property
     def original_community_admin(self):
-        return self.__original_community_admin
+        """Community admin at load time, fetched only when accessed"""
+        admin_id = self.get_original_value('community_admin_id')
+        if admin_id is None:
+            return None
+        if admin_id == self.community_admin_id:
+            return self.community_admin
+        if getattr(self, '_original_community_admin', None) is None:
+            self._original_community_admin = SystersUser.objects.get(
+                pk=admin_id)
+        return self._original_community_admin
 
     def has_changed_name(self):
         """Check if community has a new name
 
         :return: True if community changed name, False otherwise
         """
-        return self.name != self.original_name
+        return self.has_changed('name')
 
     def has_changed_community_admin(self):
         """Check if community has a new admin
 
         :return: True if community changed admin, False otherwise
         """
-        return self.community_admin != self.original_community_admin
+        return self.has_changed('community_admin_id')
+
+    def get_group(self, role):
+        """Get the group of a community role
+
+        :param role: string role key from groups_templates
+        :return: Group object
+        """
+        return Group.objects.get(community_group__community=self,
+                                 community_group__role=role)
+
+    def is_member(self, systers_user):
+        """Check if user is a community member without loading the members
+
+        :param systers_user: SystersUser object
+        :return: True if user is a member, False otherwise
+        """
+        return self.members.through.objects.filter(
+            community_id=self.pk, systersuser_id=systers_user.pk).exists()
 
     def add_member(self, systers_user):
         """Add community member
@@ -97,11 +206,60 @@ class Community(models.Model):
         """
         self.members.remove(systers_user)
 
+    def add_members(self, systers_users):
+        """Add many community members at once, existing members are skipped
+
+        :param systers_users: iterable of SystersUser objects or ids
+        """
+        self.members.add(*systers_users)
+
+    def remove_members(self, systers_users):
+        """Remove many community members at once
+
+        :param systers_users: iterable of SystersUser objects
+        """
+        self.members.remove(*systers_users)
+
+
+class CommunityGroup(models.Model):
+    """Model to link a Community to one of its role groups"""
+    community = models.ForeignKey(Community, related_name='community_groups',
+                                  verbose_name="Community")
+    group = models.OneToOneField(Group, related_name='community_group',
+                                 verbose_name="Group")
+    role = models.CharField(max_length=50,
+                            choices=[(key, key) for key in groups_templates],
+                            verbose_name="Role")
+
+    class Meta:
+        unique_together = ('community', 'role')
+
+    def __unicode__(self):
+        return "{0} of {1} Community".format(self.role, self.community)
 
-class CommunityPage(Post):
+
+class CommunityPage(DirtyFieldsMixin, Post):
     """Model to represent an arbitrary community page"""
     order = models.IntegerField(unique=True, verbose_name="Order")
     community = models.ForeignKey(Community, verbose_name="Community")
+    tracked_fields = ('community_id',)
+
+
+class JoinRequestQuerySet(models.QuerySet):
+    """QuerySet of JoinRequest objects"""
+    def pending(self):
+        """Filter join requests waiting for approval"""
+        return self.filter(is_approved=False)
+
+    def get_queue(self, cursor=None, per_page=20):
+        """Get a page of join requests, oldest first
+
+        :param cursor: string cursor of the previous page, None for the first
+        :param per_page: integer maximum number of requests on the page
+        :return: KeysetPage object
+        """
+        return keyset_paginate(self, ('date_created', 'id'), cursor,
+                               per_page)
 
 
 class JoinRequest(models.Model):
@@ -113,6 +271,12 @@ class JoinRequest(models.Model):
     date_created = models.DateTimeField(auto_now_add=True)
     is_approved = models.BooleanField(default=False)
 
+    objects = JoinRequestQuerySet.as_manager()
+
+    class Meta:
+        index_together = [['community', 'is_approved', 'date_created'],
+                          ['user', 'is_approved']]
+
     def __unicode__(self):
         approval_status = "approved" if self.is_approved else "not approved"
         return "Join Request by {0} - {1}".format(self.user, approval_status)
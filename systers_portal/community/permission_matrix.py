@@ -0,0 +1,201 @@
+import hashlib
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from guardian.backends import ObjectPermissionBackend
+from guardian.models import GroupObjectPermission, UserObjectPermission
+
+from common.cache import bump_versions, get_versions
+from community.backends import get_community_roles, role_object_permissions
+from community.models import Community
+from community.permissions import group_permissions, is_global_permission
+from community.registry import get_permissions
+
+
+def _get_object_codenames():
+    codenames = set()
+    for perms in group_permissions.values():
+        codenames.update(perm for perm in perms
+                         if not is_global_permission(perm))
+    return sorted(codenames)
+
+
+# Bit of every row-level codename used by the role templates
+codename_bits = dict((codename, 1 << i) for i, codename in
+                     enumerate(_get_object_codenames()))
+
+
+def get_templates_hash(role_permissions):
+    """Hash the permissions of the roles of the role templates
+
+    :param role_permissions: dict mapping roles to lists of codenames
+    :return: string hex digest
+    """
+    return hashlib.md5(";".join(
+        "{0}:{1}".format(role, ",".join(sorted(perms)))
+        for role, perms in sorted(role_permissions.items()))).hexdigest()
+
+
+# Changing the role templates, i.e. the permissions of any role, changes the
+# keys of all cached matrices
+MATRIX_KEY = "community:permissions:matrix:{0}:" + get_templates_hash(
+    group_permissions)
+
+# Version of the row-level permissions of a group, matrices built with an
+# older version of any of the user groups are stale
+GROUP_VERSION_KEY = "community:permissions:group:{0}:version"
+
+
+def get_group_versions(group_ids):
+    """Get the current versions of the row-level permissions of groups
+
+    :param group_ids: iterable of integer Group ids
+    :return: dict mapping Group ids to integer versions
+    """
+    keys = dict((GROUP_VERSION_KEY.format(group_id), group_id)
+                for group_id in group_ids)
+    return dict((keys[key], version)
+                for key, version in get_versions(keys).items())
+
+
+def build_permission_matrix(user, group_ids):
+    """Compute the row-level permissions a user has on every community from
+    the guardian permissions of the user and of the user groups, and from the
+    role templates when COMMUNITY_OBJECT_PERMISSIONS is off
+
+    :param user: User object
+    :param group_ids: list of integer ids of the user groups
+    :return: dict mapping community ids to bitsets of codename_bits
+    """
+    content_type = ContentType.objects.get_for_model(Community)
+    permission_codenames = dict(
+        (permission.pk, codename) for codename, permission in
+        get_permissions(codename_bits).items())
+    rows = []
+    if group_ids:
+        rows += GroupObjectPermission.objects.filter(
+            group__in=group_ids, content_type=content_type,
+            permission__in=permission_codenames).values_list(
+            'object_pk', 'permission_id')
+    rows += UserObjectPermission.objects.filter(
+        user=user, content_type=content_type,
+        permission__in=permission_codenames).values_list('object_pk',
+                                                         'permission_id')
+    matrix = {}
+    for object_pk, permission_id in rows:
+        community_id = int(object_pk)
+        bit = codename_bits[permission_codenames[permission_id]]
+        matrix[community_id] = matrix.get(community_id, 0) | bit
+    if not settings.COMMUNITY_OBJECT_PERMISSIONS:
+        for community_id, roles in get_community_roles(user).items():
+            for role in roles:
+                for codename in role_object_permissions[role]:
+                    matrix[community_id] = (matrix.get(community_id, 0) |
+                                            codename_bits[codename])
+    return matrix
+
+
+def get_permission_matrix(user):
+    """Get the community permissions matrix of a user, built on first use and
+    kept in cache until the permissions of the user or of the user groups
+    change, for at most PERMISSION_MATRIX_CACHE_TIMEOUT seconds. The matrix
+    is memoised on the user object, so the cache is read once per request.
+
+    :param user: User object
+    :return: dict mapping community ids to bitsets of codename_bits
+    """
+    matrix = getattr(user, '_community_permission_matrix', None)
+    if matrix is None:
+        key = MATRIX_KEY.format(user.pk)
+        cached = cache.get(key)
+        if cached is not None:
+            group_versions, matrix = cached
+            if get_group_versions(group_versions) != group_versions:
+                matrix = None
+        if matrix is None:
+            group_ids = list(user.groups.values_list('pk', flat=True))
+            # read before building, so concurrent changes leave it stale
+            group_versions = get_group_versions(group_ids)
+            matrix = build_permission_matrix(user, group_ids)
+            cache.set(key, (group_versions, matrix),
+                      settings.PERMISSION_MATRIX_CACHE_TIMEOUT)
+        user._community_permission_matrix = matrix
+    return matrix
+
+
+def has_community_perm(user, codename, community):
+    """Check if a user has a row-level permission on a community
+
+    :param user: User object
+    :param codename: string permission codename
+    :param community: Community object or id
+    :return: True if user has the permission, False otherwise
+    """
+    if not user.is_active:
+        return False
+    if user.is_superuser:
+        return True
+    bit = codename_bits.get(codename)
+    if bit is None or user.pk is None:
+        return False
+    community_id = getattr(community, 'pk', community)
+    return bool(get_permission_matrix(user).get(community_id, 0) & bit)
+
+
+def get_community_perms(user, community):
+    """Get the row-level permissions a user has on a community
+
+    :param user: User object
+    :param community: Community object or id
+    :return: set of string codenames
+    """
+    community_id = getattr(community, 'pk', community)
+    bits = get_permission_matrix(user).get(community_id, 0)
+    return set(codename for codename, bit in codename_bits.items()
+               if bits & bit)
+
+
+def invalidate_permission_matrices(user_ids):
+    """Drop the cached permissions matrices of users, they are rebuilt on
+    next use
+
+    :param user_ids: iterable of integer User ids
+    """
+    cache.delete_many([MATRIX_KEY.format(user_id) for user_id in user_ids])
+
+
+def invalidate_groups_permission_matrices(group_ids):
+    """Invalidate the cached permissions matrices of the users of groups by
+    bumping the versions of the groups, without querying the users.
+    Row-level permissions granted in bulk or removed from groups outside of
+    community.utils require calling it.
+
+    :param group_ids: iterable of integer Group ids
+    """
+    bump_versions(GROUP_VERSION_KEY.format(group_id)
+                  for group_id in group_ids)
+
+
+class PermissionMatrixBackend(ObjectPermissionBackend):
+    """Authentication backend checking the row-level permissions of the role
+    templates on communities against the permissions matrix of the user.
+    Other permissions and objects are checked by the guardian backend it
+    replaces in AUTHENTICATION_BACKENDS.
+    """
+    def has_perm(self, user_obj, perm, obj=None):
+        """Check if a user has a row-level permission on an object
+
+        :param user_obj: User object
+        :param perm: string codename, optionally prefixed by the app label
+        :param obj: model instance
+        :return: True if user has the permission, False otherwise
+        """
+        if isinstance(obj, Community) and obj.pk is not None and \
+                user_obj.is_authenticated():
+            app_label, _, codename = perm.rpartition('.')
+            if codename in codename_bits and \
+                    app_label in ("", Community._meta.app_label):
+                return has_community_perm(user_obj, codename, obj)
+        return super(PermissionMatrixBackend, self).has_perm(user_obj, perm,
+                                                             obj)
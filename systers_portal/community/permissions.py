@@ -45,3 +45,13 @@ group_permissions = {
     "user_content_manager": user_content_manager_permissions,
     "community_admin": community_admin_permissions
 }
+
+
+def is_global_permission(codename):
+    """Check if a permission codename is assigned globally to a group rather
+    than per community object
+
+    :param codename: string permission codename
+    :return: True for tag and resource type permissions, False otherwise
+    """
+    return codename.endswith('tag') or codename.endswith('resourcetype')
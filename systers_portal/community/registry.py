@@ -0,0 +1,63 @@
+from django.contrib.auth.models import Permission
+
+from community.permissions import group_permissions
+
+
+# Process-wide cache of role template permissions keyed by codename
+_permissions = {}
+
+
+def _load_permissions(codenames):
+    """Fetch permissions along with their content types in a single query
+
+    :param codenames: iterable of string permission codenames
+    :return: dict mapping codenames to Permission objects
+    """
+    return dict(
+        (permission.codename, permission) for permission in
+        Permission.objects.select_related('content_type').filter(
+            codename__in=codenames,
+            content_type__app_label__in=['community', 'blog']))
+
+
+def get_permissions(codenames=None):
+    """Get Permission objects by codename. The registry is warmed on first use
+    with all the codenames used by role templates, further lookups of those do
+    not hit the database.
+
+    :param codenames: iterable of string permission codenames, all role
+                      template codenames if None
+    :return: dict mapping codenames to Permission objects
+    """
+    if not _permissions:
+        codenames_set = set()
+        for perms in group_permissions.values():
+            codenames_set.update(perms)
+        _permissions.update(_load_permissions(codenames_set))
+    if codenames is None:
+        return dict(_permissions)
+    codenames = set(codenames)
+    missing = codenames.difference(_permissions)
+    if missing:
+        _permissions.update(_load_permissions(missing))
+    return dict((codename, _permissions[codename]) for codename in codenames
+                if codename in _permissions)
+
+
+def get_permission(codename):
+    """Get a Permission object by codename
+
+    :param codename: string permission codename
+    :return: Permission object
+    :raises Permission.DoesNotExist: if there is no permission with codename
+    """
+    try:
+        return get_permissions([codename])[codename]
+    except KeyError:
+        raise Permission.DoesNotExist(
+            "Permission {0} does not exist".format(codename))
+
+
+def clear_permissions():
+    """Empty the registry, the next lookup reloads the permissions"""
+    _permissions.clear()
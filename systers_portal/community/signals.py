@@ -1,42 +1,167 @@
-from django.contrib.auth.models import Group
-from django.db.models.signals import post_save, post_delete
+from django.contrib.auth.models import User
+from django.db.models.signals import (post_save, pre_delete, post_delete,
+                                      post_migrate, m2m_changed)
 from django.dispatch import receiver
-from django.shortcuts import get_object_or_404
+from guardian.models import GroupObjectPermission, UserObjectPermission
 
-from community.constants import COMMUNITY_ADMIN
-from community.models import Community
-from community.utils import (create_groups, assign_permissions, remove_groups,
-                             rename_groups)
+from common.search import update_search_document, remove_search_document
+from community.models import Community, CommunityPage, JoinRequest
+from community.permission_matrix import (
+    invalidate_permission_matrices, invalidate_groups_permission_matrices)
+from community.registry import clear_permissions
+from community.utils import (provision_communities, remove_groups,
+                             rename_groups, get_counter_field,
+                             increment_counter, update_counters, update_tree)
+from users.cache import invalidate_profiles
 
 
 @receiver(post_save, sender=Community, dispatch_uid="manage_groups")
 def manage_community_groups(sender, instance, created, **kwargs):
     """Manage user groups and user permissions for a particular Community"""
-    name = instance.name
     if created:
-        groups = create_groups(name)
-        assign_permissions(instance, groups)
-        community_admin_group = next(
-            g for g in groups if g.name == COMMUNITY_ADMIN.format(name))
-        instance.community_admin.join_group(community_admin_group)
-        instance.add_member(instance.community_admin)
-        instance.save()
+        provision_communities([instance])
     else:
-        if name != instance.original_name and instance.original_name:
-            rename_groups(instance.original_name, instance.name)
-        if instance.community_admin != instance.original_community_admin and \
+        if instance.has_changed_name() and instance.original_name:
+            rename_groups([instance])
+        if instance.has_changed_community_admin() and \
            instance.original_community_admin is not None:
-            community_admin_group = \
-                get_object_or_404(Group, name=COMMUNITY_ADMIN.format(name))
+            community_admin_group = instance.get_group("community_admin")
             instance.original_community_admin.leave_group(
                 community_admin_group)
             instance.community_admin.join_group(community_admin_group)
-            if instance.community_admin not in instance.members.all():
+            if not instance.is_member(instance.community_admin):
                 instance.add_member(instance.community_admin)
-                instance.save()
 
 
-@receiver(post_delete, sender=Community, dispatch_uid="remove_groups")
+@receiver(post_save, sender=Community, dispatch_uid="update_tree")
+def update_community_tree(sender, instance, created, **kwargs):
+    """Maintain the tree path of new and reparented communities"""
+    if created or instance.has_changed('parent_community_id'):
+        update_tree(instance)
+
+
+@receiver(pre_delete, sender=Community, dispatch_uid="remove_groups")
 def remove_community_groups(sender, instance, **kwargs):
-    """Remove user groups for a particular Community"""
-    remove_groups(instance.name)
+    """Remove user groups and row-level permissions for a particular
+    Community. Runs before deletion, while groups are still linked to it."""
+    remove_groups([instance])
+
+
+@receiver(m2m_changed, sender=Community.members.through,
+          dispatch_uid="count_members")
+def count_community_members(sender, instance, action, reverse, pk_set,
+                            **kwargs):
+    """Keep Community member_count up to date. Added members are counted
+    incrementally, after removals the affected counters are recomputed."""
+    if reverse:
+        if action == "pre_clear":
+            instance._cleared_community_ids = list(
+                instance.communities.values_list('pk', flat=True))
+        elif action == "post_clear":
+            update_counters(instance._cleared_community_ids, ["member_count"])
+        elif action == "post_add" and pk_set:
+            increment_counter(pk_set, "member_count")
+        elif action == "post_remove":
+            update_counters(pk_set, ["member_count"])
+    else:
+        if action == "post_add" and pk_set:
+            increment_counter([instance.pk], "member_count", len(pk_set))
+        elif action in ("post_remove", "post_clear"):
+            update_counters([instance.pk], ["member_count"])
+
+
+@receiver(m2m_changed, sender=Community.members.through,
+          dispatch_uid="invalidate_members_profile")
+def invalidate_members_profile(sender, instance, action, reverse, pk_set,
+                               **kwargs):
+    """Invalidate cached profile panels of users joining or leaving
+    communities"""
+    if reverse:
+        systers_user_ids = [instance.pk]
+    elif action == "pre_clear":
+        instance._cleared_member_ids = list(
+            instance.members.values_list('pk', flat=True))
+        return
+    elif action == "post_clear":
+        systers_user_ids = instance._cleared_member_ids
+    else:
+        systers_user_ids = pk_set
+    if action in ("post_add", "post_remove", "post_clear"):
+        invalidate_profiles(systers_user_ids)
+
+
+@receiver(post_save, sender=JoinRequest, dispatch_uid="invalidate_request")
+@receiver(post_delete, sender=JoinRequest,
+          dispatch_uid="invalidate_deleted_request")
+def invalidate_join_request_profile(sender, instance, **kwargs):
+    """Invalidate cached profile panels of a user whose join request changed
+    """
+    invalidate_profiles([instance.user_id])
+
+
+@receiver(post_save, sender=CommunityPage, dispatch_uid="count_pages_save")
+def count_content_on_save(sender, instance, created, **kwargs):
+    """Update Community counters on new content or content moved to another
+    community"""
+    field = get_counter_field(sender)
+    if created:
+        increment_counter([instance.community_id], field)
+    elif instance.has_changed('community_id'):
+        update_counters([instance.get_original_value('community_id'),
+                         instance.community_id], [field])
+
+
+@receiver(post_delete, sender=CommunityPage, dispatch_uid="count_pages_delete")
+def count_content_on_delete(sender, instance, **kwargs):
+    """Update Community counters on content removal"""
+    increment_counter([instance.community_id], get_counter_field(sender), -1)
+
+
+post_save.connect(update_search_document, sender=CommunityPage,
+                  dispatch_uid="index_communitypage_save")
+post_delete.connect(remove_search_document, sender=CommunityPage,
+                    dispatch_uid="index_communitypage_delete")
+
+
+@receiver(m2m_changed, sender=User.groups.through,
+          dispatch_uid="invalidate_groups_permissions")
+def invalidate_groups_permissions(sender, instance, action, reverse, pk_set,
+                                  **kwargs):
+    """Invalidate permissions matrices of users joining or leaving groups"""
+    if not reverse:
+        user_ids = [instance.pk]
+    elif action == "pre_clear":
+        instance._cleared_permission_user_ids = list(
+            instance.user_set.values_list('pk', flat=True))
+        return
+    elif action == "post_clear":
+        user_ids = instance._cleared_permission_user_ids
+    else:
+        user_ids = pk_set
+    if action in ("post_add", "post_remove", "post_clear"):
+        invalidate_permission_matrices(user_ids)
+
+
+@receiver(post_save, sender=UserObjectPermission,
+          dispatch_uid="invalidate_user_permissions_save")
+@receiver(post_delete, sender=UserObjectPermission,
+          dispatch_uid="invalidate_user_permissions_delete")
+def invalidate_user_object_permissions(sender, instance, **kwargs):
+    """Invalidate permissions matrix of a user whose row-level permissions
+    changed"""
+    invalidate_permission_matrices([instance.user_id])
+
+
+@receiver(post_save, sender=GroupObjectPermission,
+          dispatch_uid="invalidate_group_permissions_save")
+def invalidate_group_object_permissions(sender, instance, **kwargs):
+    """Invalidate permissions matrices of the users of a group granted a
+    row-level permission. Only the group version is bumped. Deletions aren't
+    listened to, which keeps them fast."""
+    invalidate_groups_permission_matrices([instance.group_id])
+
+
+@receiver(post_migrate, dispatch_uid="clear_permission_registry")
+def clear_permission_registry(sender, **kwargs):
+    """Invalidate cached permissions, migrations may add or remove them"""
+    clear_permissions()
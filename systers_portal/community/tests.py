@@ -1,14 +1,37 @@
+import tempfile
+from StringIO import StringIO
+
+from django.apps import apps
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.core.management.base import CommandError
 from django.test import TestCase
-from django.contrib.auth.models import Group, User
-from django.db.models.signals import post_save, post_delete
-from guardian.shortcuts import get_perms
+from django.contrib.auth.models import Group, Permission, User
+from django.core.cache import cache
+from django.db import connection
+from django.db.models.signals import post_save, pre_delete, post_migrate
+from django.test.utils import CaptureQueriesContext, override_settings
+from guardian.models import GroupObjectPermission, UserObjectPermission
+from guardian.shortcuts import assign_perm, get_perms, remove_perm
 
+from community.backends import RoleTemplateBackend
 from community.constants import COMMUNITY_ADMIN
-from community.models import Community
+from blog.models import News, Resource
+from common.pagination import encode_cursor
+from community.models import (Community, CommunityGroup, CommunityPage,
+                              JoinRequest)
+from community.permission_matrix import (
+    has_community_perm, get_community_perms, codename_bits,
+    get_templates_hash, invalidate_groups_permission_matrices,
+    PermissionMatrixBackend)
 from community.permissions import groups_templates, group_permissions
+from community.registry import (get_permission, get_permissions,
+                                clear_permissions)
 from community.signals import manage_community_groups, remove_community_groups
 from community.utils import (create_groups, assign_permissions, remove_groups,
-                             rename_groups)
+                             rename_groups, provision_communities,
+                             update_counters, rebuild_tree,
+                             approve_join_requests, assign_roles)
 from users.models import SystersUser
 
 
@@ -16,8 +39,8 @@ class CommunityTestCase(TestCase):
     def setUp(self):
         post_save.disconnect(manage_community_groups, sender=Community,
                              dispatch_uid="manage_groups")
-        post_delete.disconnect(remove_community_groups, sender=Community,
-                               dispatch_uid="remove_groups")
+        pre_delete.disconnect(remove_community_groups, sender=Community,
+                              dispatch_uid="remove_groups")
 
     def test_original_values(self):
         """Test original community name and admin functioning"""
@@ -60,6 +83,23 @@ class CommunityTestCase(TestCase):
         community.save()
         self.assertTrue(community.has_changed_community_admin())
 
+    def test_queryset_iteration_queries(self):
+        """Test loading communities does not fetch their admins"""
+        User.objects.create(username='foo', password='foobar')
+        systers_user = SystersUser.objects.get()
+        for i in range(5):
+            Community.objects.create(name="Foo{0}".format(i),
+                                     slug="foo{0}".format(i), order=i,
+                                     community_admin=systers_user)
+        with self.assertNumQueries(1):
+            communities = list(Community.objects.all())
+            for community in communities:
+                self.assertFalse(community.has_changed_name())
+                self.assertFalse(community.has_changed_community_admin())
+        community = Community.objects.only('slug').get(slug="foo0")
+        self.assertFalse(community.has_changed_name())
+        self.assertEqual(community.original_name, "Foo0")
+
     def test_manage_community_groups(self):
         """Test handling of operations required when saving a Community
         object"""
@@ -98,8 +138,8 @@ class CommunityTestCase(TestCase):
         """Test the removal of groups when a community is deleted"""
         post_save.connect(manage_community_groups, sender=Community,
                           dispatch_uid="manage_groups")
-        post_delete.connect(remove_community_groups, sender=Community,
-                            dispatch_uid="remove_groups")
+        pre_delete.connect(remove_community_groups, sender=Community,
+                           dispatch_uid="remove_groups")
         User.objects.create(username='foo', password='foobar')
         systers_user = SystersUser.objects.get()
         community = Community.objects.create(name="Foo", slug="foo", order=1,
@@ -109,6 +149,7 @@ class CommunityTestCase(TestCase):
         community.delete()
         groups_count = Group.objects.count()
         self.assertEqual(groups_count, 0)
+        self.assertEqual(GroupObjectPermission.objects.count(), 0)
 
     def test_add_remove_member(self):
         """Test adding and removing Community members"""
@@ -124,8 +165,343 @@ class CommunityTestCase(TestCase):
         community.save()
         self.assertQuerysetEqual(community.members.all(), [])
 
+    def test_membership(self):
+        """Test checking, adding and removing many Community members"""
+        users = [User.objects.create(username='foo{0}'.format(i))
+                 for i in range(5)]
+        systers_users = list(SystersUser.objects.filter(user__in=users))
+        community = Community.objects.create(
+            name="Foo", slug="foo", order=1,
+            community_admin=systers_users[0])
+        with self.assertNumQueries(1):
+            self.assertFalse(community.is_member(systers_users[0]))
+        community.add_members(systers_users[:3])
+        with self.assertNumQueries(3):
+            community.add_members(systers_users)
+        self.assertItemsEqual(community.members.all(), systers_users)
+        self.assertTrue(community.is_member(systers_users[4]))
+        community.remove_members(systers_users[1:])
+        self.assertSequenceEqual(community.members.all(), systers_users[:1])
+        self.assertFalse(community.is_member(systers_users[4]))
+
+    def test_admin_transfer_queries(self):
+        """Test transferring a Community does not load its members"""
+        post_save.connect(manage_community_groups, sender=Community,
+                          dispatch_uid="manage_groups")
+        users = [User.objects.create(username='foo{0}'.format(i))
+                 for i in range(10)]
+        systers_users = list(SystersUser.objects.filter(user__in=users))
+        community = Community.objects.create(
+            name="Foo", slug="foo", order=1,
+            community_admin=systers_users[0])
+        community.add_members(systers_users)
+        community = Community.objects.get()
+        community.community_admin = systers_users[1]
+        with CaptureQueriesContext(connection) as context:
+            community.save()
+        for query in context.captured_queries:
+            self.assertNotIn('INNER JOIN "community_community_members"',
+                             query['sql'])
+        self.assertEqual(users[1].groups.get(),
+                         community.get_group("community_admin"))
+        self.assertFalse(users[0].groups.exists())
+
+
+class JoinRequestTestCase(TestCase):
+    def setUp(self):
+        users = [User.objects.create(username='foo{0}'.format(i))
+                 for i in range(25)]
+        self.systers_users = list(SystersUser.objects.filter(user__in=users))
+        self.community = Community.objects.create(
+            name="Foo", slug="foo", order=1,
+            community_admin=self.systers_users[0])
+        self.requests = [JoinRequest.objects.create(user=systers_user,
+                                                    community=self.community)
+                         for systers_user in self.systers_users]
+
+    def test_pending_queue(self):
+        """Test keyset pagination of pending join requests"""
+        JoinRequest.objects.filter(pk__in=[r.pk for r in self.requests[5:10]]
+                                   ).update(is_approved=True)
+        # requests created at the same time are ordered by id
+        JoinRequest.objects.filter(pk__in=[r.pk for r in self.requests[:15]]
+                                   ).update(
+            date_created=self.requests[0].date_created)
+        queue = JoinRequest.objects.pending().filter(community=self.community)
+        expected = self.requests[:5] + self.requests[10:]
+        fetched = []
+        cursor = None
+        while True:
+            with self.assertNumQueries(1):
+                page = queue.get_queue(cursor, per_page=6)
+            fetched.extend(page)
+            if not page.has_next():
+                break
+            cursor = page.next_cursor
+        self.assertEqual(fetched, expected)
+        self.assertRaises(ValueError, queue.get_queue, "foo")
+        self.assertRaises(ValueError, queue.get_queue,
+                          encode_cursor(["x", 1]))
+
+    def test_approve_join_requests(self):
+        """Test approving many join requests at once"""
+        admin = self.systers_users[0]
+        other = Community.objects.create(name="Bar", slug="bar", order=2,
+                                         community_admin=admin)
+        requests = self.requests[1:4]
+        approved = self.requests[4]
+        JoinRequest.objects.filter(pk=approved.pk).update(is_approved=True)
+        other_request = JoinRequest.objects.create(
+            user=self.systers_users[5], community=other)
+        approved_ids = approve_join_requests(
+            self.community, requests + [approved, other_request], admin)
+        self.assertItemsEqual(approved_ids, [r.pk for r in requests])
+        self.assertItemsEqual(self.community.members.all(),
+                              self.systers_users[:4])
+        for join_request in JoinRequest.objects.filter(pk__in=approved_ids):
+            self.assertTrue(join_request.is_approved)
+            self.assertEqual(join_request.approved_by, admin)
+        self.assertFalse(JoinRequest.objects.get(
+            pk=other_request.pk).is_approved)
+        self.assertEqual(
+            Community.objects.get(pk=self.community.pk).member_count, 4)
+        self.assertEqual(
+            approve_join_requests(self.community, requests, admin), [])
+
+        approve_join_requests(self.community, [self.requests[5].pk], admin,
+                              role="content_contributor")
+        self.assertEqual(self.systers_users[5].user.groups.get(),
+                         self.community.get_group("content_contributor"))
+
+
+class CountersTestCase(TestCase):
+    def setUp(self):
+        post_save.connect(manage_community_groups, sender=Community,
+                          dispatch_uid="manage_groups")
+        users = [User.objects.create(username='foo{0}'.format(i))
+                 for i in range(4)]
+        self.systers_users = list(SystersUser.objects.filter(user__in=users))
+        self.community = Community.objects.create(
+            name="Foo", slug="foo", order=1,
+            community_admin=self.systers_users[0])
+        self.other = Community.objects.create(
+            name="Bar", slug="bar", order=2,
+            community_admin=self.systers_users[0])
+
+    def assertCounters(self, community, **counters):
+        community = Community.objects.get(pk=community.pk)
+        for field, value in counters.items():
+            self.assertEqual(getattr(community, field), value)
+
+    def test_member_count(self):
+        """Test member_count follows membership changes"""
+        self.assertCounters(self.community, member_count=1)
+        self.community.add_members(self.systers_users)
+        self.assertCounters(self.community, member_count=4)
+        self.community.remove_members(self.systers_users[2:] +
+                                      self.systers_users[2:])
+        self.assertCounters(self.community, member_count=2)
+        self.systers_users[1].communities.add(self.other)
+        self.assertCounters(self.other, member_count=2)
+        self.systers_users[1].communities.clear()
+        self.assertCounters(self.community, member_count=1)
+        self.assertCounters(self.other, member_count=1)
+        self.community.members.clear()
+        self.assertCounters(self.community, member_count=0)
+        self.community.name = "Baz"
+        self.community.save()
+        self.assertCounters(self.community, member_count=0)
+
+    def test_content_counts(self):
+        """Test news, resource and page counters follow content changes"""
+        author = self.systers_users[0]
+        news = News.objects.create(slug="news", title="News", author=author,
+                                   content="Foo", community=self.community)
+        Resource.objects.create(slug="resource", title="Resource",
+                                author=author, content="Foo",
+                                community=self.community)
+        page = CommunityPage.objects.create(slug="page", title="Page",
+                                            author=author, content="Foo",
+                                            community=self.community, order=1)
+        self.assertCounters(self.community, news_count=1, resource_count=1,
+                            page_count=1)
+        news.community = self.other
+        news.save()
+        self.assertCounters(self.community, news_count=0)
+        self.assertCounters(self.other, news_count=1)
+        news.save()
+        self.assertCounters(self.community, news_count=0)
+        self.assertCounters(self.other, news_count=1)
+        news.community = self.community
+        news.save()
+        self.assertCounters(self.community, news_count=1)
+        self.assertCounters(self.other, news_count=0)
+        news.delete()
+        self.assertCounters(self.community, news_count=0)
+        page.delete()
+        self.assertCounters(self.community, page_count=0)
+
+    def test_update_counters(self):
+        """Test repairing counters in bulk"""
+        self.community.add_members(self.systers_users)
+        Community.objects.update(member_count=10, news_count=3)
+        self.assertEqual(update_counters(), 2)
+        self.assertCounters(self.community, member_count=4, news_count=0)
+        self.assertCounters(self.other, member_count=1, news_count=0)
+        Community.objects.update(member_count=10)
+        call_command('update_community_counters', 'foo', stdout=StringIO())
+        self.assertCounters(self.community, member_count=4)
+        self.assertCounters(self.other, member_count=10)
+
+    def test_save_keeps_counters(self):
+        """Test saving communities doesn't overwrite counters and tree paths,
+        nor load deferred fields"""
+        self.community.add_members(self.systers_users)
+        community = Community(pk=self.community.pk, name="Baz", slug="baz",
+                              order=1, community_admin=self.systers_users[0])
+        community.save()
+        self.assertCounters(self.community, name="Baz", member_count=4,
+                            path=self.community.path)
+        self.assertFalse(community._state.adding)
+
+        community = Community.objects.only('name').get(pk=self.community.pk)
+        community.name = "Qux"
+        with CaptureQueriesContext(connection) as context:
+            community.save()
+        queries = [query['sql'] for query in context.captured_queries
+                   if query['sql'].startswith('UPDATE "community_community"')]
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn('"member_count"', queries[0])
+        self.assertNotIn('slug', community.__dict__)
+        self.assertCounters(self.community, name="Qux", slug="baz",
+                            member_count=4)
+
+        community = Community(name="New", slug="new", order=3,
+                              community_admin=self.systers_users[0])
+        community.pk = max(self.community.pk, self.other.pk) + 1
+        community.save()
+        self.assertCounters(community, member_count=1)
+
+
+class TreeTestCase(TestCase):
+    def setUp(self):
+        User.objects.create(username='foo', password='foobar')
+        self.systers_user = SystersUser.objects.get()
+        self.root = self.create_community("root", None)
+        self.child = self.create_community("child", self.root)
+        self.grandchild = self.create_community("grandchild", self.child)
+        self.other = self.create_community("other", None)
+
+    def create_community(self, slug, parent):
+        return Community.objects.create(
+            name=slug, slug=slug, order=Community.objects.count(),
+            community_admin=self.systers_user, parent_community=parent)
+
+    def test_paths(self):
+        """Test tree paths of new communities"""
+        self.assertEqual(self.root.path, "{0}/".format(self.root.pk))
+        self.assertEqual(self.grandchild.path, "{0}/{1}/{2}/".format(
+            self.root.pk, self.child.pk, self.grandchild.pk))
+        self.assertEqual(Community.objects.get(pk=self.grandchild.pk).depth,
+                         2)
+
+    def test_path_pattern_index(self):
+        """Test the tree path has an index usable by prefix lookups whatever
+        the collation"""
+        cursor = connection.cursor()
+        cursor.execute("SELECT indexdef FROM pg_indexes WHERE tablename = %s",
+                       [Community._meta.db_table])
+        self.assertIn("(path varchar_pattern_ops)",
+                      " ".join(row[0] for row in cursor.fetchall()))
+
+    def test_ancestors_descendants(self):
+        """Test getting ancestors and descendants in a single query"""
+        with self.assertNumQueries(1):
+            self.assertSequenceEqual(self.grandchild.get_ancestors(),
+                                     [self.root, self.child])
+        with self.assertNumQueries(1):
+            self.assertItemsEqual(self.root.get_descendants(),
+                                  [self.child, self.grandchild])
+        self.assertItemsEqual(self.child.get_descendants(include_self=True),
+                              [self.child, self.grandchild])
+        self.assertSequenceEqual(self.root.get_ancestors(), [])
+        news = News.objects.create(slug="news", title="News",
+                                   author=self.systers_user, content="Foo",
+                                   community=self.grandchild)
+        News.objects.create(slug="other", title="Other",
+                            author=self.systers_user, content="Foo",
+                            community=self.other)
+        with self.assertNumQueries(1):
+            subtree_news = list(News.objects.filter(
+                self.root.get_subtree_filter()))
+        self.assertEqual(subtree_news, [news])
+
+    def test_reparent(self):
+        """Test moving a subtree to another parent"""
+        child = Community.objects.get(pk=self.child.pk)
+        child.parent_community = self.other
+        child.save()
+        grandchild = Community.objects.get(pk=self.grandchild.pk)
+        self.assertEqual(grandchild.path, "{0}/{1}/{2}/".format(
+            self.other.pk, self.child.pk, self.grandchild.pk))
+        self.assertEqual(grandchild.depth, 2)
+        self.assertSequenceEqual(self.root.get_descendants(), [])
+        child.parent_community = None
+        child.save()
+        grandchild = Community.objects.get(pk=self.grandchild.pk)
+        self.assertEqual(grandchild.path, "{0}/{1}/".format(
+            self.child.pk, self.grandchild.pk))
+        self.assertEqual(grandchild.depth, 1)
+
+    def test_reparent_back(self):
+        """Test moving a community to another parent and back, saving the
+        same instance"""
+        child = Community.objects.get(pk=self.child.pk)
+        child.parent_community = self.other
+        child.save()
+        child.parent_community = self.root
+        child.save()
+        grandchild = Community.objects.get(pk=self.grandchild.pk)
+        self.assertEqual(grandchild.path, self.grandchild.path)
+        self.assertSequenceEqual(self.other.get_descendants(), [])
+        child.parent_community = None
+        child.save(update_fields=['parent_community'])
+        self.assertEqual(Community.objects.get(pk=self.child.pk).path,
+                         "{0}/".format(self.child.pk))
+
+    def test_cycle(self):
+        """Test a community can't become its own descendant"""
+        root = Community.objects.get(pk=self.root.pk)
+        root.parent_community = self.grandchild
+        self.assertRaises(ValidationError, root.clean)
+        root.parent_community = self.other
+        root.clean()
+        root.parent_community = self.grandchild
+        self.assertRaises(ValueError, root.save)
+        self.assertIsNone(Community.objects.get(
+            pk=self.root.pk).parent_community_id)
+
+    def test_rebuild_tree(self):
+        """Test rebuilding tree paths in bulk"""
+        Community.objects.update(path="", depth=0)
+        self.assertEqual(rebuild_tree(), 4)
+        grandchild = Community.objects.get(pk=self.grandchild.pk)
+        self.assertEqual(grandchild.path, self.grandchild.path)
+        self.assertEqual(grandchild.depth, 2)
+        self.assertEqual(rebuild_tree(), 0)
+        Community.objects.filter(pk=self.root.pk).update(path="")
+        call_command('rebuild_community_tree', stdout=StringIO())
+        self.assertEqual(Community.objects.get(pk=self.root.pk).path,
+                         self.root.path)
+
 
 class UtilsTestCase(TestCase):
+    def setUp(self):
+        post_save.connect(manage_community_groups, sender=Community,
+                          dispatch_uid="manage_groups")
+        pre_delete.connect(remove_community_groups, sender=Community,
+                           dispatch_uid="remove_groups")
+
     def test_create_groups(self):
         """Test the creation of groups according to a name"""
         name = "Foo"
@@ -142,31 +518,61 @@ class UtilsTestCase(TestCase):
         self.assertListEqual(list(community_groups), groups)
 
     def test_remove_groups(self):
-        """Test the removal of groups according to a name"""
-        name = "Foo"
-        create_groups(name)
-        remove_groups(name)
-        community_groups = Group.objects.filter(name__startswith=name)
-        self.assertEqual(list(community_groups), [])
+        """Test the removal of community groups and row-level permissions"""
+        User.objects.create(username='foo', password='foobar')
+        systers_user = SystersUser.objects.get()
+        foo = Community.objects.create(name="Foo", slug="foo", order=1,
+                                       community_admin=systers_user)
+        bar = Community.objects.create(name="Bar", slug="bar", order=2,
+                                       community_admin=systers_user)
+        group = Group.objects.create(name="Baz")
+        assign_perm("change_community", group, foo)
+        assign_perm("change_community", systers_user.user, foo)
+        remove_groups([foo])
+        self.assertEqual(Group.objects.filter(name__startswith="Foo").count(),
+                         0)
+        self.assertEqual(Group.objects.filter(name__startswith="Bar").count(),
+                         4)
+        self.assertFalse(GroupObjectPermission.objects.filter(
+            object_pk=foo.pk).exists())
+        self.assertFalse(UserObjectPermission.objects.filter(
+            object_pk=foo.pk).exists())
+        self.assertTrue(GroupObjectPermission.objects.filter(
+            object_pk=bar.pk).exists())
+        self.assertTrue(Group.objects.filter(name="Baz").exists())
 
     def test_rename_groups(self):
-        """Test the renaming of groups according to a new name"""
-        old_name = "Foo"
-        new_name = "Bar"
-        create_groups(old_name)
-        groups = rename_groups(old_name, new_name)
+        """Test the renaming of groups according to new community names"""
+        User.objects.create(username='foo', password='foobar')
+        systers_user = SystersUser.objects.get()
+        foo = Community.objects.create(name="Foo", slug="foo", order=1,
+                                       community_admin=systers_user)
+        baz = Community.objects.create(name="Baz", slug="baz", order=2,
+                                       community_admin=systers_user)
+        Community.objects.filter(pk=foo.pk).update(name="Bar")
+        Community.objects.filter(pk=baz.pk).update(name="Qux")
+        with CaptureQueriesContext(connection) as context:
+            groups = rename_groups([foo, baz])
+        statements = [query['sql'] for query in context.captured_queries
+                      if 'SAVEPOINT' not in query['sql']]
+        # a single UPDATE, then the lookup of the profiles to invalidate
+        self.assertEqual(len(statements), 2)
+        self.assertTrue(statements[0].startswith("UPDATE"))
         expected_group_names = []
         for key, group_name in groups_templates.items():
-            expected_group_names.append(group_name.format(new_name))
-        group_names = []
-        for group in groups:
-            group_names.append(group.name)
-        self.assertListEqual(expected_group_names, group_names)
+            expected_group_names.append(group_name.format("Bar"))
+            expected_group_names.append(group_name.format("Qux"))
+        group_names = [group.name for group in groups]
+        self.assertItemsEqual(expected_group_names, group_names)
 
-        community_groups = Group.objects.filter(name__startswith=new_name)
-        self.assertItemsEqual(community_groups, groups)
-        old_community_groups = Group.objects.filter(name__startswith=old_name)
+        old_community_groups = Group.objects.filter(name__startswith="Foo")
+        self.assertSequenceEqual(old_community_groups, [])
+        old_community_groups = Group.objects.filter(name__startswith="Baz")
         self.assertSequenceEqual(old_community_groups, [])
+        admin_group = Group.objects.get(
+            community_group__community=foo,
+            community_group__role="community_admin")
+        self.assertEqual(admin_group.name, COMMUNITY_ADMIN.format("Bar"))
 
     def test_assign_permissions(self):
         """Test assignment of permissions to community groups"""
@@ -183,3 +589,359 @@ class UtilsTestCase(TestCase):
                            list(group.permissions.all())]
             group_perms += get_perms(group, community)
             self.assertItemsEqual(group_perms, value)
+
+    def test_provision_communities(self):
+        """Test provisioning of groups, permissions and admins for several
+        communities at once"""
+        post_save.disconnect(manage_community_groups, sender=Community,
+                             dispatch_uid="manage_groups")
+        self.addCleanup(post_save.connect, manage_community_groups,
+                        sender=Community, dispatch_uid="manage_groups")
+        user = User.objects.create(username='foo', password='foobar')
+        systers_user = SystersUser.objects.get()
+        communities = [Community.objects.create(name="Foo{0}".format(i),
+                                                slug="foo{0}".format(i),
+                                                order=i,
+                                                community_admin=systers_user)
+                       for i in range(6)]
+        with CaptureQueriesContext(connection) as single:
+            provision_communities(communities[:1])
+        with CaptureQueriesContext(connection) as many:
+            groups = provision_communities(communities[1:])
+        self.assertEqual(len(single), len(many))
+        self.assertEqual(Group.objects.count(), 4 * len(communities))
+
+        for community in communities:
+            self.assertSequenceEqual(community.members.all(), [systers_user])
+            community_admin_group = Group.objects.get(
+                name=COMMUNITY_ADMIN.format(community.name))
+            self.assertIn(community_admin_group, user.groups.all())
+            for key, value in group_permissions.items():
+                group = Group.objects.get(
+                    name=groups_templates[key].format(community.name))
+                group_perms = [p.codename for p in group.permissions.all()]
+                group_perms += get_perms(group, community)
+                self.assertItemsEqual(group_perms, value)
+        self.assertItemsEqual(groups.keys(),
+                              [c.pk for c in communities[1:]])
+        for community in communities:
+            self.assertItemsEqual(
+                community.community_groups.values_list('role', flat=True),
+                groups_templates.keys())
+
+        # provisioning is idempotent
+        provision_communities(communities)
+        self.assertEqual(Group.objects.count(), 4 * len(communities))
+        self.assertEqual(user.groups.count(), len(communities))
+
+    def test_provision_same_name_communities(self):
+        """Test provisioning rejects communities sharing a name"""
+        post_save.disconnect(manage_community_groups, sender=Community,
+                             dispatch_uid="manage_groups")
+        self.addCleanup(post_save.connect, manage_community_groups,
+                        sender=Community, dispatch_uid="manage_groups")
+        User.objects.create(username='foo', password='foobar')
+        systers_user = SystersUser.objects.get()
+        communities = [Community.objects.create(name="Foo", slug=slug,
+                                                order=i,
+                                                community_admin=systers_user)
+                       for i, slug in enumerate(["foo", "bar", "baz"])]
+        self.assertRaisesMessage(ValueError, "Communities named Foo",
+                                 provision_communities, communities[:2])
+        self.assertEqual(Group.objects.count(), 0)
+        provision_communities(communities[:1])
+        self.assertRaises(ValueError, provision_communities, communities[1:])
+        self.assertEqual(Group.objects.count(), 4)
+        self.assertEqual(CommunityGroup.objects.get(
+            role="community_admin").community, communities[0])
+
+    def test_assign_roles(self):
+        """Test bulk assignment of community roles"""
+        users = [User.objects.create_user(username=str(i), password='b')
+                 for i in range(4)]
+        admin = SystersUser.objects.get(user=users[0])
+        foo = Community.objects.create(name="Foo", slug="foo", order=1,
+                                       community_admin=admin)
+        bar = Community.objects.create(name="Bar", slug="bar", order=2,
+                                       community_admin=admin)
+        users[1].groups.add(foo.get_group("content_manager"))
+        users[2].groups.add(bar.get_group("content_contributor"))
+        assignments = [(users[1].pk, foo.pk, "content_contributor"),
+                       (users[1].pk, bar.pk, "content_contributor"),
+                       (users[2].pk, foo.pk, "user_content_manager"),
+                       (users[3].pk, foo.pk, "content_contributor"),
+                       (users[3].pk, foo.pk, "content_manager")]
+        with CaptureQueriesContext(connection) as context:
+            self.assertEqual(assign_roles(assignments), (5, 1))
+        statements = [query['sql'] for query in context.captured_queries
+                      if 'SAVEPOINT' not in query['sql']]
+        self.assertEqual(len(statements), 6)
+        self.assertItemsEqual(users[1].groups.all(),
+                              [foo.get_group("content_contributor"),
+                               bar.get_group("content_contributor")])
+        # roles in communities that are not listed are left untouched
+        self.assertItemsEqual(users[2].groups.all(),
+                              [foo.get_group("user_content_manager"),
+                               bar.get_group("content_contributor")])
+        self.assertEqual(users[3].groups.count(), 2)
+        self.assertEqual(assign_roles(assignments), (0, 0))
+        self.assertEqual(assign_roles([(users[3].pk, foo.pk, None)]), (0, 2))
+        self.assertFalse(users[3].groups.exists())
+        self.assertRaises(ValueError, assign_roles,
+                          [(users[3].pk, foo.pk, "foo")])
+
+    def test_assign_community_roles_command(self):
+        """Test assign_community_roles management command"""
+        user = User.objects.create_user(username='foo', password='foobar')
+        User.objects.create_user(username='bar', password='foobar')
+        community = Community.objects.create(
+            name="Foo", slug="foo", order=1,
+            community_admin=SystersUser.objects.get(user=user))
+        with tempfile.NamedTemporaryFile() as csv_file:
+            csv_file.write("bar,foo,content_manager\n\nbar,foo,"
+                           "content_contributor\n")
+            csv_file.flush()
+            stdout = StringIO()
+            call_command('assign_community_roles', csv_file.name,
+                         stdout=stdout)
+        self.assertIn("Added 2 and removed 0", stdout.getvalue())
+        self.assertEqual(User.objects.get(username='bar').groups.filter(
+            community_group__community=community).count(), 2)
+        with tempfile.NamedTemporaryFile() as csv_file:
+            csv_file.write("baz,foo,content_manager\n")
+            csv_file.flush()
+            self.assertRaises(CommandError, call_command,
+                              'assign_community_roles', csv_file.name)
+
+
+class RegistryTestCase(TestCase):
+    def setUp(self):
+        clear_permissions()
+
+    def test_get_permissions(self):
+        """Test lazy warming of the permission registry"""
+        with self.assertNumQueries(1):
+            permissions = get_permissions()
+        codenames = set()
+        for perms in group_permissions.values():
+            codenames.update(perms)
+        self.assertItemsEqual(permissions.keys(), codenames)
+        with self.assertNumQueries(0):
+            permission = get_permission('change_community')
+            self.assertEqual(permission.content_type.model, 'community')
+        with self.assertNumQueries(1):
+            self.assertEqual(get_permission('add_community').codename,
+                             'add_community')
+        with self.assertNumQueries(0):
+            get_permission('add_community')
+        with self.assertNumQueries(1):
+            self.assertRaises(Permission.DoesNotExist, get_permission, 'foo')
+
+    def test_clear_on_post_migrate(self):
+        """Test invalidation of the permission registry on post_migrate"""
+        get_permissions()
+        app_config = apps.get_app_config('community')
+        post_migrate.send(sender=app_config, app_config=app_config,
+                          verbosity=0, interactive=False, using='default')
+        with self.assertNumQueries(1):
+            get_permissions()
+
+    def test_provisioning_uses_registry(self):
+        """Test community creation does not query auth_permission once the
+        registry is warm"""
+        User.objects.create(username='foo', password='foobar')
+        systers_user = SystersUser.objects.get()
+        Community.objects.create(name="Foo", slug="foo", order=1,
+                                 community_admin=systers_user)
+        with CaptureQueriesContext(connection) as context:
+            Community.objects.create(name="Bar", slug="bar", order=2,
+                                     community_admin=systers_user)
+        for query in context.captured_queries:
+            self.assertNotIn('FROM "auth_permission"', query['sql'])
+
+
+class PermissionMatrixTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='foo', password='foobar')
+        self.systers_user = SystersUser.objects.get(user=self.user)
+        self.community = Community.objects.create(
+            name="Foo", slug="foo", order=1, community_admin=self.systers_user)
+        self.other = Community.objects.create(
+            name="Bar", slug="bar", order=2, community_admin=self.systers_user)
+
+    def test_matrix_matches_guardian(self):
+        """Test permissions matrix agrees with guardian permissions"""
+        member = User.objects.create_user(username='bar', password='foobar')
+        self.community.get_group("content_manager").user_set.add(member)
+        assign_perm("approve_community_joinrequest", member, self.other)
+        for user in (self.user, member):
+            for community in (self.community, self.other):
+                user = User.objects.get(pk=user.pk)
+                expected = set(perm for perm in get_perms(user, community)
+                               if perm in codename_bits)
+                self.assertEqual(get_community_perms(user, community),
+                                 expected)
+
+    def test_has_community_perm_queries(self):
+        """Test permissions checks hit the database once per user"""
+        get_permissions()
+        with self.assertNumQueries(3):
+            self.assertTrue(has_community_perm(
+                self.user, "change_community", self.community))
+        with self.assertNumQueries(0):
+            self.assertTrue(has_community_perm(
+                self.user, "add_community_news", self.other))
+            self.assertFalse(has_community_perm(
+                self.user, "delete_community", self.community))
+        # matrix is shared through the cache by other User instances
+        user = User.objects.get(pk=self.user.pk)
+        with self.assertNumQueries(0):
+            self.assertTrue(has_community_perm(user, "change_community",
+                                               self.community))
+        self.user.is_active = False
+        self.assertFalse(has_community_perm(self.user, "change_community",
+                                            self.community))
+
+    def test_invalidation(self):
+        """Test permissions matrix invalidation on permissions changes"""
+        member = User.objects.create_user(username='bar', password='foobar')
+        group = self.community.get_group("content_contributor")
+
+        def has_perm(codename, community=self.community):
+            return has_community_perm(User.objects.get(pk=member.pk),
+                                      codename, community)
+
+        self.assertFalse(has_perm("add_community_news"))
+        member.groups.add(group)
+        self.assertTrue(has_perm("add_community_news"))
+        group.user_set.remove(member)
+        self.assertFalse(has_perm("add_community_news"))
+        group.user_set.add(member)
+        self.assertTrue(has_perm("add_community_news"))
+        group.user_set.clear()
+        self.assertFalse(has_perm("add_community_news"))
+
+        assign_perm("change_community", member, self.other)
+        self.assertTrue(has_perm("change_community", self.other))
+        remove_perm("change_community", member, self.other)
+        self.assertFalse(has_perm("change_community", self.other))
+
+        member.groups.add(group)
+        self.assertFalse(has_perm("change_community"))
+        assign_perm("change_community", group, self.community)
+        self.assertTrue(has_perm("change_community"))
+        remove_perm("change_community", group, self.community)
+        invalidate_groups_permission_matrices([group.pk])
+        self.assertFalse(has_perm("change_community"))
+
+    def test_templates_hash(self):
+        """Test moving a permission between roles changes the matrix keys"""
+        templates = {'a': ["add_community_news"], 'b': ["change_community"]}
+        moved = {'a': [], 'b': ["change_community", "add_community_news"]}
+        self.assertNotEqual(get_templates_hash(templates),
+                            get_templates_hash(moved))
+        self.assertEqual(get_templates_hash(templates),
+                         get_templates_hash(dict(templates)))
+
+    def test_remove_groups_invalidation(self):
+        """Test removing community groups invalidates the matrices of their
+        users with a number of queries independent of permissions rows"""
+        self.assertTrue(has_community_perm(self.user, "change_community",
+                                           self.community))
+        with CaptureQueriesContext(connection) as context:
+            remove_groups([self.community])
+        queries = [query['sql'] for query in context.captured_queries
+                   if 'SAVEPOINT' not in query['sql']]
+        self.assertEqual(len([sql for sql in queries if 'DELETE FROM "guardian'
+                              in sql]), 2)
+        self.assertEqual(len([sql for sql in queries
+                              if 'FROM "auth_user"' in sql]), 0)
+        self.assertFalse(has_community_perm(
+            User.objects.get(pk=self.user.pk), "change_community",
+            self.community))
+
+    def test_backend(self):
+        """Test PermissionMatrixBackend answers community permissions from
+        the matrix and others from guardian"""
+        member = User.objects.create_user(username='bar', password='foobar')
+        self.community.get_group("content_contributor").user_set.add(member)
+        assign_perm("community.delete_community", member, self.community)
+        backends = ['community.permission_matrix.PermissionMatrixBackend']
+        with self.settings(AUTHENTICATION_BACKENDS=backends):
+            member = User.objects.get(pk=member.pk)
+            self.assertTrue(member.has_perm("community.add_community_news",
+                                            self.community))
+            with self.assertNumQueries(0):
+                self.assertTrue(member.has_perm("add_community_news",
+                                                self.community))
+                self.assertFalse(member.has_perm("community.change_community",
+                                                 self.community))
+                self.assertFalse(member.has_perm(
+                    "community.add_community_news", self.other))
+                self.assertFalse(member.has_perm("community.change_community"))
+            self.assertTrue(member.has_perm("community.delete_community",
+                                            self.community))
+            self.assertFalse(member.has_perm("community.delete_community",
+                                             self.other))
+        self.assertFalse(PermissionMatrixBackend().has_perm(
+            member, "community.add_community_news", Community(name="Baz")))
+
+
+class RoleTemplateBackendTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.backend = RoleTemplateBackend()
+        self.users = [User.objects.create_user(username=str(i), password='b')
+                      for i in range(len(groups_templates) + 1)]
+        systers_user = SystersUser.objects.get(user=self.users[0])
+        self.community = Community.objects.create(
+            name="Foo", slug="foo", order=1, community_admin=systers_user)
+        self.other = Community.objects.create(
+            name="Bar", slug="bar", order=2, community_admin=systers_user)
+
+    def test_parity_with_guardian(self):
+        """Test permissions resolved from role templates are the same as the
+        ones assigned by assign_permissions"""
+        for user, role in zip(self.users[1:], sorted(groups_templates)):
+            user.groups.add(self.community.get_group(role))
+        for user in self.users:
+            for community in (self.community, self.other):
+                user = User.objects.get(pk=user.pk)
+                expected = set("community.{0}".format(perm) for perm in
+                               get_perms(user, community))
+                self.assertEqual(
+                    self.backend.get_all_permissions(user, community),
+                    expected)
+        user = User.objects.get(pk=self.users[0].pk)
+        with self.assertNumQueries(1):
+            self.assertTrue(self.backend.has_perm(user, "change_community",
+                                                  self.community))
+            self.assertTrue(self.backend.has_perm(
+                user, "community.add_community_news", self.other))
+            self.assertFalse(self.backend.has_perm(user, "change_community"))
+        user.is_active = False
+        self.assertFalse(self.backend.has_perm(user, "change_community",
+                                               self.community))
+
+    @override_settings(COMMUNITY_OBJECT_PERMISSIONS=False,
+                       AUTHENTICATION_BACKENDS=(
+                           'django.contrib.auth.backends.ModelBackend',
+                           'community.backends.RoleTemplateBackend'))
+    def test_without_object_permissions(self):
+        """Test communities are provisioned without row-level permissions
+        rows, which are resolved from role templates instead"""
+        systers_user = SystersUser.objects.get(user=self.users[1])
+        community = Community.objects.create(
+            name="Baz", slug="baz", order=3, community_admin=systers_user)
+        self.assertFalse(GroupObjectPermission.objects.filter(
+            object_pk=str(community.pk)).exists())
+        admin_group = community.get_group("community_admin")
+        self.assertTrue(admin_group.permissions.exists())
+        user = User.objects.get(pk=self.users[1].pk)
+        self.assertTrue(user.has_perm("community.change_community",
+                                      community))
+        self.assertTrue(has_community_perm(user, "change_community",
+                                           community))
+        self.assertFalse(user.has_perm("community.change_community",
+                                       self.community))
@@ -1,8 +1,196 @@
-from django.contrib.auth.models import Group, Permission
-from django.db import transaction
-from guardian.shortcuts import assign_perm
+from collections import Counter
 
-from community.permissions import groups_templates, group_permissions
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth.models import Group, User
+from django.contrib.contenttypes.models import ContentType
+from django.db import connection, transaction
+from django.db.models import F, Q
+from django.utils.encoding import force_text
+from guardian.models import GroupObjectPermission, UserObjectPermission
+
+from community.models import Community, CommunityGroup, JoinRequest
+from community.permission_matrix import (
+    invalidate_permission_matrices, invalidate_groups_permission_matrices)
+from community.permissions import (groups_templates, group_permissions,
+                                   is_global_permission)
+from community.registry import get_permissions
+from users.cache import invalidate_profiles
+from users.models import SystersUser
+
+
+# Community counter fields mapped to the counted models
+counted_models = {
+    "news_count": "blog.News",
+    "resource_count": "blog.Resource",
+    "page_count": "community.CommunityPage",
+}
+
+
+def get_counter_field(model):
+    """Get the Community counter field of a counted model
+
+    :param model: model class
+    :return: string counter field name, None if the model is not counted
+    """
+    label = "{0}.{1}".format(model._meta.app_label, model._meta.object_name)
+    for field, counted_model in counted_models.items():
+        if counted_model == label:
+            return field
+
+
+def increment_counter(community_ids, field, delta=1):
+    """Atomically increment a counter of Communities
+
+    :param community_ids: list of community ids
+    :param field: string counter field name
+    :param delta: integer to add to the counter, negative to decrement
+    """
+    Community.objects.filter(pk__in=community_ids).update(
+        **{field: F(field) + delta})
+
+
+def update_counters(community_ids=None, fields=None):
+    """Recompute Community counters from the counted tables with a single
+    UPDATE
+
+    :param community_ids: list of community ids, all communities if None
+    :param fields: list of counter field names, all counters if None
+    :return: number of updated communities
+    """
+    tables = {"member_count": (Community.members.through._meta.db_table,
+                               "community_id")}
+    for field, label in counted_models.items():
+        model = apps.get_model(label)
+        tables[field] = (model._meta.db_table,
+                         model._meta.get_field('community').column)
+    if fields is None:
+        fields = Community.counter_fields
+    qn = connection.ops.quote_name
+    community_table = qn(Community._meta.db_table)
+    assignments = [
+        "{field} = (SELECT COUNT(*) FROM {table} t "
+        "WHERE t.{column} = {community}.{id})".format(
+            field=qn(field), table=qn(tables[field][0]),
+            column=qn(tables[field][1]), community=community_table,
+            id=qn('id'))
+        for field in fields]
+    sql = "UPDATE {0} SET {1}".format(community_table, ", ".join(assignments))
+    params = []
+    if community_ids is not None:
+        community_ids = list(community_ids)
+        if not community_ids:
+            return 0
+        sql += " WHERE {0} IN ({1})".format(
+            qn('id'), ", ".join(["%s"] * len(community_ids)))
+        params = community_ids
+    cursor = connection.cursor()
+    cursor.execute(sql, params)
+    return cursor.rowcount
+
+
+def get_tree_path(community_id, parent_path=""):
+    """Build the materialised tree path of a Community
+
+    :param community_id: integer community id
+    :param parent_path: string tree path of the parent community
+    :return: string tree path
+    """
+    return "{0}{1}/".format(parent_path, community_id)
+
+
+@transaction.atomic
+def update_tree(community):
+    """Update the tree path of a Community after creation or reparenting,
+    moving the paths of all its subcommunities with a single UPDATE
+
+    :param community: saved Community object
+    :raises ValueError: if community would become its own descendant
+    """
+    ids = [community.pk]
+    if community.parent_community_id is not None:
+        ids.append(community.parent_community_id)
+    paths = dict(Community.objects.filter(pk__in=ids).values_list('pk',
+                                                                  'path'))
+    parent_path = paths.get(community.parent_community_id, "")
+    old_path = paths[community.pk]
+    new_path = get_tree_path(community.pk, parent_path)
+    if old_path and parent_path.startswith(old_path):
+        raise ValueError("A community can't be a subcommunity of itself or "
+                         "of its subcommunities.")
+    if new_path != old_path:
+        new_depth = new_path.count("/") - 1
+        if old_path:
+            qn = connection.ops.quote_name
+            cursor = connection.cursor()
+            cursor.execute(
+                "UPDATE {table} SET {path} = %s || SUBSTR({path}, %s), "
+                "{depth} = {depth} + %s WHERE {path} LIKE %s".format(
+                    table=qn(Community._meta.db_table), path=qn('path'),
+                    depth=qn('depth')),
+                [new_path, len(old_path) + 1,
+                 new_depth - (old_path.count("/") - 1), old_path + "%"])
+        else:
+            Community.objects.filter(pk=community.pk).update(path=new_path,
+                                                             depth=new_depth)
+        community.path = new_path
+        community.depth = new_depth
+
+
+@transaction.atomic
+def rebuild_tree():
+    """Recompute the tree paths of all Communities from their parents
+
+    :return: number of communities whose path changed
+    """
+    communities = dict(
+        (pk, (parent_id, path)) for pk, parent_id, path in
+        Community.objects.values_list('pk', 'parent_community_id', 'path'))
+    paths = {}
+
+    def build_path(pk, visited=()):
+        if pk not in paths:
+            parent_id = communities[pk][0]
+            if parent_id is None or parent_id in visited:
+                paths[pk] = get_tree_path(pk)
+            else:
+                paths[pk] = get_tree_path(pk, build_path(parent_id,
+                                                         visited + (pk,)))
+        return paths[pk]
+
+    changed = [(pk, build_path(pk)) for pk in communities
+               if build_path(pk) != communities[pk][1]]
+    if changed:
+        qn = connection.ops.quote_name
+        cursor = connection.cursor()
+        cursor.execute(
+            "UPDATE {table} SET {path} = v.path, {depth} = v.depth "
+            "FROM (VALUES {values}) AS v(id, path, depth) "
+            "WHERE {table}.{id} = v.id".format(
+                table=qn(Community._meta.db_table), path=qn('path'),
+                depth=qn('depth'), id=qn('id'),
+                values=", ".join(["(%s, %s, %s)"] * len(changed))),
+            [value for pk, path in changed
+             for value in (pk, path, path.count("/") - 1)])
+    return len(changed)
+
+
+def get_or_create_groups(group_names):
+    """Fetch the existing groups by name and bulk create the missing ones
+
+    :param group_names: list of string group names
+    :return: tuple (dict mapping names to Group objects, set of ids of the
+             groups that existed before the call)
+    """
+    groups = dict((group.name, group) for group in
+                  Group.objects.filter(name__in=group_names))
+    existing_ids = set(group.pk for group in groups.values())
+    missing = [name for name in group_names if name not in groups]
+    if missing:
+        Group.objects.bulk_create([Group(name=name) for name in missing])
+        groups.update((group.name, group) for group in
+                      Group.objects.filter(name__in=missing))
+    return groups, existing_ids
 
 
 @transaction.atomic
@@ -12,55 +200,331 @@ def create_groups(community_name):
     :param community_name: string name of community
     :return: list of community Group objects
     """
-    community_groups = []
-    for key, group_name in groups_templates.items():
-        group, created = Group.objects.get_or_create(
-            name=group_name.format(community_name))
-        community_groups.append(group)
-    return community_groups
+    group_names = [group_name.format(community_name) for group_name in
+                   groups_templates.values()]
+    groups, existing_ids = get_or_create_groups(group_names)
+    return [groups[name] for name in group_names]
+
+
+def invalidate_member_profiles(community_ids):
+    """Invalidate the cached profile panels, which show community and group
+    names, of the members of communities and of the users of their groups
+
+    :param community_ids: list of integer Community ids
+    """
+    invalidate_profiles(SystersUser.objects.filter(
+        Q(communities__in=community_ids) |
+        Q(user__groups__community_group__community__in=community_ids)
+    ).values_list('pk', flat=True).distinct())
 
 
 @transaction.atomic
-def remove_groups(community_name):
-    """Remove groups for a particular Community instance using its name
+def remove_groups(communities):
+    """Remove groups bound to Community instances along with all the row-level
+    permissions granted on the communities
 
-    :param community_name: string name of community
+    :param communities: iterable of Community objects
     """
-    name = "{0}:".format(community_name)
-    Group.objects.filter(name__startswith=name).delete()
+    community_ids = [community.pk for community in communities]
+    if not community_ids:
+        return
+    content_type = ContentType.objects.get_for_model(Community)
+    object_pks = [force_text(pk) for pk in community_ids]
+    group_ids = list(CommunityGroup.objects.filter(
+        community__in=community_ids).values_list('group_id', flat=True))
+    # the users of the groups are looked up before the groups are deleted
+    invalidate_groups_permission_matrices(group_ids)
+    invalidate_member_profiles(community_ids)
+    for model in (GroupObjectPermission, UserObjectPermission):
+        model.objects.filter(content_type=content_type,
+                             object_pk__in=object_pks).delete()
+    Group.objects.filter(pk__in=group_ids).delete()
 
 
 @transaction.atomic
-def rename_groups(old_community_name, new_community_name):
-    """Rename groups bound to a Community instance
+def rename_groups(communities):
+    """Rename groups bound to Community instances according to the current
+    names of the communities. All groups are renamed with a single UPDATE
+    joining them to their communities.
+
+    :param communities: iterable of Community objects
+    :return: QuerySet of the renamed Group objects
+    """
+    community_ids = [community.pk for community in communities]
+    if not community_ids:
+        return Group.objects.none()
+    qn = connection.ops.quote_name
+    cases = []
+    params = []
+    for key, group_name in groups_templates.items():
+        prefix, suffix = group_name.split("{0}")
+        cases.append("WHEN %s THEN %s || c.{0} || %s".format(qn('name')))
+        params.extend([key, prefix, suffix])
+    sql = ("UPDATE {group} SET {name} = "
+           "CASE cg.{role} {cases} ELSE {group}.{name} END "
+           "FROM {community_group} cg "
+           "INNER JOIN {community} c ON c.{id} = cg.{community_id} "
+           "WHERE {group}.{id} = cg.{group_id} "
+           "AND cg.{community_id} IN ({ids})").format(
+        group=qn(Group._meta.db_table),
+        community_group=qn(CommunityGroup._meta.db_table),
+        community=qn(Community._meta.db_table),
+        name=qn('name'), role=qn('role'), id=qn('id'),
+        community_id=qn('community_id'), group_id=qn('group_id'),
+        cases=" ".join(cases),
+        ids=", ".join(["%s"] * len(community_ids)))
+    cursor = connection.cursor()
+    cursor.execute(sql, params + community_ids)
+    invalidate_member_profiles(community_ids)
+    return Group.objects.filter(community_group__community__in=community_ids)
+
+
+def bulk_assign_permissions(community_groups, existing_group_ids=None):
+    """Assign permissions to the groups of several communities at once.
 
-    :param old_community_name: string old name of the community
-    :param new_community_name: string new name of the community
-    :return: list of community new Group objects
+    Codenames are resolved through the permission registry, global
+    permissions are inserted in one statement and row-level permissions in
+    another one. Row-level permissions are skipped when
+    COMMUNITY_OBJECT_PERMISSIONS is off.
+
+    :param community_groups: list of tuples (Community object, dict mapping
+                             groups_templates keys to Group objects)
+    :param existing_group_ids: ids of groups that may already hold some of
+                               the permissions, None if unknown
     """
-    name = "{0}:".format(old_community_name)
-    groups = Group.objects.filter(name__startswith=name)
-    new_community_groups = []
-    for group in groups:
-        old_name, group_name = group.name.rsplit(":", 1)
-        group.name = "{0}:{1}".format(new_community_name, group_name)
-        group.save()
-        new_community_groups.append(group)
-    return new_community_groups
+    permissions = get_permissions()
+    content_type = ContentType.objects.get_for_model(Community)
+    group_ids = [group.pk for community, role_groups in community_groups
+                 for group in role_groups.values()]
+    if existing_group_ids is None:
+        existing_group_ids = group_ids
+    else:
+        existing_group_ids = [pk for pk in group_ids
+                              if pk in existing_group_ids]
+
+    GroupPermission = Group.permissions.through
+    assigned_global = set()
+    assigned_object = set()
+    if existing_group_ids:
+        assigned_global = set(GroupPermission.objects.filter(
+            group_id__in=existing_group_ids).values_list('group_id',
+                                                         'permission_id'))
+        assigned_object = set(GroupObjectPermission.objects.filter(
+            group_id__in=existing_group_ids,
+            content_type=content_type).values_list('group_id',
+                                                   'permission_id',
+                                                   'object_pk'))
 
+    global_rows = []
+    object_rows = []
+    for community, role_groups in community_groups:
+        object_pk = force_text(community.pk)
+        for key, group in role_groups.items():
+            for perm in group_permissions[key]:
+                permission = permissions[perm]
+                if is_global_permission(perm):
+                    row = (group.pk, permission.pk)
+                    if row not in assigned_global:
+                        assigned_global.add(row)
+                        global_rows.append(GroupPermission(
+                            group_id=group.pk, permission_id=permission.pk))
+                elif settings.COMMUNITY_OBJECT_PERMISSIONS:
+                    row = (group.pk, permission.pk, object_pk)
+                    if row not in assigned_object:
+                        assigned_object.add(row)
+                        object_rows.append(GroupObjectPermission(
+                            group_id=group.pk, permission_id=permission.pk,
+                            content_type=content_type, object_pk=object_pk))
+    GroupPermission.objects.bulk_create(global_rows)
+    GroupObjectPermission.objects.bulk_create(object_rows)
+    if object_rows and existing_group_ids:
+        invalidate_groups_permission_matrices(existing_group_ids)
 
+
+@transaction.atomic
 def assign_permissions(community, groups):
     """Assign row-level permissions to community groups and community object
 
     :param community: Community object
     :param groups: list of Group objects
     """
-    for key, group_name in groups_templates.items():
-        group = next(
-            g for g in groups if g.name == group_name.format(community.name))
-        for perm in group_permissions[key]:
-            if perm.endswith('tag') or perm.endswith('resourcetype'):
-                group.permissions.add(Permission.objects.get(codename=perm))
-                group.save()
-            else:
-                assign_perm(perm, group, community)
+    groups_by_name = dict((group.name, group) for group in groups)
+    role_groups = dict(
+        (key, groups_by_name[group_name.format(community.name)])
+        for key, group_name in groups_templates.items())
+    bulk_assign_permissions([(community, role_groups)])
+
+
+@transaction.atomic
+def provision_communities(communities):
+    """Create the groups of new Communities, assign their permissions and make
+    the community admins members of the admin group and of the community.
+
+    The number of executed queries does not depend on the number of
+    communities, which makes it suitable for seeding many communities at once.
+
+    Groups are named after the communities, so communities sharing a name
+    with each other or with an already provisioned community are rejected.
+
+    :param communities: iterable of saved Community objects
+    :return: dict mapping community ids to lists of community Group objects
+    :raises ValueError: if community names are not unique
+    """
+    communities = list(communities)
+    if not communities:
+        return {}
+    names = Counter(community.name for community in communities)
+    group_names = [group_name.format(name) for name in names
+                   for group_name in groups_templates.values()]
+    duplicates = set(name for name, count in names.items() if count > 1)
+    duplicates.update(CommunityGroup.objects.filter(
+        group__name__in=group_names).exclude(
+        community__in=[community.pk for community in communities]
+    ).values_list('community__name', flat=True))
+    if duplicates:
+        raise ValueError(u"Communities named {0} already exist".format(
+            ", ".join(sorted(duplicates))))
+    groups, existing_ids = get_or_create_groups(group_names)
+    community_groups = [
+        (community, dict((key, groups[group_name.format(community.name)])
+                         for key, group_name in groups_templates.items()))
+        for community in communities]
+    bulk_assign_permissions(community_groups, existing_ids)
+
+    linked = set(CommunityGroup.objects.filter(
+        community__in=[community.pk for community in communities]
+    ).values_list('group_id', flat=True))
+    CommunityGroup.objects.bulk_create([
+        CommunityGroup(community_id=community.pk, group_id=group.pk, role=key)
+        for community, role_groups in community_groups
+        for key, group in role_groups.items() if group.pk not in linked])
+
+    admin_ids = set(community.community_admin_id for community in communities)
+    admin_user_ids = dict(SystersUser.objects.filter(
+        pk__in=admin_ids).values_list('pk', 'user_id'))
+
+    UserGroup = User.groups.through
+    admin_groups = [(admin_user_ids[community.community_admin_id],
+                     role_groups["community_admin"].pk)
+                    for community, role_groups in community_groups]
+    existing = set(UserGroup.objects.filter(
+        user_id__in=admin_user_ids.values(),
+        group_id__in=[group_id for user_id, group_id in admin_groups]
+    ).values_list('user_id', 'group_id'))
+    UserGroup.objects.bulk_create([
+        UserGroup(user_id=user_id, group_id=group_id)
+        for user_id, group_id in set(admin_groups) - existing])
+
+    Membership = Community.members.through
+    admin_memberships = set((community.pk, community.community_admin_id)
+                            for community in communities)
+    existing = set(Membership.objects.filter(
+        community_id__in=[community.pk for community in communities],
+        systersuser_id__in=admin_ids).values_list('community_id',
+                                                  'systersuser_id'))
+    Membership.objects.bulk_create([
+        Membership(community_id=community_id, systersuser_id=systersuser_id)
+        for community_id, systersuser_id in admin_memberships - existing])
+    update_counters([community.pk for community in communities],
+                    ["member_count"])
+    invalidate_profiles(admin_ids)
+    invalidate_permission_matrices(admin_user_ids.values())
+
+    return dict((community.pk, [role_groups[key] for key in groups_templates])
+                for community, role_groups in community_groups)
+
+
+@transaction.atomic
+def assign_roles(assignments):
+    """Set the roles of users in communities from (user, community, role)
+    triples. For every listed pair of user and community, the user is made a
+    member of exactly the groups of the listed roles. The triples are diffed
+    against the current group memberships and only the difference is inserted
+    and deleted, in a single transaction.
+
+    :param assignments: iterable of tuples (User id, Community id, role),
+                        where role is a groups_templates key, or None to
+                        remove all the roles of the user in the community
+    :return: tuple (number of added memberships, number of removed ones)
+    :raises ValueError: if a community has no group for a role
+    """
+    wanted = {}
+    for user_id, community_id, role in assignments:
+        roles = wanted.setdefault((user_id, community_id), set())
+        if role:
+            roles.add(role)
+    if not wanted:
+        return 0, 0
+    user_ids = set(user_id for user_id, community_id in wanted)
+    community_ids = set(community_id for user_id, community_id in wanted)
+    role_groups = {}
+    group_communities = {}
+    for community_id, role, group_id in CommunityGroup.objects.filter(
+            community__in=community_ids).values_list('community_id', 'role',
+                                                     'group_id'):
+        role_groups[community_id, role] = group_id
+        group_communities[group_id] = community_id
+    target = set()
+    for (user_id, community_id), roles in wanted.items():
+        for role in roles:
+            if (community_id, role) not in role_groups:
+                raise ValueError("Community {0} has no {1} group".format(
+                    community_id, role))
+            target.add((user_id, role_groups[community_id, role]))
+
+    UserGroup = User.groups.through
+    current = {}
+    for pk, user_id, group_id in UserGroup.objects.filter(
+            user_id__in=user_ids, group_id__in=group_communities
+    ).values_list('pk', 'user_id', 'group_id'):
+        current[user_id, group_id] = pk
+    added = target.difference(current)
+    removed = [row for row in current if row not in target and
+               (row[0], group_communities[row[1]]) in wanted]
+    UserGroup.objects.bulk_create([
+        UserGroup(user_id=user_id, group_id=group_id)
+        for user_id, group_id in added])
+    if removed:
+        UserGroup.objects.filter(
+            pk__in=[current[row] for row in removed]).delete()
+
+    changed = set(user_id for user_id, group_id in added)
+    changed.update(user_id for user_id, group_id in removed)
+    if changed:
+        invalidate_permission_matrices(changed)
+        invalidate_profiles(SystersUser.objects.filter(
+            user__in=changed).values_list('pk', flat=True))
+    return len(added), len(removed)
+
+
+@transaction.atomic
+def approve_join_requests(community, join_requests, approver, role=None):
+    """Approve pending requests to join a Community in bulk. Request rows are
+    locked, so concurrent approvers never approve the same request twice.
+
+    :param community: Community object
+    :param join_requests: iterable of JoinRequest objects or ids
+    :param approver: SystersUser object approving the requests
+    :param role: string groups_templates key of a group that the new members
+                 should join, None to only add them as members
+    :return: list of ids of the approved JoinRequest objects
+    """
+    request_ids = [getattr(join_request, 'pk', join_request)
+                   for join_request in join_requests]
+    if not request_ids:
+        return []
+    pending = list(JoinRequest.objects.select_for_update().filter(
+        pk__in=request_ids, community=community,
+        is_approved=False).values_list('pk', 'user_id'))
+    if not pending:
+        return []
+    approved_ids = [pk for pk, user_id in pending]
+    systers_user_ids = set(user_id for pk, user_id in pending)
+    JoinRequest.objects.filter(pk__in=approved_ids).update(
+        is_approved=True, approved_by=approver)
+    community.add_members(systers_user_ids)
+    if role is not None:
+        user_ids = SystersUser.objects.filter(
+            pk__in=systers_user_ids).values_list('user_id', flat=True)
+        community.get_group(role).user_set.add(*user_ids)
+    return approved_ids
@@ -74,7 +74,7 @@ TEMPLATE_CONTEXT_PROCESSORS = (
 AUTHENTICATION_BACKENDS = (
     'django.contrib.auth.backends.ModelBackend',
     'allauth.account.auth_backends.AuthenticationBackend',
-    'guardian.backends.ObjectPermissionBackend',
+    'community.permission_matrix.PermissionMatrixBackend',
 )
 
 ROOT_URLCONF = 'systers_portal.urls'
@@ -116,6 +116,12 @@ MEDIA_ROOT = os.path.join(BASE_DIR, "media")
 
 MEDIA_URL = "/media/"
 
+# Thumbnail sizes (width, height) of profile pictures, keyed by name
+PROFILE_PICTURE_THUMBNAIL_SIZES = {
+    "small": (64, 64),
+    "medium": (200, 200),
+}
+
 TEST_RUNNER = 'django_nose.NoseTestSuiteRunner'
 
 # Django-allauth settings
@@ -153,3 +159,20 @@ ANONYMOUS_USER_ID = None
 
 # Django Crispy Forms configuration
 CRISPY_TEMPLATE_PACK = 'bootstrap3'
+
+# Time in seconds the community permissions matrices of users stay in cache,
+# they are invalidated anyway on permissions changes
+PERMISSION_MATRIX_CACHE_TIMEOUT = 60 * 60
+
+# Time in seconds the rendered user profile panels stay in cache
+USER_PROFILE_CACHE_TIMEOUT = 60 * 60
+
+# Time in seconds rendered community feeds stay in cache, they are
+# invalidated anyway on content changes
+FEED_CACHE_TIMEOUT = 60 * 60 * 24
+
+# Whether to write the row-level permissions of community groups to the
+# guardian tables. They can be turned off once community.backends.
+# RoleTemplateBackend is in AUTHENTICATION_BACKENDS, which resolves them from
+# the community roles instead.
+COMMUNITY_OBJECT_PERMISSIONS = True
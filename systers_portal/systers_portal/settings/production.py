@@ -13,4 +13,14 @@ DATABASES = {
         'PORT': '5432',
     }
 }
+# Cached permissions, profile panels and feeds are invalidated by the process
+# handling the change, so the cache must be shared by all the processes.
+# Create the table with `python manage.py createcachetable`.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'portal_cache',
+    }
+}
+
 INTERNAL_IPS = ('127.0.0.1',)
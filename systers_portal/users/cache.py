@@ -0,0 +1,38 @@
+from common.cache import bump_versions, get_version
+
+
+PROFILE_VERSION_KEY = "users:profile:{0}:version"
+
+
+def get_profile_version(systers_user_id):
+    """Get the current version of the cached profile panels of a user
+
+    :param systers_user_id: integer SystersUser id
+    :return: integer version
+    """
+    return get_version(PROFILE_VERSION_KEY.format(systers_user_id))
+
+
+def invalidate_profiles(systers_user_ids):
+    """Invalidate the cached profile panels of users by bumping their
+    versions, stale entries are left to expire
+
+    :param systers_user_ids: iterable of integer SystersUser ids
+    """
+    bump_versions(PROFILE_VERSION_KEY.format(systers_user_id)
+                  for systers_user_id in systers_user_ids)
+
+
+def get_viewer_class(user, systers_user):
+    """Classify the viewer of a profile, the rendered panels depend only on
+    this class
+
+    :param user: User object viewing the profile
+    :param systers_user: SystersUser object of the profile owner
+    :return: string 'owner', 'superuser' or 'other'
+    """
+    if user.pk == systers_user.user_id:
+        return "owner"
+    if user.is_superuser:
+        return "superuser"
+    return "other"
@@ -0,0 +1,40 @@
+import time
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+from django.template import Context
+from django.template.loader import get_template
+
+from users.models import SystersUser
+
+
+class Command(BaseCommand):
+    args = '[username]'
+    help = ('Measure the time spent rendering the profile panel of a user, '
+            'the first user if none is given')
+    option_list = BaseCommand.option_list + (
+        make_option('--iterations', type='int', default=1000,
+                    help='Number of renders'),
+    )
+
+    def handle(self, *args, **options):
+        systers_users = SystersUser.objects.select_related('user')
+        if args:
+            systers_users = systers_users.filter(user__username=args[0])
+        systers_user = systers_users.order_by('pk').first()
+        if systers_user is None:
+            raise CommandError("No user to render the profile panel of")
+        template = get_template('users/snippets/profile.html')
+        context = Context({'systersuser': systers_user,
+                           'user': systers_user.user})
+        template.render(context)
+
+        iterations = options['iterations']
+        start = time.time()
+        for i in range(iterations):
+            template.render(context)
+        elapsed = time.time() - start
+        self.stdout.write(
+            "Rendered the profile panel {0} times in {1:.3f}s, "
+            "{2:.1f}us per render".format(iterations, elapsed,
+                                          elapsed / iterations * 1e6))
@@ -0,0 +1,92 @@
+import csv
+import sys
+import time
+from itertools import islice
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from community.models import Community
+from users.utils import bulk_create_users, parse_address_list
+
+
+class Command(BaseCommand):
+    args = '<file>'
+    help = ('Import users from a CSV file with an email column and optional '
+            'username, first_name and last_name columns, or from a mailing '
+            'list export with one "Name <email>" address per line. The file '
+            'is read from stdin if it is - or missing and processed in '
+            'chunks, users whose email is already taken are not created.')
+    option_list = BaseCommand.option_list + (
+        make_option('--format', choices=['csv', 'list'], default='csv',
+                    help='Format of the file, csv or list'),
+        make_option('--community', action='append', default=[],
+                    help='Slug of a community to add the users to, can be '
+                         'repeated'),
+        make_option('--chunk-size', type='int', default=1000,
+                    help='Number of users created per transaction'),
+    )
+
+    def handle(self, *args, **options):
+        if len(args) > 1:
+            raise CommandError("Expected a single file")
+        communities = list(Community.objects.filter(
+            slug__in=options['community']))
+        if len(communities) != len(set(options['community'])):
+            raise CommandError("Unknown communities: {0}".format(", ".join(
+                set(options['community']).difference(
+                    community.slug for community in communities))))
+        if not args or args[0] == '-':
+            self.import_users(sys.stdin, communities, options)
+        else:
+            with open(args[0], 'rb') as users_file:
+                self.import_users(users_file, communities, options)
+
+    def import_users(self, users_file, communities, options):
+        """Create the users of a file chunk by chunk, only one chunk is held
+        in memory at a time
+
+        :param users_file: file object
+        :param communities: list of Community objects to add the users to
+        :param options: dict of command options
+        """
+        if options['format'] == 'csv':
+            users = self.read_csv(users_file)
+        else:
+            users = parse_address_list(line.decode('utf-8')
+                                       for line in users_file)
+        start = time.time()
+        total = created = skipped = 0
+        while True:
+            chunk = list(islice(users, options['chunk_size']))
+            if not chunk:
+                break
+            systers_user_ids, chunk_created, chunk_skipped = \
+                bulk_create_users(chunk)
+            for community in communities:
+                community.add_members(systers_user_ids)
+            total += len(chunk)
+            created += chunk_created
+            skipped += chunk_skipped
+            elapsed = time.time() - start
+            self.stdout.write(
+                "Processed {0} users, created {1}, skipped {2} with invalid "
+                "emails, {3:.0f} users/s".format(
+                    total, created, skipped,
+                    total / elapsed if elapsed else 0))
+        self.stdout.write("Imported {0} users in {1:.1f}s".format(
+            created, time.time() - start))
+
+    def read_csv(self, users_file):
+        """Read users from the rows of a CSV file with a header
+
+        :param users_file: file object
+        :return: generator of dicts with unicode values
+        """
+        reader = csv.DictReader(users_file)
+        if 'email' not in (reader.fieldnames or []):
+            raise CommandError("The CSV file has no email column")
+        for row in reader:
+            if row['email']:
+                yield dict((key, (value or "").decode('utf-8').strip())
+                           for key, value in row.items() if key)
@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_user_search'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            "CREATE INDEX users_user_public_search ON auth_user USING gin "
+            "(to_tsvector('simple', username || ' ' || first_name || ' ' || "
+            "last_name))",
+            "DROP INDEX users_user_public_search"),
+    ]
@@ -0,0 +1,17 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0003_user_public_search'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            "CREATE INDEX users_user_email_lower ON auth_user (LOWER(email))",
+            "DROP INDEX users_user_email_lower"),
+    ]
@@ -1,14 +1,77 @@
+import re
+import sys
+
+from django.conf import settings
 from django.db import models
-from django.db.models.signals import post_save
+from django.db.models import Q
+from django.db.models.signals import post_save, m2m_changed
 from django.contrib.auth.models import User
 from django.dispatch import receiver
+from django_countries import countries
 from django_countries.fields import CountryField
 
+from common.metadata import get_field_descriptors
+from common.pagination import keyset_paginate
+from users.cache import invalidate_profiles
+from users.thumbnails import create_thumbnail, get_thumbnail_name
+
+
+# Text search documents of a User, matched by the users_user_search and
+# users_user_public_search GIN indexes. Columns are unqualified since the
+# users are filtered in a subquery. Emails are only searchable by staff.
+USER_SEARCH_VECTOR = ("to_tsvector('simple', username || ' ' || first_name "
+                      "|| ' ' || last_name || ' ' || email)")
+USER_PUBLIC_SEARCH_VECTOR = ("to_tsvector('simple', username || ' ' || "
+                             "first_name || ' ' || last_name)")
+
+
+class SystersUserQuerySet(models.QuerySet):
+    def search(self, query, include_email=False):
+        """Filter users matching every word of a query. A word matches the
+        users whose username, first name, last name or, if included, email
+        has a word starting with it, or whose country name starts with it.
+
+        :param query: string search query
+        :param include_email: boolean whether to match emails, which should
+                              only be searchable by staff
+        :return: QuerySet of SystersUser objects
+        """
+        vector = USER_SEARCH_VECTOR if include_email else \
+            USER_PUBLIC_SEARCH_VECTOR
+        queryset = self
+        for term in re.findall(r"[\w.@+-]*\w[\w.@+-]*", query, re.UNICODE):
+            tsquery = u"'{0}':*".format(term.lower())
+            # the subquery is sliced to keep PostgreSQL from merging it into
+            # the outer query, where it would walk the whole username index
+            # in order for words common among usernames of the same letter
+            matches = Q(user__in=User.objects.extra(
+                where=[vector + " @@ to_tsquery('simple', %s)"],
+                params=[tsquery]).values('pk')[:sys.maxsize])
+            codes = [code for code, name in countries
+                     if name.lower().startswith(term.lower())]
+            if codes:
+                matches |= Q(country__in=codes)
+            queryset = queryset.filter(matches)
+        return queryset
+
+    def get_directory(self, cursor=None, per_page=20):
+        """Get a page of users ordered by username, with their User objects
+
+        :param cursor: string cursor of the previous page, None for the first
+                       page
+        :param per_page: integer maximum number of users on the page
+        :return: KeysetPage object
+        :raises ValueError: if the cursor is malformed
+        """
+        return keyset_paginate(self.select_related('user'),
+                               ('user__username', 'id'), cursor, per_page)
+
 
 class SystersUser(models.Model):
     """Profile model to store additional information about a user"""
     user = models.OneToOneField(User)
-    country = CountryField(blank=True, null=True, verbose_name="Country")
+    country = CountryField(blank=True, null=True, db_index=True,
+                           verbose_name="Country")
     blog_url = models.URLField(max_length=255, blank=True, verbose_name="Blog")
     homepage_url = models.URLField(max_length=255, blank=True,
                                    verbose_name="Homepage")
@@ -17,6 +80,8 @@ class SystersUser(models.Model):
                                         null=True,
                                         verbose_name="Profile picture")
 
+    objects = SystersUserQuerySet.as_manager()
+
     def __unicode__(self):
         return unicode(self.user)
 
@@ -39,8 +104,8 @@ class SystersUser(models.Model):
 
         :return: list of tuples (fieldname, fieldvalue)
         """
-        return [(field.name, getattr(self, field.name)) for field in
-                SystersUser._meta.fields]
+        return [(descriptor.name, getattr(self, descriptor.name))
+                for descriptor in get_field_descriptors(SystersUser)]
 
 
 def user_unicode(self):
@@ -69,3 +134,54 @@ def create_systers_user(sender, instance, created, **kwargs):
         if instance is not None:
             systers_user = SystersUser(user=instance)
             systers_user.save()
+
+
+@receiver(post_save, sender=SystersUser, dispatch_uid="invalidate_profile")
+def invalidate_systers_user_profile(sender, instance, **kwargs):
+    """Invalidate cached profile panels of a changed SystersUser"""
+    invalidate_profiles([instance.pk])
+
+
+@receiver(post_save, sender=SystersUser, dispatch_uid="create_thumbnails")
+def create_profile_picture_thumbnails(sender, instance, **kwargs):
+    """Create the missing thumbnails of an uploaded profile picture, so that
+    profile views don't have to"""
+    picture = instance.profile_picture
+    if not picture:
+        return
+    for size_name in settings.PROFILE_PICTURE_THUMBNAIL_SIZES:
+        if not picture.storage.exists(get_thumbnail_name(picture.name,
+                                                         size_name)):
+            try:
+                create_thumbnail(picture, size_name)
+            except IOError:
+                # not an image or missing, served as is
+                return
+
+
+@receiver(post_save, sender=User, dispatch_uid="invalidate_user_profile")
+def invalidate_user_profile(sender, instance, created, **kwargs):
+    """Invalidate cached profile panels of a changed User"""
+    if not created:
+        invalidate_profiles(SystersUser.objects.filter(
+            user=instance).values_list('pk', flat=True))
+
+
+@receiver(m2m_changed, sender=User.groups.through,
+          dispatch_uid="invalidate_groups_profile")
+def invalidate_groups_profile(sender, instance, action, reverse, pk_set,
+                              **kwargs):
+    """Invalidate cached profile panels of users joining or leaving groups"""
+    if not reverse:
+        user_ids = [instance.pk]
+    elif action == "pre_clear":
+        instance._cleared_user_ids = list(
+            instance.user_set.values_list('pk', flat=True))
+        return
+    elif action == "post_clear":
+        user_ids = instance._cleared_user_ids
+    else:
+        user_ids = pk_set
+    if action in ("post_add", "post_remove", "post_clear") and user_ids:
+        invalidate_profiles(SystersUser.objects.filter(
+            user__in=user_ids).values_list('pk', flat=True))
@@ -0,0 +1,19 @@
+from django import template
+
+from users.thumbnails import get_thumbnail_url
+
+
+register = template.Library()
+
+
+@register.filter
+def thumbnail_url(image_file, size_name):
+    """Returns the URL of a thumbnail of an image, created if missing
+
+    :param image_file: FieldFile object of the original image
+    :param size_name: string key of PROFILE_PICTURE_THUMBNAIL_SIZES
+    :returns: string URL of the thumbnail, empty if there is no image
+    """
+    if not image_file:
+        return ""
+    return get_thumbnail_url(image_file, size_name)
@@ -1,9 +1,25 @@
+import os
+import shutil
+import tempfile
+from io import BytesIO
+from StringIO import StringIO
+
 from django.contrib.auth.models import User, Group
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.management import call_command
 from django.core.urlresolvers import reverse
+from django.db import connection
 from django.test import TestCase, Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from PIL import Image
 
+from common.pagination import encode_cursor
 from community.models import Community, JoinRequest
 from users.models import SystersUser
+from users.templatetags.thumbnails import thumbnail_url
+from users.thumbnails import get_thumbnail_name
+from users.utils import bulk_create_users, parse_address_list
 
 
 class SystersUserTestCase(TestCase):
@@ -39,6 +55,7 @@ class SystersUserTestCase(TestCase):
 
 class SystersUserViewsTestCase(TestCase):
     def setUp(self):
+        cache.clear()
         User.objects.create_user(username='foo', password='foobar')
         self.systers_user = SystersUser.objects.get()
         self.client = Client()
@@ -122,6 +139,185 @@ class SystersUserViewsTestCase(TestCase):
         response = self.client.get(user_url)
         self.assertContains(response, "Bar")
 
+    def test_user_view_queries(self):
+        """Test the number of queries of UserView does not depend on the
+        number of communities, join requests and groups of the user"""
+        self.client.login(username='foo', password='foobar')
+        user_url = reverse('user', kwargs={
+            'username': self.systers_user.user.username})
+        admin = User.objects.create_user(username='bar', password='foobar')
+        admin = SystersUser.objects.get(user=admin)
+
+        def add_membership(i):
+            community = Community.objects.create(
+                name="Foo{0}".format(i), slug="foo{0}".format(i), order=i,
+                community_admin=self.systers_user if i % 2 else admin)
+            community.add_member(self.systers_user)
+            other = Community.objects.create(
+                name="Bar{0}".format(i), slug="bar{0}".format(i),
+                order=-i - 1, community_admin=admin)
+            JoinRequest.objects.create(user=self.systers_user,
+                                       community=other)
+
+        add_membership(0)
+        with CaptureQueriesContext(connection) as small:
+            response = self.client.get(user_url)
+        self.assertContains(response, "Cancel request")
+        for i in range(1, 10):
+            add_membership(i)
+        with CaptureQueriesContext(connection) as large:
+            response = self.client.get(user_url)
+        self.assertContains(response, "Transfer ownership", count=5)
+        self.assertContains(response, "Cancel request", count=10)
+        self.assertEqual(len(small), len(large))
+        self.assertLessEqual(len(large), 6)
+
+    def test_user_view_cache(self):
+        """Test caching of UserView panels and their invalidation"""
+        self.client.login(username='foo', password='foobar')
+        user_url = reverse('user', kwargs={
+            'username': self.systers_user.user.username})
+        with CaptureQueriesContext(connection) as uncached:
+            self.client.get(user_url)
+        with CaptureQueriesContext(connection) as cached:
+            response = self.client.get(user_url)
+        self.assertLess(len(cached), len(uncached))
+        self.assertContains(response, "Edit profile")
+        self.assertContains(response, "Looks like you have no permissions.")
+
+        group = Group.objects.create(name="Bar")
+        self.systers_user.join_group(group)
+        response = self.client.get(user_url)
+        self.assertContains(response, "Bar")
+
+        new_user = User.objects.create_user(username='bar', password='foobar')
+        new_systers_user = SystersUser.objects.get(user=new_user)
+        community = Community.objects.create(name="Baz", slug="baz", order=1,
+                                             community_admin=new_systers_user)
+        response = self.client.get(user_url)
+        self.assertContains(response,
+                            "Looks like you are member of no community.")
+        join_request = JoinRequest.objects.create(user=self.systers_user,
+                                                  community=community)
+        response = self.client.get(user_url)
+        self.assertContains(response, "Cancel request")
+        join_request.delete()
+        community.add_member(self.systers_user)
+        response = self.client.get(user_url)
+        self.assertContains(response, "Leave")
+        community.members.clear()
+        response = self.client.get(user_url)
+        self.assertContains(response,
+                            "Looks like you are member of no community.")
+
+        self.systers_user.blog_url = "http://example.com/blog"
+        self.systers_user.save()
+        response = self.client.get(user_url)
+        self.assertContains(response, "http://example.com/blog")
+
+        # other viewers get their own version of the panels
+        self.client.login(username='bar', password='foobar')
+        response = self.client.get(user_url)
+        self.assertNotContains(response, "Edit profile")
+
+    def test_user_view_cache_community_changes(self):
+        """Test cached panels follow renamed and deleted communities"""
+        self.client.login(username='foo', password='foobar')
+        user_url = reverse('user', kwargs={
+            'username': self.systers_user.user.username})
+        community = Community.objects.create(
+            name="Baz", slug="baz", order=1, community_admin=self.systers_user)
+        self.assertContains(self.client.get(user_url), "Baz")
+        community = Community.objects.get(pk=community.pk)
+        community.name = "Qux"
+        community.save()
+        response = self.client.get(user_url)
+        self.assertContains(response, "Qux")
+        self.assertNotContains(response, "Baz")
+        community.delete()
+        self.assertNotContains(self.client.get(user_url), "Qux")
+
+
+class UserDirectoryTestCase(TestCase):
+    def setUp(self):
+        users = [("foo", "Foo", "Bar", "foo@example.com", "FR"),
+                 ("jane.doe", "Jane", "Doe", "jane@example.org", "DE"),
+                 ("janet", "", "", "janet@example.net", "FR"),
+                 ("bob", "Bob", "Janeway", "bob@example.com", "")]
+        for username, first_name, last_name, email, country in users:
+            user = User.objects.create_user(
+                username=username, password="foobar", email=email,
+                first_name=first_name, last_name=last_name)
+            SystersUser.objects.filter(user=user).update(country=country)
+        self.community = Community.objects.create(
+            name="Foo", slug="foo", order=1,
+            community_admin=SystersUser.objects.get(user__username="foo"))
+
+    def search(self, query, include_email=True):
+        users = SystersUser.objects.search(query, include_email)
+        return [systers_user.user.username
+                for systers_user in users.get_directory()]
+
+    def test_search(self):
+        """Test searching users by name, username, email and country"""
+        self.assertEqual(self.search("jane"), ["bob", "jane.doe", "janet"])
+        self.assertEqual(self.search("JANE doe"), ["jane.doe"])
+        self.assertEqual(self.search("bob@example.com"), ["bob"])
+        self.assertEqual(self.search("janet@"), ["janet"])
+        self.assertEqual(self.search("france"), ["foo", "janet"])
+        self.assertEqual(self.search("fr"), ["foo", "janet"])
+        self.assertEqual(self.search("jan germany"), ["jane.doe"])
+        self.assertEqual(self.search("baz"), [])
+        self.assertEqual(self.search("' & !"), ["bob", "foo", "jane.doe",
+                                                "janet"])
+
+    def test_search_without_email(self):
+        """Test that emails are not matched unless included"""
+        self.assertEqual(self.search("bob@example.com", False), [])
+        self.assertEqual(self.search("example", False), [])
+        self.assertEqual(self.search("janet", False), ["janet"])
+
+    def test_directory_pages(self):
+        """Test keyset pagination of the user directory"""
+        page = SystersUser.objects.get_directory(per_page=3)
+        self.assertEqual([s.user.username for s in page],
+                         ["bob", "foo", "jane.doe"])
+        with self.assertNumQueries(1):
+            page = SystersUser.objects.get_directory(page.next_cursor, 3)
+            self.assertEqual([s.user.username for s in page], ["janet"])
+        self.assertFalse(page.has_next())
+
+    def test_directory_view(self):
+        """Test UserDirectoryView search and community filter"""
+        url = reverse('user_directory')
+        self.assertEqual(self.client.get(url).status_code, 302)
+        self.client.login(username='foo', password='foobar')
+        response = self.client.get(url, {'q': 'jane'})
+        self.assertContains(response, "Jane Doe")
+        self.assertContains(response, "janet")
+        self.assertNotContains(response, '<td>foo</td>')
+        response = self.client.get(url, {'q': 'jane', 'community': 'foo'})
+        self.assertContains(response, "Looks like no user matches")
+        response = self.client.get(url, {'community': 'foo'})
+        self.assertContains(response, '<td>foo</td>')
+        self.assertEqual(self.client.get(url, {'cursor': 'x'}).status_code,
+                         404)
+        response = self.client.get(url,
+                                   {'cursor': encode_cursor(["foo", "x"])})
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(self.client.get(url, {'community': 'x'}).status_code,
+                         404)
+
+    def test_directory_view_email(self):
+        """Test that only staff can search UserDirectoryView by email"""
+        url = reverse('user_directory')
+        self.client.login(username='foo', password='foobar')
+        response = self.client.get(url, {'q': 'bob@example.com'})
+        self.assertContains(response, "Looks like no user matches")
+        User.objects.filter(username='foo').update(is_staff=True)
+        response = self.client.get(url, {'q': 'bob@example.com'})
+        self.assertContains(response, "Bob Janeway")
+
 
 class UserTestCase(TestCase):
     def setUp(self):
@@ -136,3 +332,137 @@ class UserTestCase(TestCase):
         self.user.last_name = "Bar"
         self.user.save()
         self.assertEqual(unicode(self.user), 'Foo Bar')
+
+
+class ImportUsersTestCase(TestCase):
+    def test_bulk_create_users(self):
+        """Test bulk creation of Users with their SystersUsers"""
+        User.objects.create_user(username='jane', email='Jane@example.com')
+        User.objects.create_user(username='john', email='john@example.com')
+        users = [{"email": "jane@example.com"},
+                 {"email": "john@example.org"},
+                 {"email": "john@example.net", "first_name": "John"},
+                 {"email": "JOHN@example.net"},
+                 {"email": "foo@example.com", "username": "jane"}]
+        with CaptureQueriesContext(connection) as context:
+            systers_user_ids, created, skipped = bulk_create_users(users)
+        statements = [query['sql'] for query in context.captured_queries
+                      if 'SAVEPOINT' not in query['sql']]
+        # one more query per round of username clashes
+        self.assertEqual(len(statements), 8)
+        self.assertEqual(created, 3)
+        self.assertEqual(skipped, 0)
+        self.assertEqual(len(systers_user_ids), 4)
+        self.assertEqual(SystersUser.objects.count(), User.objects.count())
+        self.assertItemsEqual(
+            User.objects.values_list('username', flat=True),
+            ["jane", "john", "john2", "john3", "foo"])
+        self.assertFalse(
+            User.objects.get(username="foo").has_usable_password())
+        self.assertEqual(bulk_create_users(users)[1], 0)
+
+    def test_bulk_create_users_invalid_emails(self):
+        """Test users with invalid or too long emails are skipped"""
+        users = [{"email": "{0}@example.com".format("a" * 70)},
+                 {"email": "foo@"},
+                 {"email": "bar@example.com"}]
+        systers_user_ids, created, skipped = bulk_create_users(users)
+        self.assertEqual((len(systers_user_ids), created, skipped), (1, 1, 2))
+        self.assertEqual(User.objects.get().email, "bar@example.com")
+        self.assertEqual(bulk_create_users(users[:2]), ([], 0, 2))
+
+    def test_email_lower_index(self):
+        """Test existing emails are looked up with an index"""
+        cursor = connection.cursor()
+        cursor.execute("SELECT indexdef FROM pg_indexes WHERE indexname = %s",
+                       ["users_user_email_lower"])
+        self.assertIn("lower((email)::text)", cursor.fetchone()[0])
+
+    def test_parse_address_list(self):
+        """Test parsing of mailing list exports"""
+        self.assertEqual(list(parse_address_list([
+            "Jane Doe <jane@example.com>\n", "\n", "john@example.com"])),
+            [{"email": "jane@example.com", "first_name": "Jane",
+              "last_name": "Doe"},
+             {"email": "john@example.com", "first_name": "",
+              "last_name": ""}])
+
+    def test_import_users_command(self):
+        """Test import_users management command"""
+        user = User.objects.create_user(username='foo', password='foobar')
+        community = Community.objects.create(
+            name="Foo", slug="foo", order=1,
+            community_admin=SystersUser.objects.get(user=user))
+        with tempfile.NamedTemporaryFile() as users_file:
+            users_file.write("Jane Doe <jane@example.com>\n"
+                             "john@example.com\nbaz@example.com\n")
+            users_file.flush()
+            stdout = StringIO()
+            call_command('import_users', users_file.name, format='list',
+                         community=['foo'], chunk_size=2, stdout=stdout)
+        self.assertIn("Processed 2 users, created 2, skipped 0",
+                      stdout.getvalue())
+        self.assertIn("Imported 3 users", stdout.getvalue())
+        self.assertEqual(User.objects.get(username="jane").last_name, "Doe")
+        community = Community.objects.get(pk=community.pk)
+        self.assertEqual(community.members.count(), 4)
+        self.assertEqual(community.member_count, 4)
+
+        with tempfile.NamedTemporaryFile() as users_file:
+            users_file.write("email,username\njane@example.com,jane\n"
+                             "bar@example.com,bar\n")
+            users_file.flush()
+            stdout = StringIO()
+            call_command('import_users', users_file.name, stdout=stdout)
+        self.assertIn("Imported 1 users", stdout.getvalue())
+        self.assertTrue(SystersUser.objects.filter(
+            user__username="bar").exists())
+
+
+class ThumbnailsTestCase(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(
+            MEDIA_ROOT=self.media_root, MEDIA_URL="/media/")
+        self.settings_override.enable()
+        User.objects.create_user(username='foo', password='foobar')
+        self.systers_user = SystersUser.objects.get()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root)
+
+    def upload_picture(self, name="foo.png", size=(800, 600), mode="RGBA"):
+        content = BytesIO()
+        Image.new(mode, size, (255, 0, 0)).save(content, 'PNG')
+        self.systers_user.profile_picture.save(
+            name, ContentFile(content.getvalue()))
+        return self.systers_user.profile_picture
+
+    def test_thumbnails_on_upload(self):
+        """Test thumbnails are created next to an uploaded profile picture"""
+        picture = self.upload_picture()
+        self.assertEqual(picture.name, "users/pictures/foo.png")
+        name = get_thumbnail_name(picture.name, "medium")
+        self.assertEqual(name, "users/pictures/foo.200x200.jpg")
+        thumbnail = Image.open(os.path.join(self.media_root, name))
+        self.assertEqual(thumbnail.size, (200, 200))
+        self.assertEqual(thumbnail.format, "JPEG")
+        self.assertTrue(picture.storage.exists(
+            get_thumbnail_name(picture.name, "small")))
+
+    def test_thumbnail_url(self):
+        """Test thumbnail_url filter regenerating missing thumbnails"""
+        self.assertEqual(thumbnail_url(self.systers_user.profile_picture,
+                                       "small"), "")
+        picture = self.upload_picture()
+        name = get_thumbnail_name(picture.name, "small")
+        picture.storage.delete(name)
+        self.assertEqual(thumbnail_url(picture, "small"),
+                         "/media/users/pictures/foo.64x64.jpg")
+        self.assertTrue(picture.storage.exists(name))
+
+        picture.storage.delete(name)
+        picture.storage.delete(picture.name)
+        self.assertEqual(thumbnail_url(picture, "small"),
+                         "/media/users/pictures/foo.png")
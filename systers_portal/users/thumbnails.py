@@ -0,0 +1,70 @@
+import os
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps
+
+
+def get_thumbnail_name(name, size_name):
+    """Get the storage name of a thumbnail, stored next to the original image
+
+    :param name: string storage name of the original image
+    :param size_name: string key of PROFILE_PICTURE_THUMBNAIL_SIZES
+    :return: string storage name of the thumbnail
+    """
+    width, height = settings.PROFILE_PICTURE_THUMBNAIL_SIZES[size_name]
+    root, ext = os.path.splitext(name)
+    return "{0}.{1}x{2}.jpg".format(root, width, height)
+
+
+def create_thumbnail(image_file, size_name):
+    """Resize an image to a thumbnail size, cropping it to fill the size, and
+    re-encode it as JPEG
+
+    :param image_file: FieldFile object of the original image
+    :param size_name: string key of PROFILE_PICTURE_THUMBNAIL_SIZES
+    :return: string storage name of the thumbnail
+    :raises IOError: if the original image can't be read
+    """
+    size = settings.PROFILE_PICTURE_THUMBNAIL_SIZES[size_name]
+    original = image_file.storage.open(image_file.name, 'rb')
+    try:
+        image = Image.open(original)
+        image.load()
+    finally:
+        original.close()
+    if image.mode in ('RGBA', 'LA', 'P'):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.split()[-1])
+        image = background
+    elif image.mode != 'RGB':
+        image = image.convert('RGB')
+    image = ImageOps.fit(image, size, Image.ANTIALIAS)
+    content = BytesIO()
+    image.save(content, 'JPEG', quality=85, optimize=True)
+
+    name = get_thumbnail_name(image_file.name, size_name)
+    storage = image_file.storage
+    if storage.exists(name):
+        storage.delete(name)
+    return storage.save(name, ContentFile(content.getvalue()))
+
+
+def get_thumbnail_url(image_file, size_name):
+    """Get the URL of a thumbnail, creating the thumbnail if it is missing.
+    The URL of the original image is returned if it can't be read.
+
+    :param image_file: FieldFile object of the original image
+    :param size_name: string key of PROFILE_PICTURE_THUMBNAIL_SIZES
+    :return: string URL
+    """
+    name = get_thumbnail_name(image_file.name, size_name)
+    storage = image_file.storage
+    if not storage.exists(name):
+        try:
+            name = create_thumbnail(image_file, size_name)
+        except IOError:
+            return image_file.url
+    return storage.url(name)
@@ -1,8 +1,9 @@
 from django.conf.urls import url
 
-from users.views import UserView
+from users.views import UserDirectoryView, UserView
 
 
 urlpatterns = [
+    url(r'^$', UserDirectoryView.as_view(), name='user_directory'),
     url(r'(?P<username>[\w.@+-]+)/$', UserView.as_view(), name='user'),
 ]
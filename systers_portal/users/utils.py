@@ -0,0 +1,128 @@
+import re
+from email.utils import parseaddr
+from itertools import chain
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.db import transaction
+
+from users.models import SystersUser
+
+
+USERNAME_MAX_LENGTH = User._meta.get_field('username').max_length
+
+EMAIL_FIELD = User._meta.get_field('email')
+
+
+def parse_address_list(lines):
+    """Parse subscribers from lines of a mailing list export such as
+    "Jane Doe <jane@example.com>" or "jane@example.com"
+
+    :param lines: iterable of strings
+    :return: generator of dicts with email, first_name and last_name keys
+    """
+    for line in lines:
+        name, email = parseaddr(line.strip())
+        if "@" not in email:
+            continue
+        first_name, _, last_name = name.strip().partition(" ")
+        yield {"email": email, "first_name": first_name,
+               "last_name": last_name.strip()}
+
+
+def get_username_candidates(email):
+    """Derive usernames from the local part of an email address
+
+    :param email: string email address
+    :return: generator of string usernames, the first one without suffix
+    """
+    base = re.sub(r"[^\w.+-]", "", email.split("@")[0]) or "user"
+    yield base[:USERNAME_MAX_LENGTH]
+    suffix = 1
+    while True:
+        suffix += 1
+        suffix_str = str(suffix)
+        yield base[:USERNAME_MAX_LENGTH - len(suffix_str)] + suffix_str
+
+
+def is_valid_email(email):
+    """Check if an email address can be stored in a User
+
+    :param email: string email address
+    :return: True if the address is valid and short enough, False otherwise
+    """
+    try:
+        EMAIL_FIELD.run_validators(email)
+    except ValidationError:
+        return False
+    return True
+
+
+@transaction.atomic
+def bulk_create_users(users):
+    """Create Users along with their SystersUsers, with a fixed number of
+    INSERTs. Users whose email address is already taken are not created,
+    users with an invalid or too long email address are skipped.
+
+    Since bulk_create bypasses post_save signals, create_systers_user doesn't
+    run and SystersUser rows are created here.
+
+    :param users: list of dicts with email key and optional username,
+                  first_name and last_name keys
+    :return: tuple (list of SystersUser ids of all the users, including the
+             existing ones, number of created users, number of skipped users)
+    """
+    users_by_email = {}
+    skipped = 0
+    for user in users:
+        if is_valid_email(user["email"]):
+            users_by_email.setdefault(user["email"].lower(), user)
+        else:
+            skipped += 1
+    if not users_by_email:
+        return [], 0, skipped
+    existing = dict(
+        (email.lower(), pk) for email, pk in User.objects.extra(
+            where=["LOWER(email) IN %s"], params=[tuple(users_by_email)]
+        ).values_list('email', 'pk'))
+    new_users = [user for email, user in users_by_email.items()
+                 if email not in existing]
+
+    # pick the first candidate username of every user which is neither
+    # taken nor chosen for another user, with a query per round of clashes
+    candidates = dict(
+        (id(user), chain([user["username"]] if user.get("username") else [],
+                         get_username_candidates(user["email"])))
+        for user in new_users)
+    usernames = {}
+    chosen = set()
+    pending = new_users
+    while pending:
+        for user in pending:
+            usernames[id(user)] = next(candidates[id(user)])
+        taken = set(User.objects.filter(
+            username__in=[usernames[id(user)] for user in pending]
+        ).values_list('username', flat=True))
+        retry = []
+        for user in pending:
+            username = usernames[id(user)]
+            if username in taken or username in chosen:
+                retry.append(user)
+            else:
+                chosen.add(username)
+        pending = retry
+
+    User.objects.bulk_create([
+        User(username=usernames[id(user)], email=user["email"],
+             first_name=user.get("first_name", "")[:30],
+             last_name=user.get("last_name", "")[:30],
+             password=make_password(None))
+        for user in new_users])
+    created_ids = list(User.objects.filter(
+        username__in=chosen).values_list('pk', flat=True))
+    SystersUser.objects.bulk_create([SystersUser(user_id=user_id)
+                                     for user_id in created_ids])
+    return list(SystersUser.objects.filter(
+        user__in=created_ids + existing.values()).values_list(
+        'pk', flat=True)), len(created_ids), skipped
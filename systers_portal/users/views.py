@@ -1,8 +1,11 @@
+from django.conf import settings
+from django.http import Http404
 from django.views.generic import TemplateView
 from django.shortcuts import get_object_or_404
 from braces.views import LoginRequiredMixin
 
-from community.models import JoinRequest
+from community.models import Community, JoinRequest
+from users.cache import get_profile_version, get_viewer_class
 from users.models import SystersUser
 
 
@@ -13,15 +16,55 @@ class UserView(LoginRequiredMixin, TemplateView):
     def get_context_data(self, **kwargs):
         context = super(UserView, self).get_context_data(**kwargs)
         username = context['username']
-        systersuser = get_object_or_404(SystersUser, user__username=username)
+        systersuser = get_object_or_404(SystersUser.objects.select_related(
+            'user'), user__username=username)
         communities = systersuser.communities.all()
-        join_requests = JoinRequest.objects.filter(user=systersuser,
-                                                   is_approved=False)
+        join_requests = JoinRequest.objects.pending().filter(
+            user=systersuser).select_related('community')
         permission_groups = systersuser.user.groups.all()
         context_dict = {'systersuser': systersuser,
                         'communities': communities,
                         'join_requests': join_requests,
-                        'permission_groups': permission_groups}
+                        'permission_groups': permission_groups,
+                        'viewer_class': get_viewer_class(self.request.user,
+                                                         systersuser),
+                        'profile_version': get_profile_version(
+                            systersuser.pk),
+                        'profile_cache_timeout':
+                            settings.USER_PROFILE_CACHE_TIMEOUT}
+        for key, value in context_dict.iteritems():
+            context[key] = value
+        return context
+
+
+class UserDirectoryView(LoginRequiredMixin, TemplateView):
+    """Directory of users, searchable by name, username and country, and by
+    email for staff, and filterable by community"""
+    template_name = "users/directory.html"
+    paginate_by = 20
+
+    def get_context_data(self, **kwargs):
+        context = super(UserDirectoryView, self).get_context_data(**kwargs)
+        query = self.request.GET.get('q', '').strip()
+        community_slug = self.request.GET.get('community', '')
+        systers_users = SystersUser.objects.all()
+        if query:
+            systers_users = systers_users.search(
+                query, include_email=self.request.user.is_staff)
+        community = None
+        if community_slug:
+            community = get_object_or_404(Community, slug=community_slug)
+            systers_users = systers_users.filter(communities=community)
+        try:
+            page = systers_users.get_directory(
+                self.request.GET.get('cursor'), self.paginate_by)
+        except ValueError:
+            raise Http404
+        context_dict = {'page': page,
+                        'query': query,
+                        'community': community,
+                        'communities': Community.objects.only(
+                            'name', 'slug').order_by('name')}
         for key, value in context_dict.iteritems():
             context[key] = value
         return context